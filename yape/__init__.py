@@ -1,3 +1,11 @@
 from .parsepbuttons import parsepbuttons
 from .main import yape2, parse_args
-from .plotpbuttons import mgstat
+
+
+def __getattr__(name):
+    # plotting pulls in pandas and matplotlib, only load it when it's asked for
+    if name == "mgstat":
+        from .plotpbuttons import mgstat
+
+        return mgstat
+    raise AttributeError("module 'yape' has no attribute " + repr(name))
@@ -0,0 +1,127 @@
+import logging
+
+import pandas as pd
+
+from yape.devices import want_device
+from yape.sections import TIMESERIES, load_section, numeric, split_column, table_exists
+
+# The "wide" table: one row per timestamp of the base section (mgstat), with the closest
+# sample of every other section joined in as-of within a tolerance. Sections split by
+# device or cpu get one column per device, named <section>.<device>.<column>.
+
+WIDE = "wide"
+WIDE_META = "wide_meta"
+# sqlite refuses tables with more columns than this (SQLITE_MAX_COLUMN)
+MAX_COLUMNS = 2000
+
+
+def section_frame(db, config, name, split_on):
+    ''' Returns the numeric columns of a section, per device pivoted into columns '''
+    data = load_section(db, name, split_on)
+    if data is None:
+        return None
+    if split_on is None:
+        values = numeric(data)
+        values.columns = [name + "." + c for c in values.columns.values]
+    else:
+        split_on = split_column(data, split_on)
+        data = data[[want_device(config, name, d) for d in data[split_on]]]
+        values = numeric(data, skip=(split_on,))
+        columns = list(values.columns.values)
+        values[split_on] = data[split_on].astype(str)
+        values = values.reset_index().pivot_table(
+            index="datetime", columns=split_on, aggfunc="mean"
+        )
+        # device by device, columns in the order of the section
+        order = [
+            (c, d)
+            for d in sorted(set(values.columns.get_level_values(1)))
+            for c in columns
+            if (c, d) in values.columns
+        ]
+        values = values[order]
+        values.columns = [name + "." + d + "." + c for c, d in order]
+    values = values[~values.index.duplicated(keep="first")]
+    return values.sort_index()
+
+
+def wide_frame(db, config, tolerance=2, base="mgstat"):
+    ''' Returns all time series sections aligned to the timestamps of the base section '''
+    frames = {}
+    for name, split_on in TIMESERIES.items():
+        frame = section_frame(db, config, name, split_on)
+        if frame is not None and frame.shape[0] > 0:
+            frames[name] = frame
+    if len(frames) == 0:
+        return None
+    if base not in frames:
+        base = list(frames)[0]
+    wide = frames.pop(base)
+    wide.index.name = "datetime"
+    for name, frame in frames.items():
+        wide = pd.merge_asof(
+            wide,
+            frame,
+            left_index=True,
+            right_index=True,
+            direction="nearest",
+            tolerance=pd.Timedelta(seconds=tolerance),
+        )
+    timeframe = config.get("timeframe")
+    if timeframe is not None:
+        start, end = timeframe.split(",")
+        wide = wide[(wide.index >= start) & (wide.index <= end)]
+    return wide
+
+
+def signature(db):
+    # cheap fingerprint of the sources, the wide table is rebuilt when it changes
+    parts = []
+    for name in TIMESERIES:
+        if table_exists(db, name):
+            parts.append(
+                name + ":" + str(db.execute('SELECT max(rowid) FROM "' + name + '"').fetchone()[0])
+            )
+    return ",".join(parts)
+
+
+def build_wide(db, config, tolerance=2):
+    ''' Materialises the wide table in the database, unless it's already there for the same data '''
+    filters = [config.get("devicefilter")]
+    key = ";".join(
+        [
+            signature(db),
+            "tolerance=" + str(tolerance),
+            str(config.get("timeframe")),
+            str([f.pattern for f in filters if f is not None]),
+            str(sorted((s, sorted(d)) for s, d in config.get("topdevices", {}).items())),
+        ]
+    )
+    db.execute('CREATE TABLE IF NOT EXISTS "' + WIDE_META + '" (key TEXT)')
+    cached = db.execute('SELECT key FROM "' + WIDE_META + '"').fetchone()
+    if cached is not None and cached[0] == key and table_exists(db, WIDE):
+        logging.info("wide table is up to date")
+        return None
+    wide = wide_frame(db, config, tolerance)
+    if wide is None:
+        logging.warning("no time series to align")
+        return None
+    if wide.shape[1] + 1 > MAX_COLUMNS:
+        logging.warning(
+            "wide table has "
+            + str(wide.shape[1])
+            + " columns, keeping the first "
+            + str(MAX_COLUMNS - 1)
+            + ", use --devices or --top-devices to choose"
+        )
+        wide = wide.iloc[:, : MAX_COLUMNS - 1]
+    logging.info(
+        "creating wide table, " + str(wide.shape[0]) + " rows, " + str(wide.shape[1]) + " columns"
+    )
+    wide = wide.reset_index()
+    wide["datetime"] = wide["datetime"].dt.strftime("%Y-%m-%d %H:%M:%S")
+    wide.to_sql(WIDE, db, if_exists="replace", index=False)
+    db.execute('DELETE FROM "' + WIDE_META + '"')
+    db.execute('INSERT INTO "' + WIDE_META + '" VALUES (?)', [key])
+    db.commit()
+    return None
@@ -0,0 +1,140 @@
+import logging
+
+import numpy
+
+from yape.derived import total_tables
+from yape.devices import want_device
+from yape.sections import TIMESERIES, load_section, numeric, split_column
+
+# Spikes and dips against a rolling baseline: the rolling median of a column and the
+# rolling median absolute deviation (MAD) around it. Samples further than threshold
+# robust standard deviations away are anomalous, neighbouring ones form a window.
+# All columns of a section (or device) are scored at once, the cost is linear in rows.
+
+ANOMALIES = "anomalies"
+DEFAULT_WINDOW = 60
+DEFAULT_THRESHOLD = 6
+# flagged samples at most this many samples apart belong to the same window
+GAP = 2
+
+
+def scores(values, window=DEFAULT_WINDOW):
+    ''' Returns the robust z-score of every sample and the rolling median of a DataFrame of floats '''
+    # short captures still get a baseline
+    periods = max(3, min(window, values.shape[0]) // 4)
+    median = values.rolling(window, center=True, min_periods=periods).median()
+    deviation = (values - median).abs()
+    scale = 1.4826 * deviation.rolling(window, center=True, min_periods=periods).median()
+    # a flat baseline would turn every little wiggle into an anomaly,
+    # don't go below a tenth of the overall spread of the column
+    scale = scale.clip(lower=0.1 * values.std(), axis=1)
+    return deviation / scale, median
+
+
+def windows(values, score, median, threshold=DEFAULT_THRESHOLD):
+    ''' Returns (column, start, end, samples, peak, baseline, severity) for the anomalous windows '''
+    z = score.to_numpy(dtype="float64")
+    flags = z >= threshold
+    found = []
+    for j in numpy.flatnonzero(flags.any(axis=0)):
+        rows = numpy.flatnonzero(flags[:, j])
+        breaks = numpy.flatnonzero(numpy.diff(rows) > GAP + 1)
+        for first, last in zip(numpy.r_[0, breaks + 1], numpy.r_[breaks, len(rows) - 1]):
+            window = rows[first : last + 1]
+            worst = window[numpy.argmax(z[window, j])]
+            found.append(
+                (
+                    str(values.columns[j]),
+                    values.index[window[0]],
+                    values.index[window[-1]],
+                    len(window),
+                    float(values.iat[worst, j]),
+                    float(median.iat[worst, j]),
+                    float(z[worst, j]),
+                )
+            )
+    return found
+
+
+def section_anomalies(db, config, name, split_on=None, window=DEFAULT_WINDOW, threshold=DEFAULT_THRESHOLD):
+    ''' Returns [(section, device, column, start, end, samples, peak, baseline, severity)] of a section '''
+    data = load_section(db, name, split_on)
+    if data is None:
+        return []
+    timeframe = config.get("timeframe")
+    if timeframe is not None:
+        start, end = timeframe.split(",")
+        data = data[(data.index >= start) & (data.index <= end)]
+    if split_on is None:
+        groups = [("", data)]
+    else:
+        split_on = split_column(data, split_on)
+        groups = [
+            (str(device), frame.drop([split_on], axis=1))
+            for device, frame in data.groupby(split_on, sort=True)
+            if want_device(config, name, device)
+        ]
+    found = []
+    for device, frame in groups:
+        values = numeric(frame)
+        values = values[~values.index.duplicated(keep="first")].sort_index()
+        if values.shape[0] < 3 or values.shape[1] == 0:
+            continue
+        score, median = scores(values, window)
+        found.extend((name, device) + w for w in windows(values, score, median, threshold))
+    return found
+
+
+def find_anomalies(db, config, window=DEFAULT_WINDOW, threshold=DEFAULT_THRESHOLD):
+    ''' Returns the anomalous windows of all time series, the most severe first '''
+    sections = dict(TIMESERIES)
+    sections.update({table: None for table in total_tables(db)})
+    found = []
+    for name, split_on in sections.items():
+        found.extend(section_anomalies(db, config, name, split_on, window, threshold))
+    found.sort(key=lambda a: a[-1], reverse=True)
+    return found
+
+
+def store_anomalies(db, found) -> None:
+    ''' Replaces the anomalies table with found '''
+    db.execute('DROP TABLE IF EXISTS "' + ANOMALIES + '"')
+    db.execute(
+        'CREATE TABLE "'
+        + ANOMALIES
+        + '" (section TEXT, device TEXT, "column" TEXT, start TEXT, "end" TEXT, samples INTEGER, peak REAL, baseline REAL, severity REAL)'
+    )
+    db.executemany(
+        'INSERT INTO "' + ANOMALIES + '" VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        [
+            a[:3] + (a[3].strftime("%Y-%m-%d %H:%M:%S"), a[4].strftime("%Y-%m-%d %H:%M:%S")) + a[5:]
+            for a in found
+        ],
+    )
+    db.commit()
+
+
+def anomaly_marks(found):
+    ''' Returns {(section, device, column): [(start, end)]} to mark the windows on the plots '''
+    marks = {}
+    for a in found:
+        marks.setdefault(a[:3], []).append((a[3], a[4]))
+    return marks
+
+
+def anomaly_spans(config, section, device, column):
+    return sorted(config.get("anomalies", {}).get((section, str(device), str(column)), []))
+
+
+def detect_anomalies(db, config, window=DEFAULT_WINDOW, threshold=DEFAULT_THRESHOLD, top=10) -> None:
+    ''' Stores the anomalies table, logs the worst ones and remembers them for the plots '''
+    found = find_anomalies(db, config, window, threshold)
+    store_anomalies(db, found)
+    config["anomalies"] = anomaly_marks(found)
+    logging.info(str(len(found)) + " anomalous windows")
+    for a in found[:top]:
+        logging.info(
+            "{} {} {}: {} - {}, {:g} vs. baseline {:g} (severity {:.1f})".format(
+                a[0], a[1] or "-", a[2], a[3], a[4], a[6], a[7], a[8]
+            )
+        )
@@ -0,0 +1,152 @@
+import hashlib
+import json
+import logging
+from datetime import datetime
+from pathlib import Path
+
+from yape.version import getVersion
+
+# One row per parsed section, written when parsing is done: row count, columns with
+# their types, first and last timestamp, sample interval, devices, OS, source file and
+# yape version. Consumers look here instead of probing sqlite_master or scanning tables.
+
+CATALOG = "catalog"
+
+# sections holding time series and the column they are split on, per device or cpu
+TIMESERIES = {
+    "mgstat": None,
+    "vmstat": None,
+    "perfmon": None,
+    "sar-u": "cpu",
+    "iostat": "Device",
+    "sard": "device",
+    "monitor_disk": "device",
+}
+
+
+def file_sha256(file: Path):
+    h = hashlib.sha256()
+    with open(file, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def section_columns(db, section):
+    ''' Returns [[name, type]] of the columns of a table '''
+    return [[r[1], r[2]] for r in db.execute('PRAGMA table_info("' + section + '")').fetchall()]
+
+
+def section_entry(db, section):
+    ''' Returns the catalog fields of a section that come from the table itself '''
+    columns = section_columns(db, section)
+    names = [c[0] for c in columns]
+    rows = db.execute('SELECT count(*) FROM "' + section + '"').fetchone()[0]
+    start = end = None
+    if "datetime" in names and rows > 0:
+        # sections are parsed in time order
+        start = db.execute('SELECT datetime FROM "' + section + '" ORDER BY rowid LIMIT 1').fetchone()[0]
+        end = db.execute('SELECT datetime FROM "' + section + '" ORDER BY rowid DESC LIMIT 1').fetchone()[0]
+    devices = None
+    split_on = TIMESERIES.get(section)
+    for name in names:
+        if split_on is not None and name.lower() == split_on.lower():
+            cur = db.execute(
+                'SELECT "' + name + '" FROM "' + section + '" GROUP BY "' + name + '" ORDER BY min(rowid)'
+            )
+            devices = [str(r[0]) for r in cur.fetchall()]
+    return {"rows": rows, "columns": columns, "start": start, "end": end, "devices": devices}
+
+
+def write_catalog(db, sections, osmode="", source=None) -> None:
+    ''' (Re)writes the catalog rows of the given sections '''
+    db.execute(
+        'CREATE TABLE IF NOT EXISTS "'
+        + CATALOG
+        + '" (section TEXT PRIMARY KEY, rows INTEGER, columns TEXT, start TEXT, "end" TEXT, interval REAL, devices TEXT, osmode TEXT, source TEXT, sha256 TEXT, version TEXT, parsed TEXT)'
+    )
+    digest = file_sha256(source) if source is not None else None
+    version = getVersion()
+    parsed = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    for section in sections:
+        entry = section_entry(db, section)
+        db.execute(
+            'INSERT OR REPLACE INTO "' + CATALOG + '" VALUES (?, ?, ?, ?, ?, NULL, ?, ?, ?, ?, ?, ?)',
+            [
+                section,
+                entry["rows"],
+                json.dumps(entry["columns"]),
+                entry["start"],
+                entry["end"],
+                None if entry["devices"] is None else json.dumps(entry["devices"]),
+                osmode,
+                None if source is None else str(source),
+                digest,
+                version,
+                parsed,
+            ],
+        )
+    db.commit()
+    logging.debug("catalog: " + str(list(sections)))
+
+
+def update_catalog(db, section, **fields) -> None:
+    ''' Sets fields (start, end, interval, columns) of a section, if it is in the catalog '''
+    if read_catalog(db) is None or len(fields) == 0:
+        return None
+    values = [json.dumps(v) if k == "columns" else v for k, v in fields.items()]
+    db.execute(
+        'UPDATE "'
+        + CATALOG
+        + '" SET '
+        + ", ".join('"' + k + '" = ?' for k in fields)
+        + " WHERE section = ?",
+        values + [section],
+    )
+    return None
+
+
+def refresh_columns(db, section) -> None:
+    ''' Updates the column list of a section after columns were added '''
+    update_catalog(db, section, columns=section_columns(db, section))
+
+
+def read_catalog(db):
+    ''' Returns {section: {field: value}}, or None for databases without a catalog '''
+    cur = db.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", [CATALOG])
+    if cur.fetchone() is None:
+        return None
+    cur = db.execute('SELECT * FROM "' + CATALOG + '"')
+    fields = [d[0] for d in cur.description]
+    catalog = {}
+    for row in cur.fetchall():
+        entry = dict(zip(fields, row))
+        for k in ["columns", "devices"]:
+            if entry[k] is not None:
+                entry[k] = json.loads(entry[k])
+        catalog[entry.pop("section")] = entry
+    return catalog
+
+
+def has_timestamps(db, section):
+    ''' False if the datetime column of section is missing or holds dates only '''
+    columns = [c[0] for c in section_columns(db, section)]
+    if "datetime" not in columns:
+        return False
+    first = db.execute('SELECT datetime FROM "' + section + '" LIMIT 1').fetchone()
+    return first is None or len(str(first[0]).split()) > 1
+
+
+def untimed_sections(db):
+    ''' Returns the time series sections in db without (complete) timestamps '''
+    tables = [r[0] for r in db.execute("SELECT name FROM sqlite_master WHERE type='table'").fetchall()]
+    return [name for name in TIMESERIES if name in tables and not has_timestamps(db, name)]
+
+
+def has_section(db, name):
+    ''' True if the section has rows according to the catalog, or, if it isn't in there, the table exists '''
+    catalog = read_catalog(db)
+    if catalog is not None and name in catalog:
+        return catalog[name]["rows"] > 0
+    cur = db.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", [name])
+    return cur.fetchone() is not None
@@ -1,8 +1,14 @@
+import sys
+
 import yape
 import cProfile
 
 
 def main():
+    if sys.argv[1:2] == ["search"]:
+        from yape.textindex import search_main
+
+        sys.exit(search_main(sys.argv[2:]))
     yape.yape2()
 
 
@@ -0,0 +1,227 @@
+import logging
+import warnings
+
+import numpy
+import pandas as pd
+
+from yape.devices import want_device
+from yape.sections import TIMESERIES, load_section, numeric, split_column
+
+# Baseline vs. incident: the same column of two captures is compared by its distribution,
+# over the part of the captures that overlaps once they are aligned, either by the time
+# since the start of each capture (relative) or by the time of day (timeofday).
+# A column has shifted when the two sample Kolmogorov-Smirnov distance is significant
+# and the mean or median moved by at least MIN_CHANGE.
+
+COMPARE = "compare"
+ALIGNMENTS = ["relative", "timeofday"]
+# KS critical value coefficient for alpha = 0.001
+KS_C = 1.95
+MIN_CHANGE = 0.1
+COLUMNS = [
+    "section",
+    "device",
+    "column",
+    "baseline_mean",
+    "mean",
+    "baseline_p50",
+    "p50",
+    "baseline_p95",
+    "p95",
+    "change",
+    "ks",
+    "significant",
+]
+
+
+def offsets(index, align="relative"):
+    ''' Returns the seconds of a DatetimeIndex since the start of the capture or since midnight '''
+    if align == "timeofday":
+        return numpy.asarray(index.hour * 3600 + index.minute * 60 + index.second, dtype="float64")
+    return numpy.asarray((index - index[0]).total_seconds(), dtype="float64")
+
+
+def section_series(db, config, name, split_on=None):
+    ''' Returns {device: DataFrame of floats} of a section, device is "" if it isn't split '''
+    data = load_section(db, name, split_on)
+    if data is None:
+        return {}
+    if split_on is None:
+        groups = {"": numeric(data)}
+    else:
+        split_on = split_column(data, split_on)
+        groups = {
+            str(device): numeric(frame, skip=(split_on,))
+            for device, frame in data.groupby(split_on, sort=True)
+            if want_device(config, name, device)
+        }
+    return {
+        device: values[~values.index.duplicated(keep="first")].sort_index()
+        for device, values in groups.items()
+        if values.shape[0] > 0 and values.shape[1] > 0
+    }
+
+
+def window(values, align, start, end):
+    x = offsets(values.index, align)
+    return values[(x >= start) & (x <= end)]
+
+
+def common_window(baseline, current, align):
+    ''' Returns the (start, end) offsets both captures have data for, None if they don't overlap '''
+    a = offsets(baseline.index, align)
+    b = offsets(current.index, align)
+    start = max(a.min(), b.min())
+    end = min(a.max(), b.max())
+    if end <= start:
+        return None
+    return start, end
+
+
+def ks_distance(a, b):
+    ''' Returns the two sample Kolmogorov-Smirnov distance of two arrays without nan '''
+    a = numpy.sort(a)
+    b = numpy.sort(b)
+    points = numpy.concatenate([a, b])
+    cdf_a = numpy.searchsorted(a, points, side="right") / len(a)
+    cdf_b = numpy.searchsorted(b, points, side="right") / len(b)
+    return float(numpy.abs(cdf_a - cdf_b).max())
+
+
+def relative_change(before, after):
+    if before == 0:
+        return 0.0 if after == 0 else None
+    return (after - before) / abs(before)
+
+
+def compare_frames(baseline, current):
+    ''' Returns one row per common column: means, p50, p95, relative change, ks distance, significant '''
+    columns = [c for c in current.columns.values if c in baseline.columns.values]
+    if len(columns) == 0:
+        return []
+    a = baseline[columns].to_numpy(dtype="float64")
+    b = current[columns].to_numpy(dtype="float64")
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        means = numpy.nanmean(a, axis=0), numpy.nanmean(b, axis=0)
+        p50 = numpy.nanpercentile(a, 50, axis=0), numpy.nanpercentile(b, 50, axis=0)
+        p95 = numpy.nanpercentile(a, 95, axis=0), numpy.nanpercentile(b, 95, axis=0)
+    rows = []
+    for i, column in enumerate(columns):
+        x = a[:, i][~numpy.isnan(a[:, i])]
+        y = b[:, i][~numpy.isnan(b[:, i])]
+        if len(x) == 0 or len(y) == 0:
+            continue
+        ks = ks_distance(x, y)
+        critical = KS_C * numpy.sqrt((len(x) + len(y)) / (len(x) * len(y)))
+        change = relative_change(means[0][i], means[1][i])
+        median_change = relative_change(p50[0][i], p50[1][i])
+        moved = any(c is None or abs(c) >= MIN_CHANGE for c in [change, median_change])
+        rows.append(
+            [
+                str(column),
+                float(means[0][i]),
+                float(means[1][i]),
+                float(p50[0][i]),
+                float(p50[1][i]),
+                float(p95[0][i]),
+                float(p95[1][i]),
+                change,
+                ks,
+                bool(ks > critical and moved),
+            ]
+        )
+    return rows
+
+
+def compare(db, basedb, config, align="relative"):
+    ''' Returns the comparison of all common columns, the biggest ks distance first,
+    and {(section, device): (baseline, current)} of the aligned data '''
+    rows = []
+    frames = {}
+    for name, split_on in TIMESERIES.items():
+        baseline = section_series(basedb, config, name, split_on)
+        current = section_series(db, config, name, split_on)
+        for device in current:
+            if device not in baseline:
+                continue
+            span = common_window(baseline[device], current[device], align)
+            if span is None:
+                logging.warning("no overlap for " + name + " " + device + " aligned by " + align)
+                continue
+            before = window(baseline[device], align, *span)
+            after = window(current[device], align, *span)
+            frames[(name, device)] = (before, after)
+            rows.extend([name, device] + r for r in compare_frames(before, after))
+    rows.sort(key=lambda r: r[-2], reverse=True)
+    return rows, frames
+
+
+def store_compare(db, rows) -> None:
+    ''' Replaces the compare table with rows '''
+    db.execute('DROP TABLE IF EXISTS "' + COMPARE + '"')
+    db.execute(
+        'CREATE TABLE "' + COMPARE + '" (' + ", ".join('"' + c + '"' for c in COLUMNS) + ")"
+    )
+    db.executemany(
+        'INSERT INTO "' + COMPARE + '" VALUES (' + ", ".join(["?"] * len(COLUMNS)) + ")", rows
+    )
+    db.commit()
+
+
+def number(value):
+    if value is None:
+        return "new"
+    if abs(value) >= 1000:
+        return "{:,.0f}".format(value)
+    return "{:.2f}".format(value)
+
+
+def to_markdown(rows, align):
+    ''' Returns the significant shifts as a markdown table '''
+    lines = [
+        "## Shifted metrics (aligned by " + align + ")",
+        "",
+        "| section | device | column | baseline mean | mean | baseline p95 | p95 | change | ks |",
+        "|---|---|---|---:|---:|---:|---:|---:|---:|",
+    ]
+    for r in rows:
+        if not r[-1]:
+            continue
+        change = "new" if r[9] is None else "{:+.0%}".format(r[9])
+        cells = r[:3] + [number(v) for v in [r[3], r[4], r[7], r[8]]] + [change, "{:.2f}".format(r[10])]
+        lines.append("| " + " | ".join(c.replace("|", "\\|") for c in cells) + " |")
+    return "\n".join(lines) + "\n"
+
+
+def write_compare(db, basedb, config, align="relative", plot=True) -> None:
+    ''' Compares db against the baseline, stores the compare table, writes compare.md
+    and an overlay plot of every column that shifted '''
+    rows, frames = compare(db, basedb, config, align)
+    store_compare(db, rows)
+    shifted = [r for r in rows if r[-1]]
+    logging.info(str(len(shifted)) + " of " + str(len(rows)) + " columns shifted")
+    basefilename = config["basefilename"]
+    basefilename.mkdir(parents=True, exist_ok=True)
+    file = basefilename / (config["fileprefix"] + "compare.md")
+    logging.info("creating " + str(file))
+    with open(file, "w", encoding="utf-8") as f:
+        f.write(to_markdown(rows, align))
+    if not plot or len(shifted) == 0:
+        return None
+    # only now, comparing without plots doesn't need matplotlib
+    from yape.plotpbuttons import overlayplot, plotfile
+
+    for r in shifted:
+        before, after = frames[(r[0], r[1])]
+        parts = ["compare", r[0]] + ([r[1]] if r[1] != "" else []) + [r[2]]
+        overlayplot(
+            pd.Series(before[r[2]].values, index=offsets(before.index, align) / 3600),
+            pd.Series(after[r[2]].values, index=offsets(after.index, align) / 3600),
+            r[2],
+            " ".join(parts[1:]),
+            plotfile(config, *parts),
+            config,
+            align,
+        )
+    return None
@@ -0,0 +1,165 @@
+import logging
+import re
+
+# The cstat -D (8 snapshots) and cstat -c1 (4 snapshots) sections are kept as text lines
+# by the parser. Every "name = value" or "name: value" of a snapshot becomes a row of the
+# cstat_counters table, named after the heading it is under, so the same counter has the
+# same name in every snapshot. Deltas between consecutive snapshots are one matrix
+# difference over all counters.
+
+COUNTERS = "cstat_counters"
+DELTAS = "cstat_deltas"
+# kind -> its sections, in snapshot order
+SNAPSHOTS = {
+    "D": ["cstatD" + str(i) for i in range(1, 9)],
+    "c1": ["cstatc1" + str(i) for i in range(1, 5)],
+}
+DEFAULT_TOP = 10
+PAIR = re.compile(r"([A-Za-z][\w .#/()%&'-]*?)\s*(?:=|:)\s*(-?\d[\d,]*(?:\.\d+)?)(?=[\s,;)]|$)")
+HEADING = re.compile(r"^\s*([A-Za-z][^=:]*?)\s*:?\s*$")
+DELTA_COLUMNS = ["kind", "first", "second", "counter", "before", "after", "delta", "change"]
+
+
+def counters(lines):
+    ''' Returns [(counter, value)] of the name = value pairs of one snapshot, in order '''
+    result = []
+    seen = {}
+    heading = ""
+    for line in lines:
+        line = line.replace("<pre>", "").replace("</pre>", "").rstrip("\n")
+        pairs = PAIR.findall(line)
+        if len(pairs) == 0:
+            match = HEADING.match(line)
+            if match is not None and len(match.group(1)) < 80:
+                heading = match.group(1).strip()
+            continue
+        for name, value in pairs:
+            name = " ".join(name.split())
+            counter = heading + " / " + name if heading != "" else name
+            # repeated names (eg. one per database) are told apart by their position
+            seen[counter] = seen.get(counter, 0) + 1
+            if seen[counter] > 1:
+                counter += " #" + str(seen[counter])
+            result.append((counter, float(value.replace(",", ""))))
+    return result
+
+
+def build_counters(db) -> int:
+    ''' (Re)creates the cstat_counters table from the cstat sections, returns its number of rows '''
+    rows = []
+    for kind, sections in SNAPSHOTS.items():
+        for snapshot, section in enumerate(sections, 1):
+            cur = db.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", [section])
+            if cur.fetchone() is None:
+                continue
+            lines = [r[0] for r in db.execute('SELECT line FROM "' + section + '" ORDER BY rowid')]
+            rows.extend((kind, snapshot, c, v) for c, v in counters(lines))
+    db.execute('DROP TABLE IF EXISTS "' + COUNTERS + '"')
+    if len(rows) == 0:
+        return 0
+    db.execute('CREATE TABLE "' + COUNTERS + '" (kind TEXT, snapshot INTEGER, counter TEXT, value REAL)')
+    db.executemany('INSERT INTO "' + COUNTERS + '" VALUES (?, ?, ?, ?)', rows)
+    db.execute('CREATE INDEX "' + COUNTERS + '_counter" ON "' + COUNTERS + '" (kind, counter, snapshot)')
+    db.commit()
+    logging.debug(str(len(rows)) + " cstat counters")
+    return len(rows)
+
+
+def has_counters(db):
+    cur = db.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", [COUNTERS])
+    return cur.fetchone() is not None
+
+
+def counter_deltas(db):
+    ''' Returns the change of every counter between consecutive snapshots, see DELTA_COLUMNS,
+    the biggest absolute delta of every interval first '''
+    import numpy
+
+    rows = []
+    for kind in SNAPSHOTS:
+        data = db.execute(
+            'SELECT counter, snapshot, value FROM "' + COUNTERS + '" WHERE kind = ?', [kind]
+        ).fetchall()
+        if len(data) == 0:
+            continue
+        names, row = numpy.unique([d[0] for d in data], return_inverse=True)
+        snapshots, column = numpy.unique([d[1] for d in data], return_inverse=True)
+        if len(snapshots) < 2:
+            continue
+        # counters x snapshots, nan where a counter is missing from a snapshot
+        values = numpy.full((len(names), len(snapshots)), numpy.nan)
+        values[row, column] = [d[2] for d in data]
+        delta = numpy.diff(values, axis=1)
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            change = delta / numpy.abs(values[:, :-1])
+        for i in range(len(snapshots) - 1):
+            moved = numpy.flatnonzero(~numpy.isnan(delta[:, i]) & (delta[:, i] != 0))
+            moved = moved[numpy.argsort(-numpy.abs(delta[moved, i]), kind="stable")]
+            for j in moved:
+                rows.append(
+                    [
+                        kind,
+                        int(snapshots[i]),
+                        int(snapshots[i + 1]),
+                        str(names[j]),
+                        float(values[j, i]),
+                        float(values[j, i + 1]),
+                        float(delta[j, i]),
+                        None if not numpy.isfinite(change[j, i]) else float(change[j, i]),
+                    ]
+                )
+    return rows
+
+
+def store_deltas(db, rows) -> None:
+    ''' Replaces the cstat_deltas table with rows '''
+    db.execute('DROP TABLE IF EXISTS "' + DELTAS + '"')
+    db.execute('CREATE TABLE "' + DELTAS + '" (' + ", ".join('"' + c + '"' for c in DELTA_COLUMNS) + ")")
+    db.executemany(
+        'INSERT INTO "' + DELTAS + '" VALUES (' + ", ".join(["?"] * len(DELTA_COLUMNS)) + ")", rows
+    )
+    db.commit()
+
+
+def number(value):
+    if value is None:
+        return ""
+    if abs(value) >= 1000 or value == int(value):
+        return "{:,.0f}".format(value)
+    return "{:.2f}".format(value)
+
+
+def to_markdown(rows, top=DEFAULT_TOP):
+    ''' Returns the top biggest deltas of every interval as markdown '''
+    lines = []
+    interval = None
+    shown = 0
+    for r in rows:
+        if (r[0], r[1], r[2]) != interval:
+            interval = (r[0], r[1], r[2])
+            shown = 0
+            lines += [
+                "",
+                "## cstat -" + r[0] + " snapshot " + str(r[1]) + " to " + str(r[2]),
+                "",
+                "| counter | before | after | delta | change |",
+                "|---|---:|---:|---:|---:|",
+            ]
+        if shown >= top:
+            continue
+        shown += 1
+        change = "" if r[7] is None else "{:+.1%}".format(r[7])
+        cells = [r[3].replace("|", "\\|"), number(r[4]), number(r[5]), number(r[6]), change]
+        lines.append("| " + " | ".join(cells) + " |")
+    return "\n".join(lines).strip("\n") + "\n"
+
+
+def write_deltas(db, top=DEFAULT_TOP) -> None:
+    ''' Stores the cstat_deltas table and prints the biggest deltas of every interval '''
+    if not has_counters(db):
+        logging.warning("no cstat counters")
+        return None
+    rows = counter_deltas(db)
+    store_deltas(db, rows)
+    print(to_markdown(rows, top))
+    return None
@@ -0,0 +1,191 @@
+import ast
+import logging
+import re
+
+from yape.catalog import refresh_columns
+
+# Derived columns are defined in the yape config, per section:
+#
+# derived:
+#   vmstat:
+#     Total CPU:
+#       expr: 100 - id
+#       ymax: 100
+#   mgstat:
+#     Glorefs per PhyRd: Glorefs / PhyRds
+#   iostat:
+#     rw ratio: "`r/s` / `w/s`"
+#     total IOPS:
+#       expr: "`r/s` + `w/s`"
+#       across: sum
+#
+# Column names that aren't plain identifiers (or are python keywords, like vmstat's "in")
+# are quoted in backticks. Expressions are translated to sql and evaluated by sqlite in one
+# UPDATE per section, the results are stored as new REAL columns of the section. With
+# "across" (sum, avg, min, max) the expression is aggregated over all devices per timestamp
+# into the table <section>_total instead.
+
+DEFAULT_DERIVED = {"vmstat": {"Total CPU": {"expr": "100 - id", "ymax": 100}}}
+
+AGGREGATES = ["sum", "avg", "min", "max"]
+# sql function and the number of arguments it takes, min and max of one argument would be
+# sqlite's aggregates
+FUNCTIONS = {"abs": ("abs", 1, 1), "min": ("min", 2, None), "max": ("max", 2, None), "round": ("round", 1, 2)}
+OPERATORS = {ast.Add: "+", ast.Sub: "-", ast.Mult: "*", ast.Mod: "%"}
+
+
+def derived_config(config):
+    ''' Returns {section: {column: {"expr": ..., ...}}} from the defaults and the config '''
+    derived = {}
+    for source in [DEFAULT_DERIVED, (config or {}).get("derived") or {}]:
+        for section, columns in source.items():
+            for column, definition in (columns or {}).items():
+                if not isinstance(definition, dict):
+                    definition = {"expr": definition}
+                derived.setdefault(section, {})[str(column)] = definition
+    return derived
+
+
+def compile_expression(expression, columns):
+    ''' Returns (sql, referenced columns) for an expression over the given columns '''
+    names = {}
+
+    def quote(match):
+        names["_c" + str(len(names))] = match.group(1)
+        return "_c" + str(len(names) - 1)
+
+    source = re.sub(r"`([^`]+)`", quote, str(expression))
+    try:
+        tree = ast.parse(source, mode="eval")
+    except SyntaxError as e:
+        raise ValueError("Invalid expression " + str(expression) + ": " + str(e))
+    used = []
+
+    def column(name):
+        name = names.get(name, name)
+        if name not in columns:
+            raise ValueError("Unknown column " + name + " in " + str(expression))
+        used.append(name)
+        return '"' + name + '"'
+
+    def sql(node):
+        if isinstance(node, ast.Expression):
+            return sql(node.body)
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+            return repr(node.value)
+        if isinstance(node, ast.Name):
+            return column(node.id)
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+            return ("-" if isinstance(node.op, ast.USub) else "+") + sql(node.operand)
+        if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Div):
+            # real division, NULL instead of an error for x/0
+            return (
+                "(CAST(" + sql(node.left) + " AS REAL) / NULLIF(" + sql(node.right) + ", 0))"
+            )
+        if isinstance(node, ast.BinOp) and type(node.op) in OPERATORS:
+            return "(" + sql(node.left) + " " + OPERATORS[type(node.op)] + " " + sql(node.right) + ")"
+        if (
+            isinstance(node, ast.Call)
+            and isinstance(node.func, ast.Name)
+            and node.func.id in FUNCTIONS
+            and len(node.keywords) == 0
+        ):
+            function, least, most = FUNCTIONS[node.func.id]
+            if len(node.args) < least or (most is not None and len(node.args) > most):
+                raise ValueError(
+                    "Wrong number of arguments to " + node.func.id + " in " + str(expression)
+                )
+            return function + "(" + ", ".join(sql(a) for a in node.args) + ")"
+        raise ValueError("Unsupported expression " + str(expression))
+
+    return sql(tree), used
+
+
+def table_columns(db, section):
+    cur = db.execute('PRAGMA table_info("' + section + '")')
+    return [r[1] for r in cur.fetchall()]
+
+
+def update_columns(db, section, batch):
+    ''' Evaluates [(column, sql)] in one pass over the section '''
+    existing = table_columns(db, section)
+    for column, expression in batch:
+        if column not in existing:
+            db.execute('ALTER TABLE "' + section + '" ADD COLUMN "' + column + '" REAL')
+    db.execute(
+        'UPDATE "'
+        + section
+        + '" SET '
+        + ", ".join('"' + column + '" = ' + expression for column, expression in batch)
+    )
+
+
+def apply_derived(db, config) -> None:
+    ''' Computes the derived columns of the config and stores them in the database '''
+    for section, columns in derived_config(config).items():
+        existing = table_columns(db, section)
+        if len(existing) == 0:
+            continue
+        batch = []
+        targets = set()
+        totals = []
+        for column, definition in columns.items():
+            try:
+                expression, used = compile_expression(
+                    definition.get("expr"), existing + list(targets)
+                )
+            except ValueError as e:
+                logging.warning("skipping derived " + section + " " + column + ": " + str(e))
+                continue
+            across = definition.get("across")
+            if across is not None:
+                if across not in AGGREGATES or "datetime" not in existing:
+                    logging.warning(
+                        "skipping derived " + section + " " + column + ": can't aggregate " + str(across)
+                    )
+                    continue
+                totals.append((column, across + "(" + expression + ")"))
+                continue
+            # sqlite sees the old values within one UPDATE, so columns using
+            # a column derived in the current batch go into the next one
+            if targets.intersection(used):
+                update_columns(db, section, batch)
+                existing += [c for c, _ in batch if c not in existing]
+                batch = []
+                targets = set()
+            batch.append((column, expression))
+            targets.add(column)
+        if len(batch) > 0:
+            logging.debug("derived columns for " + section + ": " + str(batch))
+            update_columns(db, section, batch)
+        refresh_columns(db, section)
+        if len(totals) > 0:
+            table = section + "_total"
+            logging.debug("derived totals for " + section + ": " + str(totals))
+            db.execute('DROP TABLE IF EXISTS "' + table + '"')
+            db.execute(
+                'CREATE TABLE "'
+                + table
+                + '" AS SELECT datetime, '
+                + ", ".join(e + ' AS "' + c + '"' for c, e in totals)
+                + ' FROM "'
+                + section
+                + '" GROUP BY datetime ORDER BY min(rowid)'
+            )
+        db.commit()
+
+
+def derived_ymax(config):
+    ''' Returns {column: ymax} of derived columns that have a fixed maximum '''
+    limits = {}
+    for columns in derived_config(config).values():
+        for column, definition in columns.items():
+            if definition.get("ymax") is not None:
+                limits[column] = float(definition["ymax"])
+    return limits
+
+
+def total_tables(db):
+    ''' Returns the names of the <section>_total tables in the database '''
+    cur = db.execute("SELECT name FROM sqlite_master WHERE type='table' AND name LIKE '%\\_total' ESCAPE '\\'")
+    return [r[0] for r in cur.fetchall()]
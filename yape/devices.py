@@ -0,0 +1,146 @@
+import logging
+import re
+
+# disk sections split by device, and what to rank their devices by if the
+# requested metric doesn't exist in that section (monitor_disk has no %util)
+DISK_SECTIONS = {
+    "iostat": ("Device", "%util"),
+    "sard": ("device", "%util"),
+    "monitor_disk": ("device", "CUR"),
+}
+
+
+def device_filter(pattern):
+    ''' Returns a compiled regex for a device filter string, or None if there is none '''
+    if pattern is None or pattern == "":
+        return None
+    try:
+        return re.compile(pattern)
+    except re.error as e:
+        raise ValueError("Invalid device filter " + pattern + ": " + str(e))
+
+
+def names_filter(names):
+    ''' Returns a regex matching exactly the comma or space separated device names '''
+    if names is None or names.strip() == "":
+        return None
+    names = names.replace(",", " ").split()
+    return re.compile("^(?:" + "|".join(map(re.escape, names)) + ")$")
+
+
+def want_device(config, section, device, plotting=False):
+    ''' True if the device of the section passes the regex filters and top-N selection
+
+    --plotDisks (plotfilter) only restricts what is plotted, the data (export, tables)
+    keeps every device --devices and --top-devices let through.
+    '''
+    patterns = [config.get("devicefilter")]
+    if plotting:
+        patterns.append(config.get("plotfilter"))
+    for pattern in patterns:
+        if pattern is not None and not pattern.search(str(device)):
+            return False
+    top = config.get("topdevices", {}).get(section)
+    if top is not None and device not in top:
+        return False
+    return True
+
+
+def table_columns(db, section):
+    cur = db.cursor()
+    cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", [section])
+    if len(cur.fetchall()) == 0:
+        return []
+    cur.execute('PRAGMA table_info("' + section + '")')
+    return [r[1] for r in cur.fetchall()]
+
+
+def rank_devices(db, section, split_on, metric, how="mean"):
+    ''' Returns [(device, score)] of a split section, busiest device first
+
+    The score is the mean, 95th percentile (p95) or max of the metric column,
+    computed in one pass over the table.
+    '''
+    if how in ["mean", "max"]:
+        aggregate = {"mean": "avg", "max": "max"}[how]
+        cur = db.execute(
+            'SELECT "'
+            + split_on
+            + '", '
+            + aggregate
+            + '("'
+            + metric
+            + '") FROM "'
+            + section
+            + '" GROUP BY "'
+            + split_on
+            + '"'
+        )
+        scores = [(r[0], r[1] or 0) for r in cur]
+    elif how == "p95":
+        # rows arrive sorted by device and value, pick the nearest rank per device
+        cur = db.execute(
+            'SELECT "'
+            + split_on
+            + '", "'
+            + metric
+            + '" FROM "'
+            + section
+            + '" WHERE "'
+            + metric
+            + '" IS NOT NULL ORDER BY "'
+            + split_on
+            + '", "'
+            + metric
+            + '"'
+        )
+        scores = []
+        device = None
+        values = []
+        for row in cur:
+            if row[0] != device:
+                if values:
+                    scores.append((device, values[int(0.95 * (len(values) - 1))]))
+                device = row[0]
+                values = []
+            values.append(row[1])
+        if values:
+            scores.append((device, values[int(0.95 * (len(values) - 1))]))
+    else:
+        raise ValueError("Unknown ranking " + how)
+    return sorted(scores, key=lambda s: s[1], reverse=True)
+
+
+def top_devices(db, config, count, metric="%util", how="mean"):
+    ''' Returns {section: set of devices} holding the count busiest devices of each disk section '''
+    top = {}
+    for section, (split_on, fallback) in DISK_SECTIONS.items():
+        columns = table_columns(db, section)
+        if len(columns) == 0:
+            continue
+        by = metric
+        if by not in columns:
+            logging.info(
+                section + " has no column " + metric + ", ranking devices by " + fallback
+            )
+            by = fallback
+        if by not in columns:
+            continue
+        pattern = config.get("devicefilter")
+        ranked = [
+            r
+            for r in rank_devices(db, section, split_on, by, how)
+            if pattern is None or pattern.search(str(r[0]))
+        ][:count]
+        logging.info(
+            "top devices of "
+            + section
+            + " by "
+            + how
+            + " "
+            + by
+            + ": "
+            + ", ".join(str(r[0]) for r in ranked)
+        )
+        top[section] = set(r[0] for r in ranked)
+    return top
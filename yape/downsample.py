@@ -0,0 +1,35 @@
+import numpy
+
+# Min/max decimation of time series for drawing: the rows are cut into as many buckets as
+# there are pixels and every bucket is drawn as two points, its lowest and its highest value
+# in the order they occurred. Spikes survive, the number of points only depends on the width.
+
+
+def visible_rows(x, start, end):
+    ''' Returns the slice of the sorted array x between start and end, one row more on each side '''
+    first = max(int(numpy.searchsorted(x, start, side="left")) - 1, 0)
+    last = min(int(numpy.searchsorted(x, end, side="right")) + 1, len(x))
+    return slice(first, last)
+
+
+def minmax(x, values, buckets):
+    ''' Returns x and values (rows x columns) reduced to two rows per bucket, as they are if they are short enough '''
+    n = len(x)
+    if n <= 2 * buckets:
+        return x, values
+    edges = numpy.linspace(0, n, buckets + 1).astype("int64")
+    size = int(numpy.diff(edges).max())
+    rows = edges[:-1, None] + numpy.arange(size)[None, :]
+    inside = rows < edges[1:, None]
+    block = values[numpy.minimum(rows, n - 1)]
+    present = inside[:, :, None] & ~numpy.isnan(block)
+    # argmin/argmax over the rows of every bucket, for all columns at once
+    low = edges[:-1, None] + numpy.where(present, block, numpy.inf).argmin(axis=1)
+    high = edges[:-1, None] + numpy.where(present, block, -numpy.inf).argmax(axis=1)
+    columns = numpy.arange(values.shape[1])[None, :]
+    ymin = values[low, columns]
+    ymax = values[high, columns]
+    first = low <= high
+    y = numpy.stack([numpy.where(first, ymin, ymax), numpy.where(first, ymax, ymin)], axis=1)
+    xs = numpy.stack([x[edges[:-1]], x[edges[1:] - 1]], axis=1)
+    return xs.reshape(-1), y.reshape(2 * buckets, values.shape[1])
@@ -0,0 +1,217 @@
+import csv
+import gzip
+import io
+import json
+import logging
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from yape.catalog import CATALOG, has_section, read_catalog
+from yape.devices import want_device
+
+# Tables are exported with one pass each: rows are fetched in chunks and routed to
+# one csv writer per device, so memory use only depends on the chunk size.
+# An export directory holds the catalog as well, read_export loads it back into a
+# database with the original column types, without the pButtons file.
+
+DEFAULT_CHUNK = 10000
+
+
+def table_columns(cursor, section):
+    if not has_section(cursor.connection, section):
+        return None
+    cursor.execute('PRAGMA table_info("' + section + '")')
+    return [r[1] for r in cursor.fetchall()]
+
+
+def open_output(file: Path, compression=None):
+    ''' Opens a csv output file for writing, returns the file object and its actual name '''
+    if compression == "gzip":
+        file = file.with_name(file.name + ".gz")
+        return gzip.open(str(file), "wt", newline=""), file
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise ValueError("zstd compression requires the zstandard package")
+        file = file.with_name(file.name + ".zst")
+        writer = zstandard.ZstdCompressor().stream_writer(open(str(file), "wb"))
+        return io.TextIOWrapper(writer, newline=""), file
+    if compression is not None:
+        raise ValueError("Unknown compression " + str(compression))
+    return open(str(file), "w", newline=""), file
+
+
+def export_table(db, config: {}, section, split_on=None) -> None:
+    ''' Writes section to <basefilename>/<fileprefix><section>[.<device>].csv, one file per device if split_on is given '''
+    fileprefix = config["fileprefix"]
+    basefilename = Path(config["basefilename"])
+    chunk = config.get("csvchunk") or DEFAULT_CHUNK
+    compression = config.get("csvcompression")
+
+    c = db.cursor()
+    columns = table_columns(c, section)
+    if columns is None:
+        return None
+    split = None
+    if split_on is not None:
+        for i, name in enumerate(columns):
+            if name.lower() == split_on.lower():
+                split = i
+        if split is None:
+            logging.warning("no column " + split_on + " in " + section)
+            return None
+
+    outputs = {}  # device (None if not split) -> (file, csv writer) or None if filtered
+
+    def output(device):
+        if device not in outputs:
+            if device is not None and not want_device(config, section, device):
+                outputs[device] = None
+                return None
+            if device is None:
+                file = basefilename / (fileprefix + section + ".csv")
+            else:
+                file = basefilename / (fileprefix + section + "." + str(device) + ".csv")
+            f, file = open_output(file, compression)
+            logging.info("exporting " + section + " to " + str(file))
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            outputs[device] = (f, writer)
+        return outputs[device]
+
+    try:
+        c.execute('select * from "' + section + '"')
+        if split is None:
+            f, writer = output(None)
+        while True:
+            rows = c.fetchmany(chunk)
+            if len(rows) == 0:
+                break
+            if split is None:
+                writer.writerows(rows)
+                continue
+            devices = {}
+            for row in rows:
+                devices.setdefault(row[split], []).append(row)
+            for device, devicerows in devices.items():
+                out = output(device)
+                if out is not None:
+                    out[1].writerows(devicerows)
+    finally:
+        for out in outputs.values():
+            if out is not None:
+                out[0].close()
+    return None
+
+
+def export_worker(database, config, section, split_on):
+    db = sqlite3.connect(database, uri=True)
+    try:
+        export_table(db, config, section, split_on)
+    finally:
+        db.close()
+
+
+def export_tables(db, config: {}, tables) -> None:
+    ''' Exports [(section, split_on)] in parallel, each table with its own connection
+
+    config["database"] is what the workers connect to (a file or a shared cache memory uri),
+    without it the tables are exported one after the other on db.
+    '''
+    database = config.get("database")
+    jobs = config.get("csvjobs") or min(len(tables), os.cpu_count() or 1)
+    if database is None or jobs <= 1:
+        for section, split_on in tables:
+            export_table(db, config, section, split_on)
+        return None
+    db.commit()
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = [
+            pool.submit(export_worker, database, config, section, split_on)
+            for section, split_on in tables
+        ]
+        for future in futures:
+            future.result()
+    return None
+
+
+def export_files(directory: Path, prefix=""):
+    ''' Returns {file name without .csv[.gz|.zst]: file} of the csv files in directory starting with prefix '''
+    files = {}
+    for file in sorted(Path(directory).iterdir()):
+        name = file.name
+        for suffix in [".gz", ".zst"]:
+            if name.endswith(suffix):
+                name = name[: -len(suffix)]
+        if name.endswith(".csv") and name.startswith(prefix):
+            files[name[len(prefix) : -len(".csv")]] = file
+    return files
+
+
+def open_input(file: Path):
+    if file.name.endswith(".gz"):
+        return gzip.open(str(file), "rt", newline="")
+    if file.name.endswith(".zst"):
+        try:
+            import zstandard
+        except ImportError:
+            raise ValueError("zstd compression requires the zstandard package")
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(open(str(file), "rb")), newline="")
+    return open(str(file), "r", newline="")
+
+
+def import_table(db, table, files, types=None, chunk=DEFAULT_CHUNK) -> None:
+    ''' Loads csv files with the same header into table, columns without a type get NUMERIC affinity '''
+    for file in files:
+        with open_input(file) as f:
+            reader = csv.reader(f)
+            columns = next(reader, None)
+            if columns is None:
+                continue
+            exists = db.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", [table])
+            if exists.fetchone() is None:
+                types = types or {}
+                db.execute(
+                    'CREATE TABLE "'
+                    + table
+                    + '" ('
+                    + ", ".join('"' + c + '" ' + (types.get(c) or "NUMERIC") for c in columns)
+                    + ")"
+                )
+            insert = 'INSERT INTO "' + table + '" VALUES (' + ", ".join(["?"] * len(columns)) + ")"
+            while True:
+                # csv.writer writes NULL as an empty field
+                rows = [[None if v == "" else v for v in r] for _, r in zip(range(chunk), reader)]
+                if len(rows) == 0:
+                    break
+                db.executemany(insert, rows)
+        logging.info("loaded " + str(file) + " into " + table)
+
+
+def read_export(db, directory: Path) -> None:
+    ''' Loads a directory written by export_tables back into db, using its catalog for table and column types '''
+    catalogs = [f for f in Path(directory).iterdir() if f.name.split(".")[0].endswith(CATALOG) and ".csv" in f.name]
+    if len(catalogs) == 0:
+        raise OSError("no " + CATALOG + ".csv in " + str(directory) + ", is it a yape csv export?")
+    prefix = catalogs[0].name.split(".")[0][: -len(CATALOG)]
+    files = export_files(directory, prefix)
+    import_table(db, CATALOG, [files.pop(CATALOG)])
+    catalog = read_catalog(db)
+    tables = {}
+    for name in sorted(files, key=len, reverse=True):
+        # split sections are <section>.<device>, sections can't have a dot in their name
+        section = name.split(".")[0] if name.split(".")[0] in catalog else name
+        tables.setdefault(section, []).append(files[name])
+    for section, sectionfiles in tables.items():
+        types = {}
+        if section in catalog:
+            types = {c: t for c, t in catalog[section]["columns"]}
+        import_table(db, section, sorted(sectionfiles), types)
+    # generic sections aren't exported, the catalog should only list what is in db
+    missing = [s for s in catalog if s not in tables]
+    db.executemany('DELETE FROM "' + CATALOG + '" WHERE section = ?', [[s] for s in missing])
+    db.commit()
+    logging.debug("not in the export: " + str(missing))
@@ -0,0 +1,330 @@
+import base64
+import json
+import logging
+import zlib
+from pathlib import Path
+
+import numpy
+
+from yape.devices import want_device
+from yape.sections import TIMESERIES, load_section, numeric, split_column
+
+# A single html file holding every parsed time series once. Timestamps are stored as
+# deltas in seconds (int32) and values as float32, each array deflated and base64 encoded.
+# The page inflates them with the browser's DecompressionStream and draws on canvas,
+# so there is nothing to install or serve to look at it.
+
+
+def pack(values, dtype):
+    data = numpy.ascontiguousarray(values, dtype=dtype).tobytes()
+    return base64.b64encode(zlib.compress(data, 6)).decode("ascii")
+
+
+def report_series(data, device):
+    values = numeric(data)
+    if values.shape[1] == 0:
+        return None
+    values = values.sort_index()
+    seconds = values.index.values.astype("datetime64[s]").astype("int64")
+    deltas = numpy.concatenate([[0], numpy.diff(seconds)])
+    return {
+        "device": device,
+        "t0": int(seconds[0]),
+        "t": pack(deltas, "<i4"),
+        "columns": [str(c) for c in values.columns.values],
+        "values": [pack(values[c].values, "<f4") for c in values.columns.values],
+    }
+
+
+def report_data(db, config):
+    ''' Returns the time series of all sections, packed for the html report '''
+    timeframe = config.get("timeframe")
+    sections = []
+    for name, split_on in TIMESERIES.items():
+        data = load_section(db, name, split_on)
+        if data is None:
+            continue
+        if timeframe is not None:
+            start, end = timeframe.split(",")
+            data = data[(data.index >= start) & (data.index <= end)]
+        series = []
+        if split_on is None:
+            packed = report_series(data, "")
+            if packed is not None:
+                series.append(packed)
+        else:
+            split_on = split_column(data, split_on)
+            for device, frame in data.groupby(split_on, sort=True):
+                if not want_device(config, name, device, plotting=True):
+                    continue
+                packed = report_series(frame.drop([split_on], axis=1), str(device))
+                if packed is not None:
+                    series.append(packed)
+        if len(series) > 0:
+            logging.debug("report: " + name + " with " + str(len(series)) + " series")
+            sections.append({"name": name, "series": series})
+    return sections
+
+
+def write_report(db, config, file: Path) -> None:
+    ''' Writes a self contained html report with all time series to file '''
+    logging.info("creating " + str(file))
+    title = str(config.get("title", "yape"))
+    data = json.dumps({"title": title, "sections": report_data(db, config)})
+    # nothing in the payload may end the script element early
+    data = data.replace("</", "<\\/")
+    html = TEMPLATE.replace("{{title}}", escape(title)).replace("{{data}}", data)
+    with open(file, "w", encoding="utf-8") as f:
+        f.write(html)
+
+
+def escape(text):
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>yape - {{title}}</title>
+<style>
+body { font-family: Arial, Helvetica, sans-serif; margin: 0; color: #222; }
+header { position: sticky; top: 0; z-index: 1; display: flex; flex-wrap: wrap; gap: 12px;
+  align-items: center; padding: 8px 12px; background: #f4f4f4; border-bottom: 1px solid #ccc; }
+header h1 { font-size: 16px; margin: 0 12px 0 0; }
+header span { font-size: 12px; color: #555; }
+#charts { display: grid; grid-template-columns: repeat(auto-fill, minmax(560px, 1fr));
+  gap: 12px; padding: 12px; }
+.chart { border: 1px solid #ddd; padding: 6px; }
+.chart div { font-size: 12px; display: flex; justify-content: space-between; }
+.chart canvas { width: 100%; height: 180px; display: block; cursor: crosshair; }
+</style>
+</head>
+<body>
+<header>
+<h1>{{title}}</h1>
+<label>Section <select id="section"></select></label>
+<label id="devicelabel">Device <select id="device"></select></label>
+<input id="filter" placeholder="filter columns">
+<span id="range"></span>
+<span>drag to zoom, double click to reset</span>
+</header>
+<div id="charts"></div>
+<script type="application/json" id="yape-data">{{data}}</script>
+<script>
+"use strict";
+const DATA = JSON.parse(document.getElementById("yape-data").textContent);
+const sectionSelect = document.getElementById("section");
+const deviceSelect = document.getElementById("device");
+const deviceLabel = document.getElementById("devicelabel");
+const filterInput = document.getElementById("filter");
+const rangeSpan = document.getElementById("range");
+const chartsDiv = document.getElementById("charts");
+const LEFT = 56, BOTTOM = 18, TOP = 4;
+let view = null;  // visible [start, end] in seconds, null for everything
+let charts = [];
+let renders = 0;
+
+async function unpack(text, Type) {
+  const bytes = Uint8Array.from(atob(text), c => c.charCodeAt(0));
+  const stream = new Blob([bytes]).stream().pipeThrough(new DecompressionStream("deflate"));
+  return new Type(await new Response(stream).arrayBuffer());
+}
+
+async function times(series) {
+  if (!series.time) {
+    const deltas = await unpack(series.t, Int32Array);
+    const t = new Float64Array(deltas.length);
+    let now = series.t0;
+    for (let i = 0; i < deltas.length; i++) {
+      now += deltas[i];
+      t[i] = now;
+    }
+    series.time = t;
+  }
+  return series.time;
+}
+
+async function values(series, i) {
+  series.decoded = series.decoded || [];
+  if (!series.decoded[i]) {
+    series.decoded[i] = await unpack(series.values[i], Float32Array);
+  }
+  return series.decoded[i];
+}
+
+function formatTime(seconds) {
+  return new Date(seconds * 1000).toISOString().replace("T", " ").slice(0, 19);
+}
+
+function formatValue(x) {
+  return Math.abs(x) >= 1000 ? Math.round(x).toLocaleString("en") : String(+x.toFixed(2));
+}
+
+function lowerBound(t, x) {
+  let lo = 0, hi = t.length;
+  while (lo < hi) {
+    const mid = (lo + hi) >> 1;
+    if (t[mid] < x) lo = mid + 1; else hi = mid;
+  }
+  return lo;
+}
+
+function draw(chart) {
+  const canvas = chart.canvas, t = chart.t, v = chart.v;
+  const ratio = window.devicePixelRatio || 1;
+  const w = canvas.clientWidth, h = canvas.clientHeight;
+  canvas.width = w * ratio;
+  canvas.height = h * ratio;
+  const ctx = canvas.getContext("2d");
+  ctx.setTransform(ratio, 0, 0, ratio, 0, 0);
+  ctx.font = "10px Arial";
+  const start = view ? view[0] : t[0];
+  const end = view ? view[1] : t[t.length - 1];
+  const lo = lowerBound(t, start), hi = lowerBound(t, end + 1e-6);
+  chart.start = start;
+  chart.end = end;
+  chart.width = w - LEFT - 4;
+  let min = 0, max = -Infinity, sum = 0, count = 0;
+  for (let i = lo; i < hi; i++) {
+    const x = v[i];
+    if (x !== x) continue;
+    if (x > max) max = x;
+    if (x < min) min = x;
+    sum += x;
+    count++;
+  }
+  if (count === 0) {
+    chart.info.textContent = "no data in range";
+    return;
+  }
+  if (max <= min) max = min + 1;
+  chart.summary = "mean " + formatValue(sum / count) + "  max " + formatValue(max);
+  chart.info.textContent = chart.summary;
+  const height = h - BOTTOM - TOP;
+  const y = x => TOP + height - (x - min) / (max - min) * height;
+  ctx.strokeStyle = "#ddd";
+  ctx.fillStyle = "#555";
+  for (let k = 0; k <= 4; k++) {
+    const level = min + (max - min) * k / 4;
+    ctx.beginPath();
+    ctx.moveTo(LEFT, y(level));
+    ctx.lineTo(LEFT + chart.width, y(level));
+    ctx.stroke();
+    ctx.fillText(formatValue(level), 2, y(level) + 3);
+  }
+  ctx.fillText(formatTime(start), LEFT, h - 4);
+  const last = formatTime(end);
+  ctx.fillText(last, LEFT + chart.width - ctx.measureText(last).width, h - 4);
+  // min/max per pixel column, drawing costs the width of the canvas, not the number of samples
+  const span = (end - start) || 1;
+  ctx.strokeStyle = "#377eb8";
+  ctx.beginPath();
+  let column = -1, low = 0, high = 0, first = true;
+  const flush = () => {
+    const px = LEFT + column;
+    if (first) { ctx.moveTo(px, y(high)); first = false; } else { ctx.lineTo(px, y(high)); }
+    ctx.lineTo(px, y(low));
+  };
+  for (let i = lo; i < hi; i++) {
+    const x = v[i];
+    if (x !== x) continue;
+    const c = Math.floor((t[i] - start) / span * (chart.width - 1));
+    if (c !== column) {
+      if (column >= 0) flush();
+      column = c;
+      low = high = x;
+    } else {
+      if (x < low) low = x;
+      if (x > high) high = x;
+    }
+  }
+  if (column >= 0) flush();
+  ctx.stroke();
+}
+
+function drawAll() {
+  charts.forEach(draw);
+  rangeSpan.textContent = charts.length && view ? formatTime(view[0]) + " - " + formatTime(view[1]) : "";
+}
+
+function timeAt(chart, x) {
+  const f = Math.min(Math.max((x - LEFT) / chart.width, 0), 1);
+  return chart.start + f * (chart.end - chart.start);
+}
+
+function attach(chart) {
+  let from = null;
+  chart.canvas.addEventListener("mousedown", e => { from = e.offsetX; });
+  chart.canvas.addEventListener("mouseup", e => {
+    if (from !== null && Math.abs(e.offsetX - from) > 5) {
+      const a = timeAt(chart, from), b = timeAt(chart, e.offsetX);
+      view = [Math.min(a, b), Math.max(a, b)];
+      drawAll();
+    }
+    from = null;
+  });
+  chart.canvas.addEventListener("dblclick", () => { view = null; drawAll(); });
+  chart.canvas.addEventListener("mousemove", e => {
+    if (chart.start === undefined) return;
+    const i = Math.min(lowerBound(chart.t, timeAt(chart, e.offsetX)), chart.t.length - 1);
+    chart.info.textContent = formatTime(chart.t[i]) + "  " + formatValue(chart.v[i]);
+  });
+  chart.canvas.addEventListener("mouseleave", () => { chart.info.textContent = chart.summary || ""; });
+}
+
+function currentSeries() {
+  return DATA.sections[sectionSelect.value].series[deviceSelect.value || 0];
+}
+
+function fillDevices() {
+  const section = DATA.sections[sectionSelect.value];
+  deviceSelect.length = 0;
+  section.series.forEach((s, i) => deviceSelect.add(new Option(s.device, i)));
+  deviceLabel.style.display = section.series[0].device ? "" : "none";
+}
+
+async function render() {
+  const token = ++renders;
+  const series = currentSeries();
+  const t = await times(series);
+  if (token !== renders) return;
+  const filter = filterInput.value.toLowerCase();
+  chartsDiv.textContent = "";
+  charts = [];
+  for (let i = 0; i < series.columns.length; i++) {
+    const name = series.columns[i];
+    if (filter && !name.toLowerCase().includes(filter)) continue;
+    const box = document.createElement("div");
+    box.className = "chart";
+    const title = document.createElement("div");
+    const label = document.createElement("b");
+    label.textContent = name;
+    const info = document.createElement("span");
+    title.append(label, info);
+    const canvas = document.createElement("canvas");
+    box.append(title, canvas);
+    chartsDiv.append(box);
+    const chart = { name: name, canvas: canvas, info: info, t: t, v: await values(series, i) };
+    if (token !== renders) return;
+    attach(chart);
+    charts.push(chart);
+  }
+  drawAll();
+}
+
+DATA.sections.forEach((s, i) => sectionSelect.add(new Option(s.name, i)));
+sectionSelect.addEventListener("change", () => { fillDevices(); render(); });
+deviceSelect.addEventListener("change", render);
+filterInput.addEventListener("input", render);
+window.addEventListener("resize", drawAll);
+if (DATA.sections.length) {
+  fillDevices();
+  render();
+} else {
+  chartsDiv.textContent = "no time series found";
+}
+</script>
+</body>
+</html>
+"""
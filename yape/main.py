@@ -1,59 +1,48 @@
 import argparse
 
+import os
 import sys
-import csv
 
 import sqlite3
 
 import logging
 import tempfile
 import zipfile
-import yaml
 from pathlib import Path
 
 from yape.parsepbuttons import parsepbuttons
-from yape.plotpbuttons import mgstat, vmstat, iostat, perfmon, sard, monitor_disk, saru
-from pkg_resources import get_distribution, DistributionNotFound
+from yape.devices import device_filter, names_filter, top_devices
+from yape.plotcache import load_manifest, save_manifest
+from yape.export import export_table, export_tables
+from yape.derived import apply_derived, total_tables
+from yape.catalog import untimed_sections
+from yape.version import getVersion
 
+# plotpbuttons (pandas, matplotlib) and yaml are imported where they are needed,
+# so that --version and --help don't pay for loading them
 
-def getVersion():
-    v = ""
-    try:
-        v = get_distribution("yape").version
-    except DistributionNotFound:
-        v = ""
-    pass
-    return v
 
-def read_config(yamlfile:Path=None, config:set=None) -> set:
+def read_config(yamlfile:Path=None, config:dict=None) -> dict:
     ''' Returns an updated config from provided yaml file '''
+    if config is None:
+        config = {}
     if yamlfile is None:
-        yamlfile = Path(Path.home() / "yape.yml")
+        yamlfile = Path.home() / ".yape.yml"
+    yamlfile = Path(yamlfile)
     if yamlfile.is_file():
+        import yaml
+
         with open(yamlfile, "r") as ymlfile:
-            cfg = yaml.load(ymlfile)
+            cfg = yaml.safe_load(ymlfile)
             logging.debug(cfg)
-            config = config.update(cfg)
+            if cfg is not None:
+                config.update(cfg)
     else:
         logging.debug('No additional yaml configuration found.')
     return config
 
 def fileout(db, config:{}, section) -> None:
-    fileprefix = config["fileprefix"]
-    basefilename = config["basefilename"]
-    c = db.cursor()
-    c.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", [section])
-    if len(c.fetchall()) == 0:
-        return None
-    file = Path(basefilename, fileprefix + section + ".csv")
-    print("exporting " + section + " to " + file)
-    c.execute('select * from "' + section + '"')
-    columns = [i[0] for i in c.description]
-
-    with open(file, "w") as f:
-        csvWriter = csv.writer(f)
-        csvWriter.writerow(columns)
-        csvWriter.writerows(c)
+    export_table(db, config, section)
     return None
 
 
@@ -64,26 +53,8 @@ def ensure_dir(file_path: Path) -> None:
     directory.mkdir(parents=True, exist_ok=True)
 
 def fileout_splitcols(db, config:{}, section, split_on) -> None:
-    fileprefix = config["fileprefix"]
-    basefilename = Path(config["basefilename"])
-    c = db.cursor()
-    c.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", [section])
-    if len(c.fetchall()) == 0:
-        return None
-    c.execute("select distinct " + split_on + ' from "' + section + '"')
-    rows = c.fetchall()
-    for column in rows:
-        c.execute(
-            'select * from "' + section + '" where ' + split_on + "=?", [column[0]]
-        )
-        file = Path(basefilename / fileprefix / section)
-        file = file.with_suffix(column[0] + ".csv")
-        print("exporting " + section + "-" + column[0] + " to " + file)
-        columns = [i[0] for i in c.description]
-        with open(file, "w") as f:
-            csvWriter = csv.writer(f)
-            csvWriter.writerow(columns)
-            csvWriter.writerows(c)
+    export_table(db, config, section, split_on)
+    return None
 
 
 def parse_args(args):
@@ -115,9 +86,123 @@ def parse_args(args):
     parser.add_argument(
         "-c",
         dest="csv",
-        help="will output the parsed tables as csv files. useful for further processing. will currently create: mgstat, vmstat, sar-u. sar-d and iostat will be output per device",
+        help="will output the parsed tables as csv files. useful for further processing. will currently create: mgstat, vmstat, perfmon, sar-u. sar-d, iostat and monitor_disk will be output per device",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--csv-compress",
+        dest="csvcompression",
+        choices=["gzip", "zstd"],
+        help="compress the csv files (zstd requires the zstandard package)",
+    )
+    parser.add_argument(
+        "--csv-chunk",
+        dest="csvchunk",
+        type=int,
+        help="number of rows fetched at a time while exporting csv files. The default is 10000",
+    )
+    parser.add_argument(
+        "--jobs",
+        dest="jobs",
+        type=int,
+        help="number of tables exported in parallel. The default is the number of cpus",
+    )
+    parser.add_argument(
+        "--wide",
+        dest="wide",
+        help="build the 'wide' table: mgstat, vmstat, perfmon, sar-u, iostat, sar-d and monitor_disk aligned on the mgstat timestamps, per device columns pivoted in. Stored in the database and exported with -c",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--wide-tolerance",
+        dest="widetolerance",
+        type=float,
+        default=2,
+        help="max. distance in seconds between aligned samples of the wide table. The default is 2",
+    )
+    parser.add_argument(
+        "--html-report",
+        dest="htmlreport",
+        help="write all time series into one self contained html file (report.html) with interactive charts",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--summary",
+        dest="summary",
+        nargs="?",
+        const="md",
+        choices=["md", "json"],
+        help="print count, mean, p50, p95, p99, max and time of max of every time series column (per device or cpu) as markdown (default) or json, nothing is plotted for it",
+    )
+    parser.add_argument(
+        "--anomalies",
+        dest="anomalies",
+        help="find spikes and dips against a rolling median baseline in every time series column, store them ranked in the 'anomalies' table (exported with -c) and mark them on the plots",
         action="store_true",
     )
+    parser.add_argument(
+        "--anomaly-window",
+        dest="anomalywindow",
+        type=int,
+        default=60,
+        help="number of samples of the rolling baseline for --anomalies. The default is 60",
+    )
+    parser.add_argument(
+        "--anomaly-threshold",
+        dest="anomalythreshold",
+        type=float,
+        default=6,
+        help="distance from the baseline, in robust standard deviations, from which a sample is anomalous. The default is 6",
+    )
+    parser.add_argument(
+        "--compare",
+        dest="compare",
+        type=Path,
+        help="pButtons file of a known good baseline: compare every time series column against it, store the result in the 'compare' table, write compare.md and overlay plots of the columns that shifted",
+    )
+    parser.add_argument(
+        "--align",
+        dest="align",
+        choices=["relative", "timeofday"],
+        default="relative",
+        help="how --compare aligns the two captures: by the time since their start or by the time of day. The default is relative",
+    )
+    parser.add_argument(
+        "--trend",
+        dest="trend",
+        help="fit a robust linear trend to every time series column, store slope, growth and days to threshold in the 'trend' table (exported with -c) and list the fastest growing in trend.md",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--rollups",
+        dest="rollups",
+        help="store min, max, avg and last of every time series column per 1 minute, 10 minutes and 1 hour in the 'rollup_1m', 'rollup_10m' and 'rollup_1h' tables (exported with -c)",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--processes",
+        dest="processes",
+        nargs="?",
+        const=10,
+        type=int,
+        metavar="N",
+        help="print the top N (default 10) processes by RSS and CPU of every ps -elfy snapshot (or tasklist) and the ones that grew most between snapshots. They are stored in the 'processes' table, exported with -c",
+    )
+    parser.add_argument(
+        "--cstat",
+        dest="cstat",
+        nargs="?",
+        const=10,
+        type=int,
+        metavar="N",
+        help="print the N (default 10) counters of cstat -D and cstat -c1 that changed most between consecutive snapshots. All changes are stored in the 'cstat_deltas' table, the counters in 'cstat_counters', both exported with -c",
+    )
+    parser.add_argument(
+        "--textindex",
+        dest="textindex",
+        type=Path,
+        help="add the text sections (sysctl-a, ps, cpffile, cstat, license, ...) to the full-text index in this database, created if needed. It can collect many captures, search it with: yape search INDEX terms",
+    )
     parser.add_argument(
         "--mgstat", dest="graphmgstat", help="plot mgstat data", action="store_true"
     )
@@ -145,7 +230,7 @@ def parse_args(args):
     parser.add_argument(
         "--timeframe",
         dest="timeframe",
-        help='specify a timeframe for the plots, i.e. --timeframe "2018-05-16 00:01:16,2018-05-16 17:04:15"',
+        help='specify a timeframe, rows outside of it are dropped while parsing and not plotted, i.e. --timeframe "2018-05-16 00:01:16,2018-05-16 17:04:15"',
     )
     parser.add_argument(
         "--prefix",
@@ -153,7 +238,53 @@ def parse_args(args):
         help="specify output file prefix (this is for the filename itself, to specify a directory, use -o)",
     )
     parser.add_argument(
-        "--plotDisks", dest="plotDisks", help="restrict list of disks to plot"
+        "--plotDisks",
+        dest="plotDisks",
+        help="restrict list of disks to plot, comma separated device names",
+    )
+    parser.add_argument(
+        "--devices",
+        dest="devices",
+        help="regular expression for the iostat, sar-d and monitor_disk devices to parse, export and plot, i.e. --devices '^(sd[a-d]|dm-)'",
+    )
+    parser.add_argument(
+        "--top-devices",
+        dest="topdevices",
+        type=int,
+        help="only export and plot the N busiest iostat, sar-d and monitor_disk devices",
+    )
+    parser.add_argument(
+        "--by",
+        dest="topby",
+        default="%util",
+        help="column to rank devices by for --top-devices. The default is %%util",
+    )
+    parser.add_argument(
+        "--rank",
+        dest="toprank",
+        choices=["mean", "p95", "max"],
+        default="mean",
+        help="aggregate to rank devices by for --top-devices. The default is mean",
+    )
+    parser.add_argument(
+        "--heatmap",
+        dest="heatmap",
+        help="plot iostat, sar-d, sar-u and monitor_disk as one time x device heatmap per column instead of one plot per column and device",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--heatmap-sort",
+        dest="heatmap_sort",
+        choices=["load", "peak", "name"],
+        default="load",
+        help="order of the devices in heatmaps: by average (load) or maximum (peak) value, or by name. The default is load",
+    )
+
+    parser.add_argument(
+        "--no-cache",
+        dest="nocache",
+        help="re-render every plot, even if its data and plot settings are unchanged since the last run into the same output directory",
+        action="store_true",
     )
 
     parser.add_argument(
@@ -178,6 +309,7 @@ def parse_args(args):
     parser.add_argument(
         "--config",
         dest="configfile",
+        type=Path,
         help="specify the location of a config file. ~/.yape.yml is used by default.",
     )
     return parser.parse_args(args)
@@ -222,6 +354,50 @@ def decompress(compressedfile:Path, destination:Path) -> bool:
         sys.exit("Could not process compressed pButtons file because: {}".format(str(e)))
     return True
 
+def parse_file(pButtons_file: Path, db, timeframe=None, devices=None) -> None:
+    ''' Parses a pButtons html file, or the html file in a .zip/.gz, into db '''
+    if is_compressed(pButtons_file):
+        # If the file is compressed, it's unrealistic to assume we wil have enough memory to
+        #  hold the extracted pbuttons file. So we extract it to a temp directory and work on it there
+        with tempfile.TemporaryDirectory(prefix="yape_") as dest:
+            destination = Path(dest)
+            decompress(pButtons_file, destination)
+            # Find the HTML file in destination
+            htmlfiles = list(destination.rglob("*.html"))
+            # We could check len(htmlfiles) here, if it's > 1, we've extracted more than 1 html file.
+            # For now, just use the first one in the list
+            htmlfile = htmlfiles[0]
+            parsepbuttons(htmlfile, db, timeframe, devices)
+    elif pButtons_file.suffix == ".html":
+        parsepbuttons(pButtons_file, db, timeframe, devices)
+    else:
+        raise Exception('Unhandled compressed filetype.  This should not occur.')
+
+
+def needs_timeline(args):
+    ''' True if a stage reading the time series (and loading pandas anyway) was asked for '''
+    return any(
+        [
+            args.wide,
+            args.htmlreport,
+            args.summary is not None,
+            args.anomalies,
+            args.compare is not None,
+            args.trend,
+            args.rollups,
+            args.topdevices is not None,
+            args.graphsard,
+            args.graphsaru,
+            args.graphmgstat,
+            args.graphvmstat,
+            args.monitor_disk,
+            args.graphiostat,
+            args.graphperfmon,
+            args.all,
+        ]
+    )
+
+
 def yape2(args=None):
     if args == None:
         args = parse_args(sys.argv[1:])
@@ -241,9 +417,12 @@ def yape2(args=None):
                 logging.error("filedb required with skip-parse set")
                 return -1
         if args.filedb is not None:
-            db = sqlite3.connect(args.filedb)
+            database = str(args.filedb)
+            db = sqlite3.connect(database)
         else:
-            db = sqlite3.connect(":memory:")
+            # shared cache, so that csv export workers can open their own connections
+            database = "file:yape-" + str(os.getpid()) + "-" + str(id(args)) + "?mode=memory&cache=shared"
+            db = sqlite3.connect(database, uri=True)
             db.execute("pragma journal_mode=wal")
             db.execute("pragma synchronous=0")
 
@@ -253,33 +432,19 @@ def yape2(args=None):
             fileprefix = ""
 
         if not args.skipparse:
-            pButtons_file = args.pButtons_file_name
-            if is_compressed(pButtons_file):
-                # If the file is compressed, it's unrealistic to assume we wil have enough memory to
-                #  hold the extracted pbuttons file. So we extract it to a temp directory and work on it there
-                with tempfile.TemporaryDirectory(prefix="yape_") as dest:
-                    destination = Path(dest)
-                    decompress(pButtons_file, destination)
-                    # Find the HTML file in destination
-                    htmlfiles = list(destination.rglob("*.html"))
-                    # We could check len(htmlfiles) here, if it's > 1, we've extracted more than 1 html file.
-                    # For now, just use the first one in the list
-                    htmlfile = htmlfiles[0]
-                    parsepbuttons(htmlfile, db)
-            elif pButtons_file.suffix == ".html":
-                parsepbuttons(pButtons_file, db)
-            else:
-                raise Exception('Unhandled compressed filetype.  This should not occur.')
+            parse_file(args.pButtons_file_name, db, args.timeframe, args.devices)
+
+        # intervals, gaps and a time axis for sections without timestamps, once per database.
+        # It needs pandas, so only if a section has no timestamps or a later stage reads the series
+        if needs_timeline(args) or len(untimed_sections(db)) > 0:
+            from yape.timeline import build_timeline
+
+            build_timeline(db)
 
         if args.out is not None:
             basefilename = args.out
         else:
-            basefilename = args.pButtons_file_name.name
-
-        if args.plotDisks is not None:
-            plotDisks = args.plotDisks
-        else:
-            plotDisks = ""
+            basefilename = Path(args.pButtons_file_name.name)
 
         # a place to hold global configurations/settings
         # makes it easier to extend functionality to carry
@@ -291,49 +456,178 @@ def yape2(args=None):
         # but not the below config settings
         config = read_config(args.configfile, config)
         logging.debug(config)
+        # derived columns are stored with their section, so everything below sees them
+        apply_derived(db, config)
         config["fileprefix"] = fileprefix
-        config["plotDisks"] = plotDisks
+        config["database"] = database
+        config["csvcompression"] = args.csvcompression
+        config["csvchunk"] = args.csvchunk
+        config["csvjobs"] = args.jobs
+        config["devicefilter"] = device_filter(args.devices)
+        config["plotfilter"] = names_filter(args.plotDisks)
+        if args.topdevices is not None:
+            config["topdevices"] = top_devices(
+                db, config, args.topdevices, args.topby, args.toprank
+            )
         config["timeframe"] = args.timeframe
         config["basefilename"] = basefilename
+        config["heatmap"] = args.heatmap
+        config["heatmap_sort"] = args.heatmap_sort
+
+        if args.wide:
+            from yape.align import build_wide
+
+            build_wide(db, config, args.widetolerance)
+
+        if args.anomalies:
+            from yape.anomalies import detect_anomalies
+
+            detect_anomalies(db, config, args.anomalywindow, args.anomalythreshold)
+
+        if args.compare is not None:
+            from yape.compare import write_compare
+
+            # the baseline isn't restricted to --timeframe, it's from another day
+            basedb = sqlite3.connect(":memory:")
+            parse_file(args.compare, basedb, None, args.devices)
+            build_timeline(basedb)
+            apply_derived(basedb, config)
+            if not args.nocache and config.get("plotcache") is None:
+                config["plotcache"] = load_manifest(basefilename)
+            write_compare(db, basedb, config, args.align)
+            basedb.close()
+
+        if args.trend:
+            from yape.trend import write_trends
+
+            write_trends(db, config)
+
+        if args.rollups:
+            from yape.rollups import build_rollups
+
+            build_rollups(db)
+            # long plots are drawn from them
+            config["rollups"] = True
+
+        if args.textindex is not None:
+            from yape.textindex import index_capture
+
+            db.commit()
+            if args.filedb is not None and args.textindex.resolve() == Path(args.filedb).resolve():
+                index_capture(db, db, args.pButtons_file_name)
+            else:
+                index = sqlite3.connect(str(args.textindex))
+                index_capture(index, db, args.pButtons_file_name)
+                index.close()
+
+        if args.cstat is not None:
+            from yape.cstat import write_deltas
+
+            write_deltas(db, args.cstat)
 
         if args.csv:
-            ensure_dir(basefilename)
-            fileout(db, config, "mgstat")
-            fileout(db, config, "vmstat")
-            fileout_splitcols(db, config, "iostat", "Device")
-            fileout_splitcols(db, config, "sar-d", "DEV")
-            fileout(db, config, "perfmon")
-            fileout(db, config, "sar-u")
+            basefilename.mkdir(parents=True, exist_ok=True)
+            export_tables(
+                db,
+                config,
+                [
+                    ("mgstat", None),
+                    ("vmstat", None),
+                    ("iostat", "Device"),
+                    ("sard", "device"),
+                    ("monitor_disk", "device"),
+                    ("perfmon", None),
+                    ("sar-u", None),
+                    ("wide", None),
+                    ("anomalies", None),
+                    ("compare", None),
+                    ("trend", None),
+                    ("gaps", None),
+                    ("intervals", None),
+                    ("catalog", None),
+                    ("processes", None),
+                    ("cstat_counters", None),
+                    ("cstat_deltas", None),
+                    ("rollup_1m", None),
+                    ("rollup_10m", None),
+                    ("rollup_1h", None),
+                ]
+                + [(table, None) for table in total_tables(db)],
+            )
+
+        if args.htmlreport:
+            from yape.htmlreport import write_report
+
+            basefilename.mkdir(parents=True, exist_ok=True)
+            config["title"] = args.pButtons_file_name.name
+            write_report(db, config, basefilename / (fileprefix + "report.html"))
+
+        if args.summary is not None:
+            from yape.summary import write_summary
+
+            write_summary(db, config, args.summary)
+
+        if args.processes is not None:
+            from yape.processes import write_processes
+
+            write_processes(db, args.processes)
 
         # plotting
+        if (
+            args.graphsard
+            or args.graphsaru
+            or args.graphmgstat
+            or args.graphvmstat
+            or args.monitor_disk
+            or args.graphiostat
+            or args.graphperfmon
+            or args.all
+        ):
+            from yape.plotpbuttons import (
+                mgstat,
+                vmstat,
+                iostat,
+                perfmon,
+                sard,
+                monitor_disk,
+                saru,
+            )
+
+            # plots whose data and settings didn't change since the last run are kept
+            if not args.nocache and config.get("plotcache") is None:
+                config["plotcache"] = load_manifest(basefilename)
+
         if args.graphsard or args.all:
-            ensure_dir(basefilename)
+            basefilename.mkdir(parents=True, exist_ok=True)
             sard(db, config)
 
         if args.graphsaru or args.all:
-            ensure_dir(basefilename)
+            basefilename.mkdir(parents=True, exist_ok=True)
             saru(db, config)
 
         if args.graphmgstat or args.all:
-            ensure_dir(basefilename)
+            basefilename.mkdir(parents=True, exist_ok=True)
             mgstat(db, config)
 
         if args.graphvmstat or args.all:
-            ensure_dir(basefilename)
+            basefilename.mkdir(parents=True, exist_ok=True)
             vmstat(db, config)
 
         if args.monitor_disk or args.all:
-            ensure_dir(basefilename)
+            basefilename.mkdir(parents=True, exist_ok=True)
             monitor_disk(db, config)
 
         if args.graphiostat or args.all:
-            ensure_dir(basefilename)
+            basefilename.mkdir(parents=True, exist_ok=True)
             iostat(db, config)
 
         if args.graphperfmon or args.all:
-            ensure_dir(basefilename)
+            basefilename.mkdir(parents=True, exist_ok=True)
             perfmon(db, config)
 
+        if config.get("plotcache") is not None and basefilename.is_dir():
+            save_manifest(basefilename, config["plotcache"])
+
     except OSError as e:
         print("Could not process pButtons file because: {}".format(str(e)))
 
@@ -1,9 +1,13 @@
-# Pandas for data management
-import pandas as pd
-
 import sqlite3
 import logging
 import sys
+from datetime import datetime
+from pathlib import Path
+
+from yape.devices import device_filter
+from yape.catalog import TIMESERIES, write_catalog
+from yape.processes import PROCESSES, build_processes
+from yape.cstat import COUNTERS, build_counters
 
 
 # splits an array into sub arrays with length size
@@ -17,7 +21,90 @@ def split(arr, size):
     return arrs
 
 
-def parsepbuttons(file, db):
+# timestamp layouts found in the different sections and OS flavours,
+# mgstat/vmstat, sar (12 hour clock), perfmon (fractions) and vms monitor
+DATETIME_FORMATS = [
+    "%m/%d/%Y %H:%M:%S",
+    "%m/%d/%y %H:%M:%S",
+    "%m/%d/%Y %I:%M:%S %p",
+    "%m/%d/%y %I:%M:%S %p",
+    "%m/%d/%Y %H:%M:%S.%f",
+    "%Y-%m-%d %H:%M:%S",
+    "%Y/%m/%d %H:%M:%S",
+    "%d-%b-%Y %H:%M:%S.%f",
+    "%d-%b-%Y %H:%M:%S",
+]
+
+
+def to_datetime(text, formats=None, section=None):
+    ''' Returns a datetime for a pButtons timestamp string, or None if it does not carry a time
+
+    formats holds the layout that read the last row of each section: sections are long runs of
+    the same one, so it's tried first, and a section keeps reading its rows the same way.
+    '''
+    if text is None:
+        return None
+    text = " ".join(text.split())
+    known = (formats or {}).get(section)
+    for fmt in ([known] if known is not None else []) + DATETIME_FORMATS:
+        try:
+            value = datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+        if formats is not None:
+            formats[section] = fmt
+        return value
+    return None
+
+
+def parse_timeframe(timeframe):
+    ''' Returns (start, end) datetimes for a "YYYY-mm-dd HH:MM:SS,YYYY-mm-dd HH:MM:SS" string, or None '''
+    if timeframe is None or timeframe == "":
+        return None
+    parts = timeframe.split(",")
+    if len(parts) != 2:
+        raise ValueError("Invalid timeframe: %s" % timeframe)
+    start = datetime.strptime(parts[0].strip(), "%Y-%m-%d %H:%M:%S")
+    end = datetime.strptime(parts[1].strip(), "%Y-%m-%d %H:%M:%S")
+    return (start, end)
+
+
+# rows of sections without (complete) timestamps can only be placed by their position,
+# the same way plotting maps them onto the mgstat timestamps. Once mgstat has told us which
+# of its rows are inside the timeframe, remove the untimed rows outside of that range.
+def trim_untimed(db, section, split_on, baserowid, first, last):
+    cursor = db.cursor()
+    if split_on is None:
+        if first is None:
+            cursor.execute('DELETE FROM "' + section + '" WHERE rowid > ?', [baserowid])
+        else:
+            cursor.execute(
+                'DELETE FROM "'
+                + section
+                + '" WHERE rowid > ? AND (rowid - ?) NOT BETWEEN ? AND ?',
+                [baserowid, baserowid, first, last],
+            )
+    else:
+        cursor.execute(
+            'SELECT rowid, "'
+            + split_on
+            + '" FROM "'
+            + section
+            + '" WHERE rowid > ? ORDER BY rowid',
+            [baserowid],
+        )
+        positions = {}
+        drop = []
+        for rowid, device in cursor.fetchall():
+            positions[device] = positions.get(device, 0) + 1
+            if first is None or not first <= positions[device] <= last:
+                drop.append([rowid])
+        cursor.executemany('DELETE FROM "' + section + '" WHERE rowid = ?', drop)
+    logging.debug("trimmed untimed section " + section + " to the timeframe")
+    db.commit()
+
+
+def parsepbuttons(file, db, timeframe=None, devices=None):
 
 # Files are parsed by reading the input pButtons file line by line. 
 #
@@ -39,6 +126,11 @@ def parsepbuttons(file, db):
 # The basic steps are;
 # Set up a list of table columns and data types 
 # Filter the sections based on whether they are able to be charted
+#
+# If a timeframe is passed, rows outside of it are dropped as soon as their timestamp is known.
+# Rows without a timestamp (eg. vmstat on Solaris/HP-UX, iostat with date only) are kept while
+# parsing and trimmed to the mgstat rows inside the timeframe at the end, see trim_untimed.
+# If a devices regex is passed, iostat, sar -d and monitor disk rows of other devices are dropped.
 
 # Table columns and data types 
 
@@ -177,6 +269,29 @@ def parsepbuttons(file, db):
     colcachenum = 0
     numcols = 0
     mgstatdate= ""
+    window = parse_timeframe(timeframe)
+    devicefilter = device_filter(devices)
+    mgstatrow = 0   # position of the current mgstat row, kept or not
+    mgstatkept = [None, None]   # first and last mgstat position inside the timeframe
+    untimed = {}    # section -> (split column, rowid before parsing started)
+    formats = {}    # section -> timestamp layout of its rows, see to_datetime
+
+    def keep_row(section, stamp, split_on=None):
+        ''' True if a row with the given timestamp belongs into the timeframe '''
+        if window is None:
+            return True
+        if stamp is None or ":" not in stamp:
+            # no time of day, place it by position once parsing is done
+            if section not in untimed:
+                cursor.execute('SELECT max(rowid) FROM "' + section + '"')
+                untimed[section] = (split_on, cursor.fetchone()[0] or 0)
+            return True
+        when = to_datetime(stamp, formats, section)
+        if when is None:
+            # unknown layout, rather keep the row than drop it on a guess
+            logging.debug("can't read timestamp " + stamp + " in " + section)
+            return True
+        return window[0] <= when <= window[1]
 
     # Move generic items out of the loop we will not chart these
 
@@ -215,7 +330,6 @@ def parsepbuttons(file, db):
         "tasklist",
     ]
   
-    cursor.execute("CREATE TABLE IF NOT EXISTS sections (section TEXT)")
     conditions = [
         {"match": "id=license", "mode": "license"},
         {"match": "id=cpffile", "mode": "cpffile"},
@@ -552,10 +666,12 @@ def parsepbuttons(file, db):
                     currentdate = cols[0] + " " + cols[1]
                     cols = [currentdate] + cols[2:]
                 # deal with data not being logged on hp-ux sometimes with high load
-                if len(cols) == insertquery.count("?"):
-                    colcache.append(cols)
-                else:
+                if len(cols) != insertquery.count("?"):
                     logging.debug("invalid column found in sar-d" + str(line))
+                elif devicefilter is not None and not devicefilter.search(cols[1]):
+                    pass
+                elif keep_row("sard", cols[0]):
+                    colcache.append(cols)
                 colcachenum += 1
                 if colcachenum == 10000:
                     cursor.executemany(insertquery, colcache)
@@ -608,6 +724,10 @@ def parsepbuttons(file, db):
                     continue
                 cols = line.split()
                 cols = [currentdate.strip()] + cols
+                if devicefilter is not None and not devicefilter.search(cols[1]):
+                    continue
+                if not keep_row("iostat", cols[0], "Device"):
+                    continue
                 db.execute(insertquery, cols)
                 count += 1
                 if count % 10000 == 0:
@@ -635,6 +755,13 @@ def parsepbuttons(file, db):
                     or osmode == "AIX"
                 ):
                     cols = [(cols[0] + " " + cols[1])] + cols[2:]
+                    if not keep_row("vmstat", cols[0]):
+                        continue
+                elif osmode == "AIX":
+                    if not keep_row("vmstat", cols[0]):
+                        continue
+                else:
+                    keep_row("vmstat", None)
 
                 cursor.execute(insertquery, cols)
                 count += 1
@@ -662,6 +789,8 @@ def parsepbuttons(file, db):
                     continue
                 cols = list(map(lambda x: x[1:-1].replace('"', ""), line.split(",")))
                 cols = list(map(lambda x: 0.0 if x == " " else x, cols))
+                if not keep_row("perfmon", cols[0]):
+                    continue
                 cursor.execute(insertquery, cols)
                 count += 1
                 if count % 10000 == 0:
@@ -699,6 +828,13 @@ def parsepbuttons(file, db):
                 if mgstatdate == "":    # Get start date for metrics that dont keep date like AIX vmstat
                     mgstatdate = cols[0].split()[0]
 
+                mgstatrow += 1
+                if not keep_row("mgstat", cols[0]):
+                    continue
+                if mgstatkept[0] is None:
+                    mgstatkept[0] = mgstatrow
+                mgstatkept[1] = mgstatrow
+
                 try:
                     cursor.execute(insertquery, cols)
                 except sqlite3.Error as e:
@@ -783,6 +919,8 @@ def parsepbuttons(file, db):
                     # hpux sar-u creates one line with all data, split it up chunks of 5
                     # first column of the line is the time
                     timecol = [sardate + " " + cols[0]]
+                    if not keep_row("sar-u", timecol[0]):
+                        continue
                     for splitcols in split(cols[1:], 5):
                         cols = timecol + splitcols
                         cursor.execute(insertquery, cols)
@@ -792,10 +930,14 @@ def parsepbuttons(file, db):
                         cols = [(sardate + " " + cols[0])] + cols[1:]
                     elif osmode == "AIX":           # 5 May 2019. AIX7.2 + Cache 2017.2 
                         cols = [(sardate + " " + cols[0])] + cols[1:]
+                        if not keep_row("sar-u", cols[0]):
+                            continue
                         cursor.execute(insertquery, cols)
                         count += 1
                     else:
                         cols = [(sardate + " " + cols[0] + " " + cols[1])] + cols[2:]
+                        if not keep_row("sar-u", cols[0]):
+                            continue
                         cursor.execute(insertquery, cols)
                         count += 1
                 
@@ -870,6 +1012,10 @@ def parsepbuttons(file, db):
                         continue
                     if (":" in line) and (len(cols) == 7):
                         cols = [(diskdate)] + [cols[0].replace(":", "")] + cols[3:]
+                        if devicefilter is not None and not devicefilter.search(cols[1]):
+                            continue
+                        if not keep_row("monitor_disk", diskdate):
+                            continue
                         cursor.execute(insertquery, cols)
                         count += 1
                         if count % 10000 == 0:
@@ -878,6 +1024,10 @@ def parsepbuttons(file, db):
                         continue
                     if (":" in line) and (len(cols) == 6):
                         cols = [(diskdate)] + [cols[0].replace(":", "")] + cols[2:]
+                        if devicefilter is not None and not devicefilter.search(cols[1]):
+                            continue
+                        if not keep_row("monitor_disk", diskdate):
+                            continue
                         cursor.execute(insertquery, cols)
                         count += 1
                         if count % 10000 == 0:
@@ -891,4 +1041,24 @@ def parsepbuttons(file, db):
         logging.debug("Saftey Commit")        
         db.commit()
 
+    for section, (split_on, baserowid) in untimed.items():
+        if mgstatrow == 0:
+            logging.warning(
+                "no mgstat timestamps to place " + section + ", keeping all of its rows"
+            )
+            continue
+        trim_untimed(db, section, split_on, baserowid, mgstatkept[0], mgstatkept[1])
+
+    # ps -elfy and tasklist as one typed row per process
+    build_processes(db)
+    # cstat -D and -c1 as (snapshot, counter, value)
+    build_counters(db)
+
+    parsed = []
+    for section in list(TIMESERIES) + ["monitor_processes", PROCESSES, COUNTERS] + generic_items:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", [section])
+        if cursor.fetchone() is not None:
+            parsed.append(section)
+    write_catalog(db, parsed, osmode, Path(file))
+
     return
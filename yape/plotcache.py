@@ -0,0 +1,92 @@
+import hashlib
+import json
+import logging
+import shutil
+from pathlib import Path
+
+# bump when the look of the plots changes, so old images aren't reused
+PLOT_VERSION = "1"
+MANIFEST = ".yape-plots.json"
+
+
+def load_manifest(directory: Path) -> dict:
+    ''' Returns the {file name: key} manifest of the plots in directory '''
+    file = Path(directory) / MANIFEST
+    if not file.is_file():
+        return {}
+    try:
+        with open(file, "r") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        logging.warning("ignoring unreadable plot manifest " + str(file) + ": " + str(e))
+        return {}
+    if manifest.get("version") != PLOT_VERSION:
+        return {}
+    return manifest.get("plots", {})
+
+
+def save_manifest(directory: Path, manifest: dict) -> None:
+    file = Path(directory) / MANIFEST
+    tmp = file.with_name(file.name + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump({"version": PLOT_VERSION, "plots": manifest}, f, indent=0, sort_keys=True)
+    tmp.replace(file)
+
+
+def plot_key(config, kind, column, digest, title="") -> str:
+    ''' Returns the cache key of a plot: its data digest, rendered title, timeframe and plot settings
+
+    Only what goes into the image belongs here, so unrelated flags don't re-render the plots.
+    '''
+    h = hashlib.sha1()
+    h.update(
+        json.dumps(
+            [
+                PLOT_VERSION,
+                kind,
+                column,
+                title,
+                config.get("timeframe"),
+                config.get("plotting"),
+                config.get("derived"),
+            ],
+            sort_keys=True,
+            default=str,
+        ).encode()
+    )
+    h.update(digest)
+    return h.hexdigest()
+
+
+def plot_cached(config, outfile: Path, key) -> bool:
+    ''' True if outfile is up to date, either already there or copied from a plot with the same key '''
+    manifest = config.get("plotcache")
+    if manifest is None:
+        return False
+    outfile = Path(outfile)
+    if manifest.get(outfile.name) == key and outfile.is_file():
+        logging.debug("unchanged " + str(outfile))
+        return True
+    # same plot under another name, eg. after changing --prefix
+    name = plot_names(config).get(key)
+    if name is not None and (outfile.parent / name).is_file():
+        logging.info("copying " + name + " to " + str(outfile))
+        shutil.copyfile(str(outfile.parent / name), str(outfile))
+        manifest[outfile.name] = key
+        return True
+    return False
+
+
+def plot_names(config) -> dict:
+    if "plotcache_names" not in config:
+        config["plotcache_names"] = {
+            key: name for name, key in config["plotcache"].items()
+        }
+    return config["plotcache_names"]
+
+
+def remember_plot(config, outfile: Path, key) -> None:
+    manifest = config.get("plotcache")
+    if manifest is not None:
+        manifest[Path(outfile).name] = key
+        plot_names(config)[key] = Path(outfile).name
@@ -1,35 +1,47 @@
 import pandas as pd
-import numpy
-import sqlite3
 import matplotlib
 
 matplotlib.use("Agg")
-import matplotlib.colors as colors
 import matplotlib.dates as mdates
-from matplotlib.dates import (
-    DayLocator,
-    HourLocator,
-    MinuteLocator,
-    SecondLocator,
-    DateFormatter,
-    drange,
-    IndexDateFormatter,
-    MO, TU, WE, TH, FR, SA, SU
-)
-from matplotlib.ticker import FormatStrFormatter
 from matplotlib.ticker import ScalarFormatter
-from matplotlib.ticker import AutoMinorLocator
-import pytz
-import re
 from pathlib import Path
-import mpl_toolkits.mplot3d
 import matplotlib.pyplot as plt
 from datetime import datetime
 import logging
 
+from yape.devices import want_device
+from yape.sections import load_section, split_column, table_exists
+from yape.derived import derived_ymax
+from yape.anomalies import anomaly_spans
+from yape.catalog import has_section
+from yape.plotcache import plot_key, plot_cached, remember_plot
+from yape.rollups import rollup_series
 
-def dispatch_plot(df, column, outfile, config):
-    genericplot(df, column, outfile, config)
+
+def data_digest(data):
+    # one vectorised hash over values and timestamps of the plotted slice
+    digest = pd.util.hash_pandas_object(data, index=True).values.tobytes()
+    if isinstance(data, pd.DataFrame):
+        digest += str(list(data.columns)).encode()
+    return digest
+
+
+def dispatch_plot(df, column, outfile, config, spans=None):
+    timeframe = config["timeframe"]
+    series = df[column]
+    if timeframe is not None:
+        series = series[timeframe.split(",")[0] : timeframe.split(",")[1]]
+    key = plot_key(
+        config,
+        "genericplot",
+        column,
+        data_digest(series) + str(spans).encode(),
+        generic_title(df, column, timeframe),
+    )
+    if plot_cached(config, outfile, key):
+        return
+    genericplot(df, column, outfile, config, spans)
+    remember_plot(config, outfile, key)
 
 
 def parse_tuple(string):
@@ -42,19 +54,23 @@ def parse_tuple(string):
         return
 
 
-def genericplot(df, column, outfile, config):
-    timeframe = config["timeframe"]
-    outfile = outfile.replace(":", ".")
-    logging.info("creating " + outfile)
+# builds the name of a plot inside the output directory:
+# <basefilename>/<fileprefix><part>.<part>...[.<timeframe>].png
+def plotfile(config, *parts):
+    name = ".".join(parts)
+    if config["timeframe"] is not None:
+        name += "." + config["timeframe"]
+    name = config["fileprefix"] + name + ".png"
+    for c in ["\\", "/", "%"]:
+        name = name.replace(c, "_")
+    name = name.replace(":", ".")
+    return Path(config["basefilename"]) / name
+
+
+def plot_settings(config):
     dim = (16, 6)
     markersize = 1
     style = "-"
-
-    colormapName = "Set1"
-    plt.style.use('seaborn-whitegrid')
-    palette = plt.get_cmap(colormapName)
-    colour=palette(1)
-
     try:
         dim = parse_tuple("(" + config["plotting"]["dim"] + ")")
     except KeyError:
@@ -67,6 +83,48 @@ def genericplot(df, column, outfile, config):
         style = config["plotting"]["style"]
     except KeyError:
         pass
+    return dim, markersize, style
+
+
+# columns with a fixed top, more can be set in the config under plotting: ymax:
+DEFAULT_YMAX = {"us": 100, "sy": 100, "wa": 100}
+
+
+def plot_ymax(config):
+    ''' Returns {column: ymax} from the defaults, the derived columns and the config '''
+    ymax = dict(DEFAULT_YMAX)
+    ymax.update(derived_ymax(config))
+    try:
+        ymax.update({str(k): float(v) for k, v in config["plotting"]["ymax"].items()})
+    except (KeyError, AttributeError):
+        pass
+    return ymax
+
+
+def time_range(df, timeframe):
+    if timeframe is not None and timeframe != "":
+        StartTime = datetime.strptime(timeframe.split(",")[0],'%Y-%m-%d %H:%M:%S')
+        EndTime   = datetime.strptime(timeframe.split(",")[-1],'%Y-%m-%d %H:%M:%S')
+    else:
+        StartTime = df.index[0]
+        EndTime   = df.index[-1]
+    return StartTime, EndTime
+
+
+def generic_title(df, column, timeframe):
+    StartTime, EndTime = time_range(df, timeframe)
+    return column + " between " + str(StartTime) + " and " + str(EndTime)
+
+
+def genericplot(df, column, outfile, config, spans=None):
+    timeframe = config["timeframe"]
+    logging.info("creating " + str(outfile))
+    dim, markersize, style = plot_settings(config)
+
+    colormapName = "Set1"
+    plt.style.use('seaborn-whitegrid')
+    palette = plt.get_cmap(colormapName)
+    colour=palette(1)
 
     fig, ax = plt.subplots(figsize=dim, dpi=80, facecolor="w", edgecolor="dimgrey")
 
@@ -77,9 +135,17 @@ def genericplot(df, column, outfile, config):
 
     plt.grid(which="both", axis="both", linestyle='--')    
 
-    # vmstat make chart top "100"
-    if column == "us" or  column == "sy" or column == "wa" or column == "Total CPU":
-        ax.set_ylim(ymax=100)    
+    # anomalous windows found by --anomalies
+    for start, end in spans or []:
+        if start == end:
+            ax.axvline(start, color="red", alpha=0.4)
+        else:
+            ax.axvspan(start, end, color="red", alpha=0.2)
+
+    # percentages and the like get a fixed top
+    ymax = plot_ymax(config).get(column)
+    if ymax is not None:
+        ax.set_ylim(ymax=ymax)
 
     # y axis    
     ax.get_yaxis().set_major_formatter(
@@ -96,18 +162,9 @@ def genericplot(df, column, outfile, config):
 
     
     # Try to be smarter with the x axis. more to come
-    if timeframe is not None and timeframe != "":
-        StartTime = datetime.strptime(timeframe.split(",")[0],'%Y-%m-%d %H:%M:%S')
-        EndTime   = datetime.strptime(timeframe.split(",")[-1],'%Y-%m-%d %H:%M:%S')
-
-        TotalMinutes = (EndTime-StartTime).total_seconds()/60
-        logging.debug("TF Minutes: " + str(TotalMinutes))  
-    else:
-        StartTime = df.index[0]
-        EndTime   = df.index[-1]
-
-        TotalMinutes = (df.index[-1] - df.index[0]).total_seconds()/60
-        logging.debug("ALL Minutes: " + str(TotalMinutes))        
+    StartTime, EndTime = time_range(df, timeframe)
+    TotalMinutes = (EndTime-StartTime).total_seconds()/60
+    logging.debug("Minutes: " + str(TotalMinutes))
 
     if TotalMinutes <= 60:
         ax.xaxis.set_major_formatter(mdates.DateFormatter("%H:%M:%S"))
@@ -128,7 +185,7 @@ def genericplot(df, column, outfile, config):
         ax.xaxis.set_major_formatter(mdates.DateFormatter("%H:%M"))
         ax.xaxis.set_major_locator(mdates.HourLocator())    
 
-    plt.title(column+" between "+str(StartTime)+" and "+str(EndTime), fontsize=12)
+    plt.title(generic_title(df, column, timeframe), fontsize=12)
     plt.xlabel("Time", fontsize=10)
     plt.tick_params(labelsize=10)
 
@@ -140,147 +197,205 @@ def genericplot(df, column, outfile, config):
     plt.close()
 
 
-# need this as utility, since pandas timestamps are not compaitble with sqlite3 timestamps
-# there's a possible other solution by using using converters in sqlite, but I haven't explored that yet
-def fix_index(df):
-    df.index = pd.to_datetime(df["datetime"])
-    df = df.drop(["datetime"], axis=1)
-    df.index.name = "datetime"
-    return df
+def rollup_frame(db, config, subsetname, device, column):
+    ''' With --rollups, the min and max per rollup bucket of a column whose range has more
+    samples than the plot has pixels, so days of data don't draw every sample. None otherwise '''
+    if not config.get("rollups"):
+        return None
+    timeframe = config["timeframe"]
+    start, end = (None, None) if timeframe is None else timeframe.split(",")
+    dim, markersize, style = plot_settings(config)
+    series = rollup_series(db, subsetname, device, column, start, end, int(dim[0] * 80))
+    return None if series is None else series.to_frame()
 
 
 def plot_subset_split(db, config, subsetname, split_on):
-    fileprefix = config["fileprefix"]
-    timeframe = config["timeframe"]
-    basename = config["basefilename"]
-    plotDisks = config["plotDisks"]
-
+    if config.get("heatmap"):
+        return plot_subset_heatmap(db, config, subsetname, split_on)
     if not check_data(db, subsetname):
         return None
-    c = db.cursor()
-    c.execute("select distinct " + split_on + ' from "' + subsetname + '"')
-    rows = c.fetchall()
-    for column in rows:
-        # If specified only plot selected disks for iostat - saves time and space
-        if len(plotDisks) > 0 and subsetname == "iostat" and column[0] not in plotDisks:
-            logging.info("Skipping plot subsection: " + column[0])
-        else:
-            logging.info("Including plot subsection: " + column[0])
-            c.execute(
-                'select * from "' + subsetname + '" where ' + split_on + "=?",
-                [column[0]],
-            )
-            data = pd.read_sql_query(
-                'select * from "'
-                + subsetname
-                + '" where '
-                + split_on
-                + '="'
-                + column[0]
-                + '"',
-                db,
-            )
-            if len(data["datetime"][0].split()) == 1:
-                # another evil hack for iostat on some redhats (no complete timestamps)
-                # the datetime field only has '09/13/18' instead of '09/13/18 14:39:49'
-                # -> take timestamps from mgstat
-                data = data.drop("datetime", axis=1)
-                size = data.shape[0]
-                # one of those evil OS without datetime in vmstat
-                # evil hack: take index from mgstat (we should have that in every pbuttons) and map that
-                # is going to horribly fail when the number of rows doesn't add up ---> TODO for later
-                dcolumn = pd.read_sql_query("select datetime from mgstat", db)
-                ##since mgstat has only one entry per timestamp, but iostat has one entry per timestamp per device
-                ##we need to duplicate the rows appropriately which is data.shape[0]/dcolumn.shape[0]) times
-                # dcolumn=dcolumn.loc[dcolumn.index.repeat(size/dcolumn.shape[0])].reset_index(drop=True)
-
-                data.index = pd.to_datetime(dcolumn["datetime"][:size])
-                data.index.name = "datetime"
-            else:
-                data = fix_index(data)
-            data = data.drop([split_on], axis=1)
-            for key in data.columns.values:
-                if timeframe is not None:
-                    file = Path(
-                        basename /
-                        fileprefix /
-                        subsetname /
-                        "." /
-                        column[0] /
-                        "." /
-                        key.replace("/", "_") /
-                        "." /
-                        timeframe /
-                        ".png"
-                    )
-                else:
-                    file = Path(
-                        basename /
-                        fileprefix /
-                        subsetname /
-                        "." /
-                        column[0] /
-                        "." /
-                        key.replace("/", "_") /
-                        ".png"
-                    )
-                dispatch_plot(data, key, file, config)
+    data = load_section(db, subsetname, split_on)
+    if data is None:
+        return None
+    split_on = split_column(data, split_on)
+    for device, subset in data.groupby(split_on, sort=False):
+        # If specified only plot selected or top N disks - saves time and space
+        if not want_device(config, subsetname, device, plotting=True):
+            logging.info("Skipping plot subsection: " + str(device))
+            continue
+        logging.info("Including plot subsection: " + str(device))
+        subset = subset.drop([split_on], axis=1)
+        for key in subset.columns.values:
+            file = plotfile(config, subsetname, str(device), key)
+            spans = anomaly_spans(config, subsetname, device, key)
+            rollup = rollup_frame(db, config, subsetname, device, key)
+            dispatch_plot(subset if rollup is None else rollup, key, file, config, spans)
+
+
+def heatmap_order(matrix, config):
+    sort = config.get("heatmap_sort", "load")
+    if sort == "name":
+        return sorted(matrix.index)
+    if sort == "peak":
+        score = matrix.max(axis=1)
+    else:
+        score = matrix.mean(axis=1)
+    # busiest devices at the top
+    return score.sort_values(ascending=False).index
 
 
-def plot_subset(db, config, subsetname):
-    fileprefix = config["fileprefix"]
+def heatmap(matrix, column, title, outfile, config):
+    logging.info("creating " + str(outfile))
+    dim, markersize, style = plot_settings(config)
+    plt.style.use('seaborn-whitegrid')
+    fig, ax = plt.subplots(figsize=dim, dpi=80, facecolor="w", edgecolor="dimgrey")
+
+    StartTime = matrix.columns[0]
+    EndTime = matrix.columns[-1]
+    rows = len(matrix.index)
+    image = ax.imshow(
+        matrix.values,
+        aspect="auto",
+        interpolation="nearest",
+        cmap="inferno",
+        extent=[
+            mdates.date2num(StartTime),
+            mdates.date2num(EndTime),
+            rows - 0.5,
+            -0.5,
+        ],
+    )
+    ax.xaxis_date()
+    ax.grid(False)
+
+    # label at most ~40 devices, otherwise the labels run into each other
+    step = max(1, rows // 40)
+    ax.set_yticks(range(0, rows, step))
+    ax.set_yticklabels(list(matrix.index)[::step], fontsize=8)
+
+    TotalMinutes = (EndTime - StartTime).total_seconds() / 60
+    if TotalMinutes <= 180:
+        ax.xaxis.set_major_formatter(mdates.DateFormatter("%H:%M:%S"))
+    elif TotalMinutes > 1445:
+        ax.xaxis.set_major_formatter(mdates.DateFormatter("%d/%m - %H:%M"))
+    else:
+        ax.xaxis.set_major_formatter(mdates.DateFormatter("%H:%M"))
+
+    colourbar = fig.colorbar(image, ax=ax)
+    colourbar.set_label(column)
+
+    plt.title(
+        title + " " + column + " between " + str(StartTime) + " and " + str(EndTime),
+        fontsize=12,
+    )
+    plt.xlabel("Time", fontsize=10)
+    plt.tick_params(labelsize=10)
+    plt.setp(ax.get_xticklabels(), rotation=45, ha="right")
+    plt.tight_layout()
+
+    plt.savefig(outfile, bbox_inches="tight")
+
+    plt.close()
+
+
+def overlayplot(baseline, current, column, title, outfile, config, align):
+    # baseline and current are indexed by hours since the start of the capture or since midnight
+    key = plot_key(
+        config, "overlay" + align, column, data_digest(baseline) + data_digest(current), title
+    )
+    if plot_cached(config, outfile, key):
+        return
+    logging.info("creating " + str(outfile))
+    dim, markersize, style = plot_settings(config)
+    plt.style.use('seaborn-whitegrid')
+    palette = plt.get_cmap("Set1")
+    fig, ax = plt.subplots(figsize=dim, dpi=80, facecolor="w", edgecolor="dimgrey")
+    ax.plot(baseline, style, markersize=markersize, alpha=0.7, color=palette(1), label="baseline")
+    ax.plot(current, style, markersize=markersize, alpha=0.7, color=palette(0), label="current")
+    ax.legend(loc="upper right")
+    plt.grid(which="both", axis="both", linestyle='--')
+    ymax = plot_ymax(config).get(column)
+    if ymax is not None:
+        ax.set_ylim(ymax=ymax)
+    ax.set_ylim(ymin=0)
+    if max(baseline.max(), current.max()) > 999:
+        ax.yaxis.set_major_formatter(matplotlib.ticker.StrMethodFormatter('{x:,.0f}'))
+    else:
+        ax.yaxis.set_major_formatter(ScalarFormatter(useOffset=None))
+        ax.get_yaxis().get_major_formatter().set_scientific(False)
+    plt.title(title + ": baseline vs. current", fontsize=12)
+    plt.xlabel("hour of day" if align == "timeofday" else "hours since start", fontsize=10)
+    plt.tick_params(labelsize=10)
+    plt.tight_layout()
+    plt.savefig(outfile, bbox_inches="tight")
+    plt.close()
+    remember_plot(config, outfile, key)
+
+
+# one image per column: the split table is pivoted into a device x time matrix,
+# so the number of files doesn't depend on the number of devices/cpus anymore
+def plot_subset_heatmap(db, config, subsetname, split_on):
     timeframe = config["timeframe"]
-    basename = config["basefilename"]
+
     if not check_data(db, subsetname):
         return None
-    data = pd.read_sql_query('select * from "' + subsetname + '"', db)
-    if "datetime" not in data.columns.values:
-        logging.debug("No datetime")
-        size = data.shape[0]
-        # one of those evil OS without datetime in vmstat
-        # evil hack: take index from mgstat (we should have that in every pbuttons) and map that
-        # is going to horribly fail when the number of rows doesn't add up ---> TODO for later
-        dcolumn = pd.read_sql_query("select datetime from mgstat", db)
-        data.index = pd.to_datetime(dcolumn["datetime"][:size])
-        data.index.name = "datetime"
+    data = load_section(db, subsetname, split_on)
+    if data is None:
+        return None
+    split_on = split_column(data, split_on)
+    data = data[[want_device(config, subsetname, d, plotting=True) for d in data[split_on]]]
+    if data.shape[0] == 0:
+        return None
+    data = data.reset_index()
+    if timeframe is not None:
+        start, end = timeframe.split(",")
+        data = data[(data["datetime"] >= start) & (data["datetime"] <= end)]
+    if data.shape[0] == 0:
+        return None
 
-    else:
-        data = fix_index(data)
+    for key in data.columns.values:
+        if key == "datetime" or key == split_on:
+            continue
+        values = data[[split_on, "datetime"]].copy()
+        values["value"] = pd.to_numeric(data[key], errors="coerce")
+        matrix = values.pivot_table(
+            index=split_on, columns="datetime", values="value", aggfunc="mean"
+        )
+        if matrix.shape[0] == 0:
+            continue
+        matrix = matrix.loc[heatmap_order(matrix, config)]
+        file = plotfile(config, subsetname, "heatmap", key)
+        cachekey = plot_key(
+            config, "heatmap" + config.get("heatmap_sort", "load"), key, data_digest(matrix), subsetname
+        )
+        if plot_cached(config, file, cachekey):
+            continue
+        heatmap(matrix, key, subsetname, file, config)
+        remember_plot(config, file, cachekey)
 
-    # if vmstat add an extra column
-    # 
-    if subsetname == "vmstat":
-        data["Total CPU"] = 100 - data["id"]     
-    
+
+def plot_subset(db, config, subsetname):
+    if not check_data(db, subsetname):
+        return None
+    data = load_section(db, subsetname)
+    if data is None:
+        return None
     for key in data.columns.values:     # key is the column name
+        file = plotfile(config, subsetname, key)
+        rollup = rollup_frame(db, config, subsetname, "", key)
+        dispatch_plot(
+            data if rollup is None else rollup, key, file, config, anomaly_spans(config, subsetname, "", key)
+        )
 
-        if timeframe is not None:
-            file = Path(
-                basename /
-                fileprefix /
-                subsetname /
-                "." /
-                key.replace("\\", "_").replace("/", "_") /
-                "." /
-                timeframe /
-                ".png".replace("%", "_")
-            )
-        else:
-            file = Path(
-                basename /
-                fileprefix /
-                subsetname /
-                "." /
-                key.replace("\\", "_").replace("/", "_") /
-                ".png".replace("%", "_")
-            )
-        dispatch_plot(data, key, file, config)
+
+def plot_total(db, config, subsetname):
+    # totals across devices, defined with "across" in the derived config
+    if table_exists(db, subsetname + "_total"):
+        plot_subset(db, config, subsetname + "_total")
 
 
 def check_data(db, name):
-    cur = db.cursor()
-    cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", [name])
-    if len(cur.fetchall()) == 0:
+    if not has_section(db, name):
         logging.warning("no data for:" + name)
         return False
     return True
@@ -301,15 +416,19 @@ def vmstat(db, config):
 
 def iostat(db, config):
     plot_subset_split(db, config, "iostat", "Device")
+    plot_total(db, config, "iostat")
 
 
 def monitor_disk(db, config):
     plot_subset_split(db, config, "monitor_disk", "device")
+    plot_total(db, config, "monitor_disk")
 
 
 def sard(db, config):
     plot_subset_split(db, config, "sard", "device")
+    plot_total(db, config, "sard")
 
 
 def saru(db, config):
     plot_subset_split(db, config, "sar-u", "cpu")
+    plot_total(db, config, "sar-u")
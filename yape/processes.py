@@ -0,0 +1,275 @@
+import csv
+import logging
+import re
+
+# The ps -elfy snapshots (pselfy1 to pselfy4) and the Windows tasklist are kept as text
+# lines by the parser. Here they are split into one typed row per process and snapshot in
+# the processes table, so that top lists and growth between snapshots are queries.
+
+PROCESSES = "processes"
+PS_SECTIONS = ["pselfy1", "pselfy2", "pselfy3", "pselfy4"]
+TASKLIST = "tasklist"
+COLUMNS = [
+    ["source", "TEXT"],
+    ["snapshot", "INTEGER"],
+    ["pid", "INTEGER"],
+    ["ppid", "INTEGER"],
+    ["user", "TEXT"],
+    ["state", "TEXT"],
+    ["cpu", "REAL"],
+    ["rss_kb", "INTEGER"],
+    ["sz", "INTEGER"],
+    ["cputime_s", "INTEGER"],
+    ["stime", "TEXT"],
+    ["name", "TEXT"],
+    ["command", "TEXT"],
+]
+# what the top lists can be sorted by
+ORDERS = {"rss": "rss_kb", "cpu": "cpu", "time": "cputime_s"}
+DEFAULT_TOP = 10
+
+
+def number(value, kind=int):
+    try:
+        return kind(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def seconds(value):
+    ''' Returns the seconds of a cpu time like [[dd-]hh:]mm:ss, None if it isn't one '''
+    if value is None:
+        return None
+    days = 0
+    if "-" in value:
+        d, value = value.split("-", 1)
+        days = number(d)
+        if days is None:
+            return None
+    total = 0
+    for part in value.split(":"):
+        part = number(part.split(".")[0])
+        if part is None:
+            return None
+        total = total * 60 + part
+    return days * 86400 + total
+
+
+def kilobytes(value):
+    ''' Returns the number of a tasklist memory column, eg. "12,345 K" '''
+    if value is None:
+        return None
+    digits = re.sub(r"[^0-9]", "", value)
+    return int(digits) if digits != "" else None
+
+
+def command_name(command):
+    if command is None or command.strip() == "":
+        return None
+    first = command.split()[0]
+    if first.startswith("[") or first.startswith("("):
+        # kernel threads, eg. [kworker/0:1]
+        return first.strip("[]()").split("/")[0]
+    return first.rsplit("/", 1)[-1].rsplit("\\", 1)[-1]
+
+
+def clean(line):
+    return line.replace("<pre>", "").replace("</pre>", "").rstrip("\n")
+
+
+def ps_rows(lines):
+    ''' Returns one {column: text} per process of ps -elfy output, keyed by the ps header '''
+    header = None
+    rows = []
+    for line in lines:
+        line = clean(line)
+        fields = line.split()
+        if len(fields) == 0:
+            continue
+        if header is None or fields == header:
+            if "PID" in fields and ("CMD" in fields or "COMMAND" in fields):
+                header = fields
+            continue
+        # the command is the last column and may hold spaces
+        parts = line.split(None, len(header) - 1)
+        if len(parts) < len(header):
+            continue
+        rows.append(dict(zip(header, parts)))
+    return rows
+
+
+def ps_process(fields, snapshot):
+    command = fields.get("CMD", fields.get("COMMAND"))
+    return [
+        "ps",
+        snapshot,
+        number(fields.get("PID")),
+        number(fields.get("PPID")),
+        fields.get("UID"),
+        fields.get("S"),
+        number(fields.get("C"), float),
+        number(fields.get("RSS")),
+        number(fields.get("SZ")),
+        seconds(fields.get("TIME")),
+        fields.get("STIME"),
+        command_name(command),
+        command,
+    ]
+
+
+def tasklist_rows(lines):
+    ''' Returns one {column: text} per process of tasklist output, table (/FO TABLE) or csv (/FO CSV) '''
+    lines = [clean(l) for l in lines if clean(l).strip() != ""]
+    if len(lines) == 0:
+        return []
+    if lines[0].startswith('"'):
+        return list(csv.DictReader(lines))
+    # the ==== line under the header gives the column widths
+    for i, line in enumerate(lines):
+        if i > 0 and re.fullmatch(r"[= ]+", line) and "=" in line:
+            starts = [m.start() for m in re.finditer(r"=+", line)]
+            ends = starts[1:] + [None]
+            header = [lines[i - 1][s:e].strip() for s, e in zip(starts, ends)]
+            return [
+                dict(zip(header, [l[s:e].strip() for s, e in zip(starts, ends)]))
+                for l in lines[i + 1 :]
+            ]
+    return []
+
+
+def tasklist_process(fields):
+    name = fields.get("Image Name")
+    return [
+        "tasklist",
+        1,
+        number(fields.get("PID")),
+        None,
+        fields.get("User Name"),
+        fields.get("Status"),
+        None,
+        kilobytes(fields.get("Mem Usage")),
+        None,
+        seconds(fields.get("CPU Time")),
+        None,
+        name,
+        name,
+    ]
+
+
+def section_lines(db, section):
+    cur = db.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", [section])
+    if cur.fetchone() is None:
+        return None
+    return [r[0] for r in db.execute('SELECT line FROM "' + section + '" ORDER BY rowid').fetchall()]
+
+
+def build_processes(db) -> int:
+    ''' (Re)creates the processes table from the ps and tasklist sections, returns its number of rows '''
+    rows = []
+    for snapshot, section in enumerate(PS_SECTIONS, 1):
+        lines = section_lines(db, section)
+        if lines is not None:
+            rows.extend(ps_process(fields, snapshot) for fields in ps_rows(lines))
+    lines = section_lines(db, TASKLIST)
+    if lines is not None:
+        rows.extend(tasklist_process(fields) for fields in tasklist_rows(lines))
+    rows = [r for r in rows if r[2] is not None]
+    db.execute('DROP TABLE IF EXISTS "' + PROCESSES + '"')
+    if len(rows) == 0:
+        return 0
+    db.execute(
+        'CREATE TABLE "' + PROCESSES + '" (' + ", ".join('"' + c + '" ' + t for c, t in COLUMNS) + ")"
+    )
+    db.executemany(
+        'INSERT INTO "' + PROCESSES + '" VALUES (' + ", ".join(["?"] * len(COLUMNS)) + ")", rows
+    )
+    db.execute('CREATE INDEX "' + PROCESSES + '_pid" ON "' + PROCESSES + '" (pid, snapshot)')
+    db.execute('CREATE INDEX "' + PROCESSES + '_command" ON "' + PROCESSES + '" (name, command)')
+    db.commit()
+    logging.debug(str(len(rows)) + " processes")
+    return len(rows)
+
+
+def top_processes(db, by="rss", top=DEFAULT_TOP):
+    ''' Returns the top processes of every snapshot by rss, cpu or time as
+    [(source, snapshot, rank, pid, user, value, name, command)] '''
+    column = ORDERS[by]
+    cur = db.execute(
+        "SELECT source, snapshot, rank, pid, user, value, name, command FROM ("
+        + "SELECT *, "
+        + column
+        + " AS value, ROW_NUMBER() OVER (PARTITION BY source, snapshot ORDER BY "
+        + column
+        + ' DESC) AS rank FROM "'
+        + PROCESSES
+        + '" WHERE '
+        + column
+        + " IS NOT NULL) WHERE rank <= ? ORDER BY source, snapshot, rank",
+        [top],
+    )
+    return cur.fetchall()
+
+
+def process_growth(db, top=DEFAULT_TOP):
+    ''' Returns the processes that grew most between the first and last snapshot they are in as
+    [(source, pid, name, first, last, rss_kb first, rss_kb last, rss growth, cpu seconds used, command)] '''
+    cur = db.execute(
+        """WITH span AS (
+            SELECT source, pid, command, min(snapshot) AS first, max(snapshot) AS last
+            FROM "{p}" GROUP BY source, pid, command HAVING first < last
+        )
+        SELECT s.source, s.pid, a.name, s.first, s.last, a.rss_kb, b.rss_kb,
+            b.rss_kb - a.rss_kb AS growth, b.cputime_s - a.cputime_s, s.command
+        FROM span s
+        JOIN "{p}" a ON a.pid = s.pid AND a.snapshot = s.first AND a.source = s.source AND a.command = s.command
+        JOIN "{p}" b ON b.pid = s.pid AND b.snapshot = s.last AND b.source = s.source AND b.command = s.command
+        ORDER BY growth DESC LIMIT ?""".format(p=PROCESSES),
+        [top],
+    )
+    return cur.fetchall()
+
+
+def has_processes(db):
+    cur = db.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", [PROCESSES])
+    return cur.fetchone() is not None
+
+
+def cell(value):
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        return "{:.1f}".format(value)
+    return str(value).replace("|", "\\|")
+
+
+def to_markdown(db, top=DEFAULT_TOP):
+    ''' Returns the top processes by rss and cpu per snapshot and the biggest growers as markdown '''
+    lines = []
+    for by, title in [("rss", "RSS (KB)"), ("cpu", "CPU (%)")]:
+        lines += [
+            "## Top processes by " + title,
+            "",
+            "| source | snapshot | # | pid | user | " + by + " | name | command |",
+            "|---|---:|---:|---:|---|---:|---|---|",
+        ]
+        for r in top_processes(db, by, top):
+            lines.append("| " + " | ".join(cell(v) for v in r[:7]) + " | " + cell(r[7])[:80] + " |")
+        lines.append("")
+    lines += [
+        "## Grew most between snapshots",
+        "",
+        "| source | pid | name | from | to | rss (KB) | rss (KB) | growth | cpu seconds |",
+        "|---|---:|---|---:|---:|---:|---:|---:|---:|",
+    ]
+    for r in process_growth(db, top):
+        lines.append("| " + " | ".join(cell(v) for v in r[:9]) + " |")
+    return "\n".join(lines) + "\n"
+
+
+def write_processes(db, top=DEFAULT_TOP) -> None:
+    ''' Prints the process summary to stdout '''
+    if not has_processes(db):
+        logging.warning("no ps -elfy or tasklist processes")
+        return None
+    print(to_markdown(db, top))
+    return None
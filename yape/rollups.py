@@ -0,0 +1,199 @@
+import logging
+
+import numpy
+import pandas as pd
+
+from yape.derived import total_tables
+from yape.sections import TIMESERIES, load_section, numeric, split_column, table_exists
+
+# Rollups: every numeric column of every time series section (per device or cpu) reduced
+# to min, max, avg and last over fixed buckets, one table per resolution. read_rollup picks
+# the coarsest resolution that still gives the number of points asked for over a time
+# range, so views spanning days don't have to read every sample.
+
+ROLLUPS = {"1m": 60, "10m": 600, "1h": 3600}
+ROLLUPS_META = "rollups_meta"
+FORMAT = "%Y-%m-%d %H:%M:%S"
+COLUMNS = ["section", "device", "column", "datetime", "min", "max", "avg", "last", "samples"]
+
+
+def rollup_table(resolution):
+    return "rollup_" + resolution
+
+
+def rollup_sections(db):
+    ''' Returns {section: split_on} of the sections that are rolled up '''
+    sections = {name: split_on for name, split_on in TIMESERIES.items() if table_exists(db, name)}
+    sections.update({table: None for table in total_tables(db)})
+    return sections
+
+
+def section_series(db, name, split_on=None):
+    ''' Returns the numeric columns of a section and the device of every row ("" if it isn't split) '''
+    data = load_section(db, name, split_on)
+    if data is None:
+        return None, None
+    if split_on is None:
+        return numeric(data), numpy.full(data.shape[0], "", dtype=object)
+    split_on = split_column(data, split_on)
+    return numeric(data, skip=(split_on,)), data[split_on].astype(str).to_numpy(dtype=object)
+
+
+def section_rollup(name, values, devices, seconds):
+    ''' Returns the rollup rows (see COLUMNS) of a section at one resolution as a DataFrame '''
+    buckets = values.index.floor(str(seconds) + "s")
+    grouped = values.groupby([buckets, devices], sort=True)
+    stats = [grouped.min(), grouped.max(), grouped.mean(), grouped.last(), grouped.count()]
+    keys = stats[0].index
+    columns = list(values.columns.values)
+    # groups x columns matrices, raveled row by row into one row per group and column
+    rollup = pd.DataFrame(
+        {
+            "section": name,
+            "device": numpy.repeat(keys.get_level_values(1).to_numpy(dtype=object), len(columns)),
+            "column": numpy.tile(numpy.array(columns, dtype=object), len(keys)),
+            "datetime": numpy.repeat(keys.get_level_values(0).strftime(FORMAT).to_numpy(dtype=object), len(columns)),
+        }
+    )
+    for label, stat in zip(COLUMNS[4:], stats):
+        rollup[label] = stat[columns].to_numpy(dtype="float64").ravel()
+    rollup["samples"] = rollup["samples"].astype("int64")
+    return rollup[rollup["samples"] > 0]
+
+
+def signature(db, sections):
+    # row counts and columns of the sources, derived columns change the latter
+    parts = []
+    for name in sections:
+        count = db.execute('SELECT count(*), max(rowid) FROM "' + name + '"').fetchone()
+        columns = [r[1] for r in db.execute('PRAGMA table_info("' + name + '")').fetchall()]
+        parts.append(name + ":" + str(count) + str(columns))
+    return ";".join(parts)
+
+
+def build_rollups(db) -> None:
+    ''' Materialises the rollup tables, unless they are up to date '''
+    sections = rollup_sections(db)
+    key = signature(db, sections)
+    db.execute('CREATE TABLE IF NOT EXISTS "' + ROLLUPS_META + '" (key TEXT)')
+    cached = db.execute('SELECT key FROM "' + ROLLUPS_META + '"').fetchone()
+    if cached is not None and cached[0] == key and all(table_exists(db, rollup_table(r)) for r in ROLLUPS):
+        logging.info("rollups are up to date")
+        return None
+    series = {}
+    for name, split_on in sections.items():
+        values, devices = section_series(db, name, split_on)
+        if values is not None and values.shape[1] > 0:
+            series[name] = (values, devices)
+    for resolution, seconds in ROLLUPS.items():
+        table = rollup_table(resolution)
+        db.execute('DROP TABLE IF EXISTS "' + table + '"')
+        db.execute(
+            'CREATE TABLE "'
+            + table
+            + '" (section TEXT, device TEXT, "column" TEXT, datetime TEXT, min REAL, max REAL, avg REAL, last REAL, samples INTEGER)'
+        )
+        rows = 0
+        for name, (values, devices) in series.items():
+            rollup = section_rollup(name, values, devices, seconds)
+            rollup.to_sql(table, db, if_exists="append", index=False)
+            rows += rollup.shape[0]
+        db.execute('CREATE INDEX "' + table + '_range" ON "' + table + '" (section, "column", datetime)')
+        logging.info("created " + table + ", " + str(rows) + " rows")
+    db.execute('DELETE FROM "' + ROLLUPS_META + '"')
+    db.execute('INSERT INTO "' + ROLLUPS_META + '" VALUES (?)', [key])
+    db.commit()
+    return None
+
+
+def choose_resolution(start, end, points):
+    ''' Returns the coarsest resolution giving at least points buckets between start and end, None for the raw data '''
+    span = (pd.Timestamp(end) - pd.Timestamp(start)).total_seconds()
+    for resolution, seconds in sorted(ROLLUPS.items(), key=lambda r: -r[1]):
+        if span / seconds >= points:
+            return resolution
+    return None
+
+
+def time_range(db, section):
+    if table_exists(db, rollup_table("1h")):
+        first, last = db.execute(
+            'SELECT min(datetime), max(datetime) FROM "' + rollup_table("1h") + '" WHERE section = ?',
+            [section],
+        ).fetchone()
+        if first is not None:
+            # the last bucket runs for another hour
+            return pd.Timestamp(first), pd.Timestamp(last) + pd.Timedelta(seconds=ROLLUPS["1h"])
+    values, devices = section_series(db, section, rollup_sections(db).get(section))
+    if values is None:
+        return None, None
+    return values.index.min(), values.index.max()
+
+
+def raw_rollup(db, section, start, end, columns=None):
+    ''' Returns the samples of a section between start and end in the layout of the rollups '''
+    values, devices = section_series(db, section, rollup_sections(db).get(section))
+    if values is None:
+        return pd.DataFrame(columns=COLUMNS)
+    inside = (values.index >= start) & (values.index <= end)
+    values = values[inside]
+    if columns is not None:
+        values = values[[c for c in values.columns.values if c in columns]]
+    rollup = section_rollup(section, values, devices[inside], 1)
+    return rollup
+
+
+def read_rollup(db, section, start=None, end=None, points=1000, columns=None):
+    ''' Returns (resolution, rows) of a section between start and end, see COLUMNS,
+    at the coarsest resolution with at least points buckets, "raw" if the rollups are too coarse '''
+    if start is None or end is None:
+        first, last = time_range(db, section)
+        if first is None:
+            return None, pd.DataFrame(columns=COLUMNS)
+        start = first if start is None else start
+        end = last if end is None else end
+    start = pd.Timestamp(start)
+    end = pd.Timestamp(end)
+    resolution = choose_resolution(start, end, points)
+    if resolution is None or not table_exists(db, rollup_table(resolution)):
+        return "raw", raw_rollup(db, section, start, end, columns)
+    query = (
+        'SELECT * FROM "'
+        + rollup_table(resolution)
+        + '" WHERE section = ? AND datetime >= ? AND datetime <= ?'
+    )
+    params = [section, start.strftime(FORMAT), end.strftime(FORMAT)]
+    if columns is not None:
+        query += ' AND "column" IN (' + ", ".join(["?"] * len(columns)) + ")"
+        params += list(columns)
+    rows = pd.read_sql_query(query + " ORDER BY rowid", db, params=params)
+    return resolution, rows
+
+
+def rollup_series(db, section, device, column, start=None, end=None, points=1000):
+    ''' Returns the min and max of a column per bucket as one series, two points per bucket like
+    yape.downsample, None if the samples themselves are few enough or there are no rollups '''
+    if not table_exists(db, rollup_table("1h")):
+        return None
+    if start is None or end is None:
+        first, last = time_range(db, section)
+        if first is None:
+            return None
+        start = first if start is None else start
+        end = last if end is None else end
+    start = pd.Timestamp(start)
+    end = pd.Timestamp(end)
+    resolution = choose_resolution(start, end, points)
+    if resolution is None or not table_exists(db, rollup_table(resolution)):
+        return None
+    rows = db.execute(
+        'SELECT datetime, min, max FROM "'
+        + rollup_table(resolution)
+        + '" WHERE section = ? AND "column" = ? AND device = ? AND datetime >= ? AND datetime <= ? ORDER BY datetime',
+        [section, column, str(device), start.strftime(FORMAT), end.strftime(FORMAT)],
+    ).fetchall()
+    if len(rows) == 0:
+        return None
+    index = pd.to_datetime(numpy.repeat([r[0] for r in rows], 2), format=FORMAT)
+    values = numpy.array([[r[1], r[2]] for r in rows], dtype="float64").ravel()
+    return pd.Series(values, index=pd.DatetimeIndex(index, name="datetime"), name=column)
@@ -0,0 +1,70 @@
+import logging
+from datetime import datetime
+
+import pandas as pd
+
+from yape.catalog import TIMESERIES
+from yape.parsepbuttons import DATETIME_FORMATS
+
+
+def table_exists(db, name):
+    cur = db.cursor()
+    cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", [name])
+    return len(cur.fetchall()) > 0
+
+
+def parse_datetimes(values):
+    ''' Returns a DatetimeIndex for a column of pButtons timestamps '''
+    # a section uses one layout, knowing it makes the conversion a lot faster
+    first = " ".join(str(values.iloc[0]).split())
+    for fmt in DATETIME_FORMATS:
+        try:
+            datetime.strptime(first, fmt)
+        except ValueError:
+            continue
+        try:
+            return pd.DatetimeIndex(
+                pd.to_datetime(values.str.split().str.join(" "), format=fmt)
+            )
+        except ValueError:
+            break
+    return pd.DatetimeIndex(pd.to_datetime(values))
+
+
+def split_column(data, split_on):
+    # the split column is named by the OS tool, eg. "CPU" for sar -u, match it like sqlite does
+    for c in data.columns.values:
+        if c.lower() == split_on.lower():
+            return c
+    return split_on
+
+
+def load_section(db, name, split_on=None):
+    ''' Returns a section as DataFrame indexed by datetime, or None if there is no data '''
+    if not table_exists(db, name):
+        return None
+    data = pd.read_sql_query('select * from "' + name + '"', db)
+    if data.shape[0] == 0:
+        return None
+    if "datetime" in data.columns.values and len(str(data["datetime"][0]).split()) > 1:
+        data.index = parse_datetimes(data["datetime"])
+        data = data.drop(["datetime"], axis=1)
+        data.index.name = "datetime"
+        return data
+    # sections without timestamps get them from yape.timeline.build_timeline after parsing
+    logging.warning("no timestamps for " + name)
+    return None
+
+
+def numeric(data, skip=()):
+    ''' Returns the numeric columns of a section as floats, text columns holding numbers are converted '''
+    columns = {}
+    for c in data.columns.values:
+        if c in skip:
+            continue
+        values = data[c]
+        if not pd.api.types.is_numeric_dtype(values):
+            values = pd.to_numeric(values, errors="coerce")
+        if values.notna().any():
+            columns[c] = values.astype("float64")
+    return pd.DataFrame(columns, index=data.index)
@@ -0,0 +1,123 @@
+import json
+import logging
+import warnings
+
+import numpy
+
+from yape.derived import total_tables
+from yape.devices import want_device
+from yape.sections import TIMESERIES, load_section, numeric, split_column
+
+# Key figures of every time series column, per device or cpu where the section is split,
+# computed straight from the database without plotting anything.
+
+PERCENTILES = [50, 95, 99]
+STATS = ["count", "mean"] + ["p" + str(p) for p in PERCENTILES] + ["max", "time of max"]
+
+
+def column_stats(values):
+    ''' Returns {column: {stat: value}} for a DataFrame of floats indexed by datetime '''
+    data = values.to_numpy(dtype="float64")
+    if data.shape[0] == 0:
+        return {}
+    present = ~numpy.isnan(data)
+    count = present.sum(axis=0)
+    with warnings.catch_warnings():
+        # all empty columns just give nan
+        warnings.simplefilter("ignore", RuntimeWarning)
+        mean = numpy.nanmean(data, axis=0)
+        percentiles = numpy.nanpercentile(data, PERCENTILES, axis=0)
+        peak = numpy.nanmax(data, axis=0)
+    at = numpy.where(present, data, -numpy.inf).argmax(axis=0)
+    times = values.index[at].strftime("%Y-%m-%d %H:%M:%S")
+    stats = {}
+    for i, column in enumerate(values.columns.values):
+        if count[i] == 0:
+            continue
+        stats[str(column)] = dict(
+            zip(
+                STATS,
+                [int(count[i]), float(mean[i])]
+                + [float(p) for p in percentiles[:, i]]
+                + [float(peak[i]), times[i]],
+            )
+        )
+    return stats
+
+
+def section_summary(db, config, name, split_on=None):
+    ''' Returns {device: {column: stats}} of a section, device is "" if it isn't split '''
+    data = load_section(db, name, split_on)
+    if data is None:
+        return {}
+    timeframe = config.get("timeframe")
+    if timeframe is not None:
+        start, end = timeframe.split(",")
+        data = data[(data.index >= start) & (data.index <= end)]
+    if split_on is None:
+        stats = column_stats(numeric(data))
+        return {"": stats} if len(stats) > 0 else {}
+    split_on = split_column(data, split_on)
+    summary = {}
+    for device, frame in data.groupby(split_on, sort=True):
+        if not want_device(config, name, device):
+            continue
+        stats = column_stats(numeric(frame, skip=(split_on,)))
+        if len(stats) > 0:
+            summary[str(device)] = stats
+    return summary
+
+
+def summary(db, config):
+    ''' Returns {section: {device: {column: stats}}} for all time series in the database '''
+    sections = dict(TIMESERIES)
+    sections.update({table: None for table in total_tables(db)})
+    result = {}
+    for name, split_on in sections.items():
+        stats = section_summary(db, config, name, split_on)
+        if len(stats) > 0:
+            logging.debug("summary: " + name + " with " + str(len(stats)) + " series")
+            result[name] = stats
+    return result
+
+
+def number(value):
+    if isinstance(value, str):
+        return value
+    if isinstance(value, int) or abs(value) >= 1000:
+        return "{:,.0f}".format(value)
+    return "{:.2f}".format(value)
+
+
+def to_markdown(result):
+    ''' Returns the summary as one markdown table per section '''
+    lines = []
+    for name, devices in result.items():
+        split = any(device != "" for device in devices)
+        header = (["device"] if split else []) + ["column"] + STATS
+        lines.append("## " + name)
+        lines.append("")
+        lines.append("| " + " | ".join(header) + " |")
+        lines.append("|" + "|".join(["---"] * (2 if split else 1) + ["---:"] * (len(STATS) - 1) + ["---"]) + "|")
+        for device, columns in devices.items():
+            for column, stats in columns.items():
+                cells = ([device] if split else []) + [column] + [number(stats[s]) for s in STATS]
+                lines.append("| " + " | ".join(c.replace("|", "\\|") for c in cells) + " |")
+        lines.append("")
+    return "\n".join(lines)
+
+
+def write_summary(db, config, output="md", file=None) -> None:
+    ''' Writes the summary as markdown or json to file, stdout if file is None '''
+    result = summary(db, config)
+    if output == "json":
+        text = json.dumps(result, indent=1)
+    else:
+        text = to_markdown(result)
+    if file is None:
+        print(text)
+        return None
+    logging.info("creating " + str(file))
+    with open(file, "w", encoding="utf-8") as f:
+        f.write(text + "\n")
+    return None
@@ -0,0 +1,47 @@
+from yape.align import build_wide, wide_frame
+
+import sqlite3
+
+
+def sample_db():
+    db = sqlite3.connect(":memory:")
+    db.execute('CREATE TABLE mgstat("datetime" TEXT, "Glorefs" INTEGER)')
+    db.execute('CREATE TABLE vmstat("datetime" TEXT, "wa" INTEGER)')
+    db.execute('CREATE TABLE iostat("datetime" TEXT, "Device" TEXT, "%util" REAL)')
+    for i in range(5):
+        db.execute(
+            "INSERT INTO mgstat VALUES (?, ?)", ["05/16/2018 09:00:%02d" % (i * 10), i]
+        )
+        # vmstat a second late, iostat two seconds early
+        db.execute(
+            "INSERT INTO vmstat VALUES (?, ?)", ["05/16/18 09:00:%02d" % (i * 10 + 1), 10 + i]
+        )
+        for d in ["sda", "sdb"]:
+            db.execute(
+                "INSERT INTO iostat VALUES (?, ?, ?)",
+                ["05/16/2018 09:00:%02d AM" % (i * 10 + 8), d, i * (2 if d == "sdb" else 1)],
+            )
+    return db
+
+
+class TestAlign:
+    def test_wide_frame(self):
+        wide = wide_frame(sample_db(), {}, tolerance=2)
+        assert list(wide.columns) == [
+            "mgstat.Glorefs",
+            "vmstat.wa",
+            "iostat.sda.%util",
+            "iostat.sdb.%util",
+        ]
+        assert list(wide["vmstat.wa"]) == [10, 11, 12, 13, 14]
+        # 09:00:08 is closest to 09:00:10, nothing within 2s of 09:00:00
+        assert wide["iostat.sdb.%util"].isnull().tolist() == [True, False, False, False, False]
+        assert list(wide["iostat.sdb.%util"][1:]) == [0, 2, 4, 6]
+        assert wide_frame(sample_db(), {}, tolerance=0.5)["vmstat.wa"].isnull().all()
+
+    def test_build_wide(self):
+        db = sample_db()
+        build_wide(db, {})
+        rows = db.execute('select datetime, "vmstat.wa" from wide').fetchall()
+        assert rows[0] == ("2018-05-16 09:00:00", 10.0)
+        assert len(rows) == 5
@@ -0,0 +1,34 @@
+from yape.anomalies import find_anomalies, store_anomalies
+
+import sqlite3
+
+
+def sample_db():
+    db = sqlite3.connect(":memory:")
+    db.execute('CREATE TABLE mgstat("datetime" TEXT, "Glorefs" INTEGER, "PhyRds" INTEGER)')
+    db.execute('CREATE TABLE iostat("datetime" TEXT, "Device" TEXT, "%util" REAL)')
+    for i in range(200):
+        stamp = "05/16/2018 %02d:%02d:00" % (9 + i // 60, i % 60)
+        # noisy but steady, with a burst of three samples and a single dip
+        glorefs = 1000 + (i * 7) % 50 + (5000 if 100 <= i <= 102 else 0)
+        db.execute("INSERT INTO mgstat VALUES (?, ?, ?)", [stamp, glorefs, 500])
+        db.execute("INSERT INTO iostat VALUES (?, 'sda', ?)", [stamp, 0 if i == 150 else 50 + i % 5])
+        db.execute("INSERT INTO iostat VALUES (?, 'sdb', ?)", [stamp, 20 + i % 5])
+    return db
+
+
+class TestAnomalies:
+    def test_find_anomalies(self):
+        found = find_anomalies(sample_db(), {})
+        assert [a[:3] for a in found] == [("mgstat", "", "Glorefs"), ("iostat", "sda", "%util")]
+        section, device, column, start, end, samples, peak, baseline, severity = found[0]
+        assert (str(start), str(end), samples) == ("2018-05-16 10:40:00", "2018-05-16 10:42:00", 3)
+        assert peak > 6000 and baseline < 1100 and severity > found[1][-1]
+        assert str(found[1][3]) == "2018-05-16 11:30:00"
+
+    def test_store_anomalies(self):
+        db = sample_db()
+        store_anomalies(db, find_anomalies(db, {}))
+        rows = db.execute('select section, device, "column", start, samples from anomalies').fetchall()
+        assert rows[0] == ("mgstat", "", "Glorefs", "2018-05-16 10:40:00", 3)
+        assert len(rows) == 2
@@ -0,0 +1,37 @@
+from yape.catalog import file_sha256, has_section, read_catalog
+from yape.derived import apply_derived
+from yape.parsepbuttons import parsepbuttons
+from yape.timeline import build_timeline
+
+from pathlib import Path
+import sqlite3
+
+SAMPLE = Path(__file__).parent / "data" / "pbuttons_linux.html"
+
+
+class TestCatalog:
+    def test_catalog(self):
+        db = sqlite3.connect(":memory:")
+        parsepbuttons(SAMPLE, db)
+        catalog = read_catalog(db)
+        assert sorted(catalog) == ["iostat", "mgstat", "sar-u", "sard", "sysctl-a", "vmstat"]
+        iostat = catalog["iostat"]
+        assert iostat["rows"] == 24
+        assert iostat["devices"] == ["sda", "sdb"]
+        assert iostat["columns"][:2] == [["datetime", "TEXT"], ["Device", "TEXT"]]
+        assert iostat["start"] == "05/16/2018 09:00:00 AM"
+        assert iostat["osmode"] == "linux"
+        assert iostat["sha256"] == file_sha256(SAMPLE)
+        # normalised and completed by the later stages
+        build_timeline(db)
+        apply_derived(db, {})
+        catalog = read_catalog(db)
+        assert (catalog["iostat"]["start"], catalog["iostat"]["interval"]) == ("2018-05-16 09:00:00", 10.0)
+        assert catalog["vmstat"]["columns"][-1] == ["Total CPU", "REAL"]
+
+    def test_has_section(self):
+        db = sqlite3.connect(":memory:")
+        assert not has_section(db, "mgstat")
+        parsepbuttons(SAMPLE, db)
+        assert has_section(db, "mgstat")
+        assert not has_section(db, "perfmon")
@@ -0,0 +1,38 @@
+from yape.compare import compare, ks_distance, offsets
+
+import sqlite3
+
+import pandas as pd
+
+
+def sample_db(day, hour, load):
+    db = sqlite3.connect(":memory:")
+    db.execute('CREATE TABLE mgstat("datetime" TEXT, "Glorefs" INTEGER, "PhyRds" INTEGER)')
+    for i in range(120):
+        stamp = "05/%02d/2018 %02d:%02d:00" % (day, hour + i // 60, i % 60)
+        db.execute("INSERT INTO mgstat VALUES (?, ?, ?)", [stamp, load + i % 10, 500 + i % 7])
+    return db
+
+
+class TestCompare:
+    def test_ks_distance(self):
+        assert ks_distance([1, 2, 3], [1, 2, 3]) == 0
+        assert ks_distance([1, 2, 3], [4, 5, 6]) == 1
+
+    def test_offsets(self):
+        index = pd.DatetimeIndex(["2018-05-16 09:00:00", "2018-05-16 09:00:10"])
+        assert list(offsets(index)) == [0, 10]
+        assert list(offsets(index, "timeofday")) == [32400, 32410]
+
+    def test_compare(self):
+        baseline = sample_db(16, 9, 1000)
+        rows, frames = compare(sample_db(17, 9, 2000), baseline, {})
+        assert [r[2] for r in rows if r[-1]] == ["Glorefs"]
+        glorefs = rows[0]
+        assert glorefs[3:5] == [1004.5, 2004.5]
+        assert round(glorefs[9], 3) == 0.996
+        # aligned by time of day only the hour both have data for is compared
+        rows, frames = compare(sample_db(17, 10, 1000), baseline, {}, "timeofday")
+        before, after = frames[("mgstat", "")]
+        assert before.shape[0] == after.shape[0] == 60
+        assert not any(r[-1] for r in rows)
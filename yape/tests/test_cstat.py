@@ -0,0 +1,52 @@
+from yape.cstat import counter_deltas, counters, to_markdown
+from yape.parsepbuttons import parsepbuttons
+
+import sqlite3
+
+
+def cstat_section(n, glorefs, reads_b):
+    return (
+        '<div id="cstat -D_' + str(n) + '"><b>cstat -D_' + str(n) + "</b></div>\n<pre>\n"
+        + "Global buffer statistics:\n"
+        + "  Glorefs = " + str(glorefs) + ", Gloupds = 20\n"
+        + "  Blocks read: 1,500\n"
+        + "Started at 10:22:33\n"
+        + "Database /data/a/:\n"
+        + "  Reads = 10\n"
+        + "Database /data/b/:\n"
+        + "  Reads = " + str(reads_b) + "\n"
+        + '</pre><a href="#Topofpage">Back to top</a>\n'
+    )
+
+
+class TestCstat:
+    def test_counters(self):
+        lines = cstat_section(1, 1000, 5).splitlines(True)[2:-1]
+        assert counters(lines) == [
+            ("Global buffer statistics / Glorefs", 1000.0),
+            ("Global buffer statistics / Gloupds", 20.0),
+            ("Global buffer statistics / Blocks read", 1500.0),
+            ("Database /data/a/ / Reads", 10.0),
+            ("Database /data/b/ / Reads", 5.0),
+        ]
+
+    def test_deltas(self, tmp_path):
+        file = tmp_path / "cstat.html"
+        file.write_text(
+            "<html><body>\n"
+            + cstat_section(1, 1000, 5)
+            + cstat_section(2, 1500, 6)
+            + cstat_section(3, 1500, 106)
+            + "</body></html>\n"
+        )
+        db = sqlite3.connect(":memory:")
+        parsepbuttons(file, db)
+        assert db.execute("SELECT count(*) FROM cstat_counters").fetchone()[0] == 15
+        rows = counter_deltas(db)
+        assert [(r[1], r[2], r[3], r[6]) for r in rows] == [
+            (1, 2, "Global buffer statistics / Glorefs", 500.0),
+            (1, 2, "Database /data/b/ / Reads", 1.0),
+            (2, 3, "Database /data/b/ / Reads", 100.0),
+        ]
+        assert rows[2][7] == 100 / 6
+        assert "snapshot 2 to 3" in to_markdown(rows)
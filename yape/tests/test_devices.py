@@ -0,0 +1,38 @@
+from yape.devices import names_filter, rank_devices, top_devices, want_device
+from yape.parsepbuttons import parsepbuttons
+
+from pathlib import Path
+import sqlite3
+
+SAMPLE = Path(__file__).parent / "data" / "pbuttons_linux.html"
+
+
+class TestDevices:
+    def test_rank_devices(self):
+        db = sqlite3.connect(":memory:")
+        parsepbuttons(SAMPLE, db)
+        for how in ["mean", "p95", "max"]:
+            ranked = rank_devices(db, "iostat", "Device", "%util", how)
+            assert [r[0] for r in ranked] == ["sdb", "sda"]
+        assert rank_devices(db, "iostat", "Device", "%util", "max")[0][1] == 51.0
+        top = top_devices(db, {}, 1)
+        assert top == {"iostat": {"sdb"}, "sard": {"dev8-16"}}
+
+    def test_parse_device_filter(self):
+        db = sqlite3.connect(":memory:")
+        parsepbuttons(SAMPLE, db, devices="^(sda|dev8-16)$")
+        assert db.execute("select distinct Device from iostat").fetchall() == [("sda",)]
+        assert db.execute("select distinct device from sard").fetchall() == [("dev8-16",)]
+
+    def test_want_device(self):
+        # exact names, not a substring test
+        config = {"plotfilter": names_filter("sda, sdb")}
+        assert want_device(config, "iostat", "sda", plotting=True)
+        assert not want_device(config, "iostat", "sda1", plotting=True)
+        # --plotDisks doesn't restrict the data
+        assert want_device(config, "iostat", "sda1")
+        config["topdevices"] = {"iostat": {"sdb"}}
+        assert not want_device(config, "iostat", "sda", plotting=True)
+        assert want_device(config, "iostat", "sdb", plotting=True)
+        assert want_device(config, "sard", "sda", plotting=True)
+        assert not want_device(config, "iostat", "sda")
@@ -0,0 +1,28 @@
+from yape.downsample import minmax, visible_rows
+
+import numpy
+
+
+class TestDownsample:
+    def test_short(self):
+        x = numpy.arange(10.0)
+        values = numpy.ones((10, 2))
+        xs, ys = minmax(x, values, 5)
+        assert xs is x and ys is values
+
+    def test_spikes_survive(self):
+        x = numpy.arange(100000.0)
+        values = numpy.zeros((100000, 2))
+        values[12345, 0] = 50
+        values[54321, 1] = -7
+        values[60000:61000, 1] = numpy.nan
+        xs, ys = minmax(x, values, 100)
+        assert len(xs) == 200 and ys.shape == (200, 2)
+        assert numpy.all(numpy.diff(xs) >= 0)
+        assert ys[:, 0].max() == 50 and numpy.nanmin(ys[:, 1]) == -7
+        assert numpy.isnan(ys[120:122, 1]).all()
+
+    def test_visible_rows(self):
+        x = numpy.arange(0.0, 100.0, 10.0)
+        assert visible_rows(x, 25, 55) == slice(2, 7)
+        assert visible_rows(x, -100, 1000) == slice(0, 10)
@@ -0,0 +1,70 @@
+from yape.catalog import read_catalog
+from yape.devices import names_filter
+from yape.export import export_tables, read_export
+from yape.main import fileout_splitcols
+from yape.parsepbuttons import parsepbuttons
+
+from pathlib import Path
+import csv
+import gzip
+import sqlite3
+
+SAMPLE = Path(__file__).parent / "data" / "pbuttons_linux.html"
+
+
+def read_csv(file):
+    opener = gzip.open if file.suffix == ".gz" else open
+    with opener(str(file), "rt", newline="") as f:
+        return list(csv.reader(f))
+
+
+class TestExport:
+    def test_splitcols(self, tmp_path):
+        db = sqlite3.connect(":memory:")
+        parsepbuttons(SAMPLE, db)
+        config = {"fileprefix": "x_", "basefilename": tmp_path, "csvchunk": 5}
+        fileout_splitcols(db, config, "iostat", "Device")
+        sda = read_csv(tmp_path / "x_iostat.sda.csv")
+        assert sda[0][:2] == ["datetime", "Device"]
+        assert len(sda) == 13
+        assert set(r[1] for r in sda[1:]) == {"sda"}
+
+    def test_plotdisks_keeps_export(self, tmp_path):
+        # --plotDisks only restricts the plots
+        db = sqlite3.connect(":memory:")
+        parsepbuttons(SAMPLE, db)
+        config = {"fileprefix": "", "basefilename": tmp_path, "plotfilter": names_filter("sda")}
+        fileout_splitcols(db, config, "iostat", "Device")
+        devices = [r[0] for r in db.execute("select distinct Device from iostat")]
+        assert len(devices) > 1
+        for device in devices:
+            assert (tmp_path / ("iostat." + device + ".csv")).exists()
+
+    def test_parallel_gzip(self, tmp_path):
+        database = str(tmp_path / "pb.db")
+        db = sqlite3.connect(database)
+        parsepbuttons(SAMPLE, db)
+        config = {
+            "fileprefix": "",
+            "basefilename": tmp_path,
+            "database": database,
+            "csvcompression": "gzip",
+            "csvjobs": 3,
+        }
+        export_tables(
+            db, config, [("mgstat", None), ("sard", "device"), ("perfmon", None)]
+        )
+        assert len(read_csv(tmp_path / "mgstat.csv.gz")) == 13
+        assert len(read_csv(tmp_path / "sard.dev8-16.csv.gz")) == 13
+        assert not (tmp_path / "perfmon.csv.gz").exists()
+
+    def test_read_export(self, tmp_path):
+        db = sqlite3.connect(":memory:")
+        parsepbuttons(SAMPLE, db)
+        config = {"fileprefix": "x_", "basefilename": tmp_path, "csvcompression": "gzip"}
+        export_tables(db, config, [("mgstat", None), ("iostat", "Device"), ("catalog", None)])
+        loaded = sqlite3.connect(":memory:")
+        read_export(loaded, tmp_path)
+        assert set(read_catalog(loaded)) == {"mgstat", "iostat"}
+        query = 'SELECT * FROM iostat ORDER BY "Device", rowid'
+        assert loaded.execute(query).fetchall() == db.execute(query).fetchall()
@@ -0,0 +1,39 @@
+from yape.htmlreport import write_report
+from yape.parsepbuttons import parsepbuttons
+
+from pathlib import Path
+import base64
+import json
+import re
+import sqlite3
+import zlib
+
+import numpy
+
+SAMPLE = Path(__file__).parent / "data" / "pbuttons_linux.html"
+
+
+def unpack(text, dtype):
+    return numpy.frombuffer(zlib.decompress(base64.b64decode(text)), dtype=dtype)
+
+
+class TestHtmlReport:
+    def test_report(self, tmp_path):
+        db = sqlite3.connect(":memory:")
+        parsepbuttons(SAMPLE, db)
+        file = tmp_path / "report.html"
+        write_report(db, {"title": "sample"}, file)
+        html = file.read_text()
+        data = json.loads(
+            re.search(r'id="yape-data">(.*?)</script>', html, re.S).group(1)
+        )
+        sections = {s["name"]: s for s in data["sections"]}
+        assert sorted(sections) == ["iostat", "mgstat", "sar-u", "sard", "vmstat"]
+        assert [s["device"] for s in sections["iostat"]["series"]] == ["sda", "sdb"]
+
+        mgstat = sections["mgstat"]["series"][0]
+        times = mgstat["t0"] + numpy.cumsum(unpack(mgstat["t"], "<i4"))
+        assert len(times) == 12
+        assert list(numpy.diff(times)) == [10] * 11
+        glorefs = unpack(mgstat["values"][mgstat["columns"].index("Glorefs")], "<f4")
+        assert glorefs[0] == 100000
@@ -1,12 +1,15 @@
 from yape.main import fileout, fileout_splitcols, parse_args, yape2
-from yape.parsepbuttons import parsepbuttons
+from yape.parsepbuttons import parsepbuttons, to_datetime
 
+from datetime import datetime
 from pathlib import Path
+import sqlite3
 import traceback
 import logging
 
 TEST_DIR = Path("testdata")
 TEST_RESULTS = Path("testresults")
+SAMPLE = Path(__file__).parent / "data" / "pbuttons_linux.html"
 # just to understand how tests work
 class TestParser:
     def test_is_string(self):
@@ -16,8 +19,8 @@ class TestParser:
     def test_args_parse(self):
         params = ["--filedb", "some.db", "some.html"]
         args = parse_args(params)
-        assert args.filedb == "some.db"
-        assert args.pButtons_file_name == "some.html"
+        assert args.filedb == Path("some.db")
+        assert args.pButtons_file_name == Path("some.html")
         params = ["-q", "-a", "some.html"]
         args = parse_args(params)
         assert args.quiet
@@ -39,6 +42,32 @@ class TestParser:
         assert args.monitor_disk
         assert args.graphperfmon
 
+    def test_parse_timeframe(self):
+        db = sqlite3.connect(":memory:")
+        parsepbuttons(SAMPLE, db, "2018-05-16 09:00:30,2018-05-16 09:01:10")
+        counts = {}
+        for table in ["mgstat", "vmstat", "iostat", "sar-u", "sard"]:
+            counts[table] = db.execute('select count(*) from "' + table + '"').fetchone()[0]
+        # 5 samples inside the window, iostat/sard have 2 devices, sar-u 3 cpu lines
+        assert counts == {"mgstat": 5, "vmstat": 5, "iostat": 10, "sar-u": 15, "sard": 10}
+        first = db.execute("select datetime from mgstat order by rowid limit 1").fetchone()
+        assert first[0] == "05/16/2018 09:00:30"
+
+    def test_to_datetime_per_section(self):
+        # the layout is remembered per section of one parse, not across parses
+        formats = {}
+        assert to_datetime("16-May-2018 09:00:30", formats, "monitor") == datetime(2018, 5, 16, 9, 0, 30)
+        assert to_datetime("05/16/18 09:00:30 AM", formats, "sar-u") == datetime(2018, 5, 16, 9, 0, 30)
+        assert formats == {"monitor": "%d-%b-%Y %H:%M:%S", "sar-u": "%m/%d/%y %I:%M:%S %p"}
+        assert to_datetime("not a time", formats, "sar-u") is None
+        assert formats["sar-u"] == "%m/%d/%y %I:%M:%S %p"
+        counts = []
+        for _ in range(2):
+            db = sqlite3.connect(":memory:")
+            parsepbuttons(SAMPLE, db, "2018-05-16 09:00:30,2018-05-16 09:01:10")
+            counts.append(db.execute("select count(*) from mgstat").fetchone()[0])
+        assert counts == [5, 5]
+
     # pretty much a full stack test of parsing and plotting for all pbuttons in the testdata dir
     def test_db_parse(self):
         testingcfg = TEST_DIR / "config.test.yml"
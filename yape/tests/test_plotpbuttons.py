@@ -0,0 +1,65 @@
+from yape.plotpbuttons import data_digest, dispatch_plot, generic_title, heatmap_order, plotfile
+from yape.plotcache import load_manifest, plot_cached, plot_key, remember_plot, save_manifest
+
+from pathlib import Path
+import pandas as pd
+
+
+class TestPlot:
+    def test_plotfile(self):
+        config = {"basefilename": Path("out"), "fileprefix": "p_", "timeframe": None}
+        assert plotfile(config, "iostat", "sda", "%util") == Path("out/p_iostat.sda._util.png")
+        config["timeframe"] = "2018-05-16 00:01:16,2018-05-16 17:04:15"
+        assert plotfile(config, "mgstat", "r/s") == Path(
+            "out/p_mgstat.r_s.2018-05-16 00.01.16,2018-05-16 17.04.15.png"
+        )
+
+    def test_heatmap_order(self):
+        matrix = pd.DataFrame(
+            [[1, 1, 1], [0, 0, 90], [5, 5, 5]], index=["sda", "sdb", "sdc"]
+        )
+        assert list(heatmap_order(matrix, {"heatmap_sort": "load"})) == ["sdb", "sdc", "sda"]
+        assert list(heatmap_order(matrix, {"heatmap_sort": "peak"})) == ["sdb", "sdc", "sda"]
+        matrix[2] = [1, 0, 5]
+        assert list(heatmap_order(matrix, {"heatmap_sort": "load"})) == ["sdc", "sda", "sdb"]
+        assert list(heatmap_order(matrix, {"heatmap_sort": "name"})) == ["sda", "sdb", "sdc"]
+
+    def test_plotcache(self, tmp_path):
+        config = {"timeframe": None, "plotcache": load_manifest(tmp_path)}
+        key = plot_key(config, "genericplot", "Glorefs", b"data")
+        first = tmp_path / "mgstat.Glorefs.png"
+        assert not plot_cached(config, first, key)
+        first.write_bytes(b"png")
+        remember_plot(config, first, key)
+        save_manifest(tmp_path, config["plotcache"])
+
+        config = {"timeframe": None, "plotcache": load_manifest(tmp_path)}
+        assert plot_cached(config, first, key)
+        # same data under a new prefix is copied, other data or settings are not
+        renamed = tmp_path / "x_mgstat.Glorefs.png"
+        assert plot_cached(config, renamed, key)
+        assert renamed.read_bytes() == b"png"
+        assert not plot_cached(config, first, plot_key(config, "genericplot", "Glorefs", b"other"))
+        config["plotting"] = {"dim": "3,1"}
+        assert not plot_cached(config, first, plot_key(config, "genericplot", "Glorefs", b"data"))
+
+    def test_plotcache_htmlreport(self, tmp_path):
+        # --html-report sets config["title"], which isn't in the images: no plot is re-rendered
+        df = pd.DataFrame(
+            {"Glorefs": [1, 2, 3]},
+            index=pd.date_range("2018-05-16 00:01:00", periods=3, freq="s"),
+        )
+        config = {"timeframe": None, "plotcache": load_manifest(tmp_path)}
+        png = tmp_path / "mgstat.Glorefs.png"
+        png.write_bytes(b"png")
+        key = plot_key(
+            config, "genericplot", "Glorefs", data_digest(df["Glorefs"]) + b"None",
+            generic_title(df, "Glorefs", None),
+        )
+        remember_plot(config, png, key)
+        save_manifest(tmp_path, config["plotcache"])
+
+        config = {"timeframe": None, "plotcache": load_manifest(tmp_path), "title": "pbuttons.html"}
+        dispatch_plot(df, "Glorefs", png, config)
+        assert config["plotcache"] == {png.name: key}
+        assert png.read_bytes() == b"png"
@@ -0,0 +1,60 @@
+from yape.parsepbuttons import parsepbuttons
+from yape.processes import process_growth, seconds, tasklist_rows, to_markdown, top_processes
+
+import sqlite3
+
+HEADER = "S UID        PID  PPID  C PRI  NI   RSS    SZ WCHAN  STIME TTY          TIME CMD\n"
+
+
+def ps_section(n, iris_rss, iris_time):
+    return (
+        '<div id="ps -elfy_' + str(n) + '"><b>ps -elfy_' + str(n) + "</b></div>\n<pre>\n"
+        + HEADER
+        + "S root         1     0  0  80   0  4044 48451 ep_pol Apr20 ?        00:00:31 /usr/lib/systemd/systemd --switched-root\n"
+        + "S irisusr   2345     1  5  80   0 " + str(iris_rss) + "  9000 -      Apr20 ?        " + iris_time + " /usr/irissys/bin/irisdb -s/usr/irissys/mgr -w/usr/irissys/mgr\n"
+        + "R root      3000     2 12  80   0     0     0 -      10:01 ?        00:00:00 [kworker/0:1]\n"
+        + '</pre><a href="#Topofpage">Back to top</a>\n'
+    )
+
+
+WIDTHS = [25, 8, 16, 11, 12, 15, 50, 12, 72]
+TASKLIST = "\n".join(
+    [
+        "Image Name                     PID Session Name        Session#    Mem Usage Status          User Name                                              CPU Time Window Title",
+        " ".join("=" * w for w in WIDTHS),
+    ]
+    + [
+        " ".join(v.ljust(w) if i in (0, 2, 5, 6, 8) else v.rjust(w) for i, (v, w) in enumerate(zip(row, WIDTHS)))
+        for row in [
+            ["System Idle Process", "0", "Services", "0", "24 K", "Unknown", "NT AUTHORITY\\SYSTEM", "2087:22:32", "N/A"],
+            ["cache.exe", "4321", "Services", "0", "1,234,567 K", "Unknown", "NT AUTHORITY\\SYSTEM", "1:02:03", "N/A"],
+        ]
+    ]
+)
+
+
+class TestProcesses:
+    def test_ps(self, tmp_path):
+        file = tmp_path / "ps.html"
+        file.write_text(
+            "<html><body>\n<b>Product Version String: Cache for UNIX (Red Hat Enterprise Linux for x86-64)</b>\n"
+            + ps_section(1, 204800, "1-02:00:00")
+            + ps_section(2, 409600, "1-03:00:00")
+            + "</body></html>\n"
+        )
+        db = sqlite3.connect(":memory:")
+        parsepbuttons(file, db)
+        assert db.execute("SELECT count(*) FROM processes").fetchone()[0] == 6
+        top = top_processes(db, "rss", 1)
+        assert [(r[1], r[3], r[5], r[6]) for r in top] == [(1, 2345, 204800, "irisdb"), (2, 2345, 409600, "irisdb")]
+        assert top_processes(db, "cpu", 1)[0][6] == "kworker"
+        growth = process_growth(db, 1)[0]
+        assert growth[1:3] == (2345, "irisdb")
+        assert growth[7:9] == (204800, 3600)
+        assert "irisdb" in to_markdown(db)
+
+    def test_tasklist(self):
+        rows = tasklist_rows(TASKLIST.splitlines(True))
+        assert rows[1]["Image Name"] == "cache.exe"
+        assert rows[1]["Mem Usage"] == "1,234,567 K"
+        assert seconds(rows[0]["CPU Time"]) == 2087 * 3600 + 22 * 60 + 32
@@ -0,0 +1,56 @@
+from yape.parsepbuttons import parsepbuttons
+from yape.rollups import build_rollups, choose_resolution, read_rollup, rollup_series
+from yape.timeline import build_timeline
+
+from pathlib import Path
+import sqlite3
+
+SAMPLE = Path(__file__).parent / "data" / "pbuttons_linux.html"
+
+
+class TestRollups:
+    def test_build(self):
+        db = sqlite3.connect(":memory:")
+        parsepbuttons(SAMPLE, db)
+        build_timeline(db)
+        build_rollups(db)
+        row = db.execute(
+            "SELECT min, max, avg, last, samples FROM rollup_1m WHERE section = 'iostat' AND device = 'sda' AND \"column\" = 'r/s' ORDER BY datetime"
+        ).fetchone()
+        raw = [r[0] for r in db.execute("SELECT \"r/s\" FROM iostat WHERE Device = 'sda' ORDER BY rowid LIMIT 6").fetchall()]
+        assert row == (min(raw), max(raw), sum(raw) / 6, raw[-1], 6)
+        build_rollups(db)
+        assert db.execute("SELECT count(*) FROM rollups_meta").fetchone()[0] == 1
+
+    def test_choose_resolution(self):
+        assert choose_resolution("2018-01-01", "2018-01-08", 100) == "1h"
+        assert choose_resolution("2018-01-01", "2018-01-02", 1000) == "1m"
+        assert choose_resolution("2018-01-01 10:00", "2018-01-01 11:00", 1000) is None
+
+    def test_read(self):
+        db = sqlite3.connect(":memory:")
+        parsepbuttons(SAMPLE, db)
+        build_timeline(db)
+        build_rollups(db)
+        resolution, rows = read_rollup(db, "mgstat", points=1, columns=["Glorefs"])
+        assert resolution == "1h"
+        assert list(rows["column"].unique()) == ["Glorefs"]
+        resolution, rows = read_rollup(db, "mgstat", points=100, columns=["Glorefs"])
+        assert resolution == "raw"
+        assert rows.shape[0] == 12
+
+    def test_series(self):
+        db = sqlite3.connect(":memory:")
+        parsepbuttons(SAMPLE, db)
+        build_timeline(db)
+        assert rollup_series(db, "iostat", "sda", "r/s", points=30) is None
+        build_rollups(db)
+        # the range runs to the end of the last hour bucket, 60 one minute buckets
+        series = rollup_series(db, "iostat", "sda", "r/s", points=30)
+        rows = db.execute(
+            "SELECT min, max FROM rollup_1m WHERE section = 'iostat' AND device = 'sda' AND \"column\" = 'r/s' ORDER BY datetime"
+        ).fetchall()
+        assert list(series.values) == [v for r in rows for v in r]
+        assert series.index.is_monotonic_increasing
+        # enough samples for the range, plot those
+        assert rollup_series(db, "iostat", "sda", "r/s", points=100) is None
@@ -0,0 +1,63 @@
+import subprocess
+from pathlib import Path
+import sys
+
+# modules that make up most of yape's start up time, they must only be loaded
+# by the stages that actually plot or crunch data
+HEAVY_MODULES = ["pandas", "numpy", "matplotlib", "pytz", "pkg_resources", "yaml"]
+
+# generous, a cold import of yape.main without the heavy modules takes a fraction of this
+IMPORT_BUDGET = 0.5
+
+
+def run_python(code):
+    return subprocess.run(
+        [sys.executable, "-c", code], stdout=subprocess.PIPE, check=True
+    ).stdout.decode()
+
+
+class TestStartup:
+    def test_no_heavy_imports(self):
+        loaded = run_python(
+            "import sys, yape, yape.main, yape.command_line\n"
+            "print(' '.join(sorted(sys.modules)))"
+        ).split()
+        for module in HEAVY_MODULES:
+            assert module not in loaded, module + " imported at start up"
+
+    def test_version_without_heavy_imports(self):
+        loaded = run_python(
+            "import sys\n"
+            "from yape.main import getVersion\n"
+            "getVersion()\n"
+            "print(' '.join(sorted(sys.modules)))"
+        ).split()
+        assert "pkg_resources" not in loaded
+
+    def test_import_time(self):
+        # best of a few runs to keep a busy machine from failing the build
+        timings = []
+        for _ in range(3):
+            timings.append(
+                float(
+                    run_python(
+                        "import time\n"
+                        "start = time.perf_counter()\n"
+                        "import yape.main\n"
+                        "print(time.perf_counter() - start)"
+                    )
+                )
+            )
+        assert min(timings) < IMPORT_BUDGET
+
+    def test_csv_export_without_pandas(self, tmp_path):
+        # parsing and exporting a capture with timestamps needs neither pandas nor numpy
+        sample = Path(__file__).parent / "data" / "pbuttons_linux.html"
+        loaded = run_python(
+            "import sys\n"
+            "from yape.main import parse_args, yape2\n"
+            "yape2(parse_args(['-q', '-c', '-o', " + repr(str(tmp_path)) + ", " + repr(str(sample)) + "]))\n"
+            "print(' '.join(sorted(sys.modules)))"
+        ).split()
+        assert (tmp_path / "mgstat.csv").exists()
+        assert "pandas" not in loaded
@@ -0,0 +1,38 @@
+from yape.summary import summary, to_markdown
+
+import sqlite3
+
+
+def sample_db():
+    db = sqlite3.connect(":memory:")
+    db.execute('CREATE TABLE mgstat("datetime" TEXT, "Glorefs" INTEGER)')
+    db.execute('CREATE TABLE iostat("datetime" TEXT, "Device" TEXT, "%util" REAL)')
+    for i in range(101):
+        stamp = "05/16/2018 %02d:%02d:00" % (9 + i // 60, i % 60)
+        db.execute("INSERT INTO mgstat VALUES (?, ?)", [stamp, 1000 - i])
+        db.execute("INSERT INTO iostat VALUES (?, 'sda', ?)", [stamp, i])
+        db.execute("INSERT INTO iostat VALUES (?, 'sdb', NULL)", [stamp])
+    return db
+
+
+class TestSummary:
+    def test_summary(self):
+        result = summary(sample_db(), {})
+        glorefs = result["mgstat"][""]["Glorefs"]
+        assert glorefs["count"] == 101
+        assert glorefs["max"] == 1000
+        assert glorefs["time of max"] == "2018-05-16 09:00:00"
+        util = result["iostat"]["sda"]["%util"]
+        assert (util["p50"], util["p95"], util["p99"]) == (50, 95, 99)
+        assert util["time of max"] == "2018-05-16 10:40:00"
+        # nothing but empty values
+        assert "sdb" not in result["iostat"]
+
+    def test_timeframe(self):
+        config = {"timeframe": "2018-05-16 09:10:00,2018-05-16 09:19:00"}
+        util = summary(sample_db(), config)["iostat"]["sda"]["%util"]
+        assert (util["count"], util["max"]) == (10, 19)
+
+    def test_markdown(self):
+        text = to_markdown(summary(sample_db(), {}))
+        assert "| sda | %util | 101 | 50.00 | 50.00 | 95.00 | 99.00 | 100.00 | 2018-05-16 10:40:00 |" in text
@@ -0,0 +1,32 @@
+from yape.catalog import write_catalog
+from yape.parsepbuttons import parsepbuttons
+from yape.textindex import index_capture, search, search_main, text_sections
+
+from pathlib import Path
+import sqlite3
+
+SAMPLE = Path(__file__).parent / "data" / "pbuttons_linux.html"
+
+
+class TestTextIndex:
+    def test_sections(self):
+        db = sqlite3.connect(":memory:")
+        parsepbuttons(SAMPLE, db)
+        assert "sysctl-a" in text_sections(db)
+        assert "mgstat" not in text_sections(db)
+
+    def test_index_and_search(self, tmp_path, capsys):
+        db = sqlite3.connect(":memory:")
+        parsepbuttons(SAMPLE, db)
+        index = sqlite3.connect(str(tmp_path / "index.db"))
+        lines = index_capture(index, db)
+        assert lines > 0
+        # same file and sha256, nothing is added twice
+        assert index_capture(index, db) == lines
+        assert index.execute("SELECT count(*) FROM textindex").fetchone()[0] == lines
+        hits = search(index, "kernel.shmmax")
+        assert [(h[1], h[2]) for h in hits] == [("sysctl-a", 3)]
+        assert search(index, "kernel.shmmax", section="mount") == []
+        index.close()
+        assert search_main([str(tmp_path / "index.db"), "kernel.shmmax"]) == 0
+        assert "sysctl-a:3: kernel.shmmax" in capsys.readouterr().out
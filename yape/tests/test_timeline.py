@@ -0,0 +1,52 @@
+from yape.sections import load_section
+from yape.timeline import build_timeline
+
+import sqlite3
+
+
+def sample_db():
+    db = sqlite3.connect(":memory:")
+    db.execute('CREATE TABLE mgstat("datetime" TEXT, "Glorefs" INTEGER)')
+    db.execute('CREATE TABLE vmstat("r" INTEGER, "id" INTEGER)')
+    db.execute('CREATE TABLE iostat("datetime" TEXT, "Device" TEXT, "%util" REAL)')
+    # every 10s, 09:00:30 and 09:00:40 are missing, 09:01:00 is there twice
+    for second in [0, 10, 20, 50, 60, 60, 70]:
+        stamp = "05/16/2018 09:%02d:%02d" % (second // 60, second % 60)
+        db.execute("INSERT INTO mgstat VALUES (?, ?)", [stamp, second])
+    for i in range(4):
+        db.execute("INSERT INTO vmstat VALUES (?, ?)", [i, 90])
+        for device in ["sda", "sdb"]:
+            db.execute("INSERT INTO iostat VALUES ('05/16/18', ?, ?)", [device, i])
+    return db
+
+
+class TestTimeline:
+    def test_build_timeline(self):
+        db = sample_db()
+        build_timeline(db)
+        intervals = {r[0]: r[1:] for r in db.execute("select * from intervals").fetchall()}
+        assert intervals["mgstat"] == (10.0, 7, 1, "2018-05-16 09:00:00", "2018-05-16 09:01:10", 2, 1, 0)
+        assert intervals["iostat"][:3] == (10.0, 8, 2)
+        assert intervals["vmstat"][-1] == 1
+        gaps = db.execute("select * from gaps order by kind").fetchall()
+        assert gaps == [
+            ("mgstat", "", "duplicate", "2018-05-16 09:01:00", "2018-05-16 09:01:00", 1),
+            ("mgstat", "", "gap", "2018-05-16 09:00:20", "2018-05-16 09:00:50", 2),
+        ]
+
+    def test_synthesised(self):
+        db = sample_db()
+        build_timeline(db)
+        # mgstat start, one sample every mgstat interval, counted per device
+        vmstat = load_section(db, "vmstat")
+        assert [str(t) for t in vmstat.index] == [
+            "2018-05-16 09:00:00",
+            "2018-05-16 09:00:10",
+            "2018-05-16 09:00:20",
+            "2018-05-16 09:00:30",
+        ]
+        iostat = load_section(db, "iostat", "Device")
+        assert str(iostat[iostat["Device"] == "sdb"].index[-1]) == "2018-05-16 09:00:30"
+        # nothing to do the second time
+        build_timeline(db)
+        assert db.execute("select count(*) from timeline_meta").fetchone()[0] == 1
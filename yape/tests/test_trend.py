@@ -0,0 +1,40 @@
+from yape.trend import find_trends, robust_fit
+
+import sqlite3
+
+import numpy
+
+
+def sample_db():
+    db = sqlite3.connect(":memory:")
+    db.execute('CREATE TABLE iostat("datetime" TEXT, "Device" TEXT, "%util" REAL)')
+    for day in range(10):
+        for hour in range(24):
+            stamp = "05/%02d/2018 %02d:00:00" % (10 + day, hour)
+            samples = day * 24 + hour
+            # sda grows by 2 a day with a few huge spikes, sdb is flat
+            util = 50 + 2 * samples / 24 + (40 if samples % 50 == 0 else 0)
+            db.execute("INSERT INTO iostat VALUES (?, 'sda', ?)", [stamp, util])
+            db.execute("INSERT INTO iostat VALUES (?, 'sdb', ?)", [stamp, 30 + samples % 3])
+    return db
+
+
+class TestTrend:
+    def test_robust_fit(self):
+        t = numpy.arange(100, dtype="float64")
+        values = numpy.column_stack([3 + 0.5 * t, 7 - t])
+        values[[10, 50, 90], 0] += 1000
+        values[20, 1] = numpy.nan
+        intercept, slope = robust_fit(t, values)
+        assert numpy.allclose(slope, [0.5, -1], atol=1e-3)
+        assert numpy.allclose(intercept, [3, 7], atol=1e-2)
+
+    def test_find_trends(self):
+        rows = find_trends(sample_db(), {})
+        sda, sdb = rows
+        assert sda[:3] == ["iostat", "sda", "%util"]
+        assert abs(sda[7] - 2) < 0.01
+        # from about 70 at the end to 100
+        assert abs(sda[11] - 15) < 0.5
+        # flat, reaching 100 takes forever
+        assert abs(sdb[7]) < 0.01 and sdb[11] > 10000
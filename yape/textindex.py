@@ -0,0 +1,139 @@
+import argparse
+import logging
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+from yape.catalog import read_catalog
+
+# A full-text index (sqlite FTS5) over the text sections of any number of captures: one row
+# per line with its section, pButtons file and line number. It can live in the capture's
+# own database or in a separate one collecting many captures, "yape search" queries it.
+
+TEXTINDEX = "textindex"
+TEXTINDEX_FILES = "textindex_files"
+DEFAULT_LIMIT = 50
+
+
+def text_sections(db):
+    ''' Returns the tables of db that hold the lines of a text section (one "line" column) '''
+    sections = []
+    tables = db.execute("SELECT name FROM sqlite_master WHERE type='table' ORDER BY rowid").fetchall()
+    for (name,) in tables:
+        if name.startswith(TEXTINDEX):
+            continue
+        columns = [r[1] for r in db.execute('PRAGMA table_info("' + name + '")').fetchall()]
+        if columns == ["line"]:
+            sections.append(name)
+    return sections
+
+
+def create_index(index) -> None:
+    index.execute(
+        'CREATE VIRTUAL TABLE IF NOT EXISTS "'
+        + TEXTINDEX
+        + '" USING fts5(text, section UNINDEXED, file UNINDEXED, line UNINDEXED)'
+    )
+    index.execute(
+        'CREATE TABLE IF NOT EXISTS "' + TEXTINDEX_FILES + '" (file TEXT PRIMARY KEY, sha256 TEXT, lines INTEGER, indexed TEXT)'
+    )
+
+
+def capture_source(db, file=None):
+    ''' Returns the pButtons file and its sha256 as recorded in the catalog of db '''
+    # resolved, the same relative name run from two directories are two captures
+    catalog = read_catalog(db) or {}
+    for entry in catalog.values():
+        if entry.get("source") is not None:
+            return str(Path(entry["source"]).resolve()), entry.get("sha256")
+    return (None if file is None else str(Path(file).resolve())), None
+
+
+def index_capture(index, db, file=None) -> int:
+    ''' Adds the text sections of the capture in db to the index, replacing what was indexed for the same file.
+    Returns the number of lines indexed '''
+    create_index(index)
+    source, digest = capture_source(db, file)
+    if source is None:
+        source = ""
+    known = index.execute(
+        'SELECT sha256, lines FROM "' + TEXTINDEX_FILES + '" WHERE file = ?', [source]
+    ).fetchone()
+    if known is not None and digest is not None and known[0] == digest:
+        logging.info(source + " is already in the text index")
+        return known[1]
+    index.execute('DELETE FROM "' + TEXTINDEX + '" WHERE file = ?', [source])
+    lines = 0
+    for section in text_sections(db):
+        rows = db.execute('SELECT line, rowid FROM "' + section + '" ORDER BY rowid').fetchall()
+        index.executemany(
+            'INSERT INTO "' + TEXTINDEX + '" (text, section, file, line) VALUES (?, ?, ?, ?)',
+            [(text, section, source, line) for text, line in rows],
+        )
+        lines += len(rows)
+    index.execute(
+        'INSERT OR REPLACE INTO "' + TEXTINDEX_FILES + '" VALUES (?, ?, ?, ?)',
+        [source, digest, lines, time.strftime("%Y-%m-%d %H:%M:%S")],
+    )
+    index.commit()
+    logging.info("indexed " + str(lines) + " lines of " + source)
+    return lines
+
+
+def has_index(db):
+    cur = db.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", [TEXTINDEX])
+    return cur.fetchone() is not None
+
+
+def match_query(terms):
+    ''' Returns an FTS5 query finding lines holding all terms, each taken literally (eg. kernel.shmmax) '''
+    return " ".join('"' + t.replace('"', '""') + '"' for t in terms.split())
+
+
+def search(index, terms, limit=DEFAULT_LIMIT, section=None, raw=False):
+    ''' Returns [(file, section, line, text)] of the best matching lines, raw passes terms as FTS5 query '''
+    query = terms if raw else match_query(terms)
+    if query.strip() == "":
+        return []
+    sql = 'SELECT file, section, line, text FROM "' + TEXTINDEX + '" WHERE "' + TEXTINDEX + '" MATCH ?'
+    params = [query]
+    if section is not None:
+        sql += " AND section = ?"
+        params.append(section)
+    sql += " ORDER BY rank LIMIT ?"
+    params.append(limit)
+    return index.execute(sql, params).fetchall()
+
+
+def search_main(argv=None) -> int:
+    ''' yape search: prints file:section:line: text for every hit '''
+    parser = argparse.ArgumentParser(
+        prog="yape search",
+        description="Search the text sections (sysctl-a, ps, cpffile, cstat, license, ...) of the captures in a full-text index",
+    )
+    parser.add_argument("index", type=Path, help="database built with yape --textindex")
+    parser.add_argument("terms", nargs="+", help="words that must all be on the line, eg. kernel.shmmax")
+    parser.add_argument("--section", help="only search this section, eg. sysctl-a")
+    parser.add_argument(
+        "--limit", type=int, default=DEFAULT_LIMIT, help="number of hits shown. The default is " + str(DEFAULT_LIMIT)
+    )
+    parser.add_argument(
+        "--fts", action="store_true", help="pass the terms as an FTS5 query, eg. 'shm* NOT shmall'"
+    )
+    args = parser.parse_args(sys.argv[2:] if argv is None else argv)
+    if not args.index.is_file():
+        print("no such index: " + str(args.index))
+        return 1
+    index = sqlite3.connect(args.index.resolve().as_uri() + "?mode=ro", uri=True)
+    if not has_index(index):
+        print(str(args.index) + " has no text index, build it with yape --textindex")
+        return 1
+    try:
+        hits = search(index, " ".join(args.terms), args.limit, args.section, args.fts)
+    except sqlite3.OperationalError as e:
+        print("invalid search: " + str(e))
+        return 1
+    for file, section, line, text in hits:
+        print(file + ":" + section + ":" + str(line) + ": " + text.rstrip("\n"))
+    return 0
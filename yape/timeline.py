@@ -0,0 +1,190 @@
+import logging
+
+import numpy
+import pandas as pd
+
+from yape.catalog import has_timestamps, refresh_columns, update_catalog
+from yape.sections import TIMESERIES, parse_datetimes, table_exists
+
+# Sampling interval, gaps and duplicate samples of every time series section, worked out
+# once after parsing. Sections without (complete) timestamps, eg. vmstat and iostat on some
+# systems, get a time axis synthesised from the start and interval of mgstat stored in their
+# datetime column, so every later stage can take the timestamps as they are.
+
+GAPS = "gaps"
+INTERVALS = "intervals"
+TIMELINE_META = "timeline_meta"
+# a step this many intervals long means samples are missing
+GAP_FACTOR = 1.5
+FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def table_columns(db, section):
+    return [r[1] for r in db.execute('PRAGMA table_info("' + section + '")').fetchall()]
+
+
+def device_column(db, section, split_on):
+    # the name of the column section is split on, as spelled by the OS tool, None if there is none
+    if split_on is None:
+        return None
+    for c in table_columns(db, section):
+        if c.lower() == split_on.lower():
+            return c
+    return None
+
+
+def read_times(db, section, split_on=None):
+    ''' Returns (seconds since epoch, device of every row) in rowid order '''
+    columns = ["datetime"]
+    split_on = device_column(db, section, split_on)
+    if split_on is not None:
+        columns.append(split_on)
+    data = pd.read_sql_query(
+        "SELECT " + ", ".join('"' + c + '"' for c in columns) + ' FROM "' + section + '" ORDER BY rowid',
+        db,
+    )
+    if data.shape[0] == 0:
+        return numpy.zeros(0, dtype="int64"), numpy.zeros(0, dtype=object)
+    seconds = parse_datetimes(data["datetime"]).values.astype("datetime64[s]").astype("int64")
+    if split_on is None:
+        devices = numpy.full(data.shape[0], "", dtype=object)
+    else:
+        devices = data[split_on].astype(str).to_numpy(dtype=object)
+    return seconds, devices
+
+
+def steps(seconds, devices):
+    ''' Returns the rows sorted by device and time, and the step to the previous sample of the same device '''
+    order = numpy.lexsort((seconds, devices))
+    seconds = seconds[order]
+    devices = devices[order]
+    step = numpy.diff(seconds, prepend=seconds[:1])
+    same = numpy.r_[False, devices[1:] == devices[:-1]]
+    return seconds, devices, numpy.where(same, step, -1)
+
+
+def infer_interval(step):
+    ''' Returns the usual number of seconds between two samples, None if it can't be told '''
+    positive = step[step > 0]
+    if len(positive) == 0:
+        return None
+    return float(numpy.median(positive))
+
+
+def synthesise(db, section, split_on, start, interval) -> None:
+    ''' Stores start + n * interval as datetime of the n-th row (per device) of section '''
+    if "datetime" not in table_columns(db, section):
+        db.execute('ALTER TABLE "' + section + '" ADD COLUMN datetime TEXT')
+    split_on = device_column(db, section, split_on)
+    query = 'SELECT rowid' + ("" if split_on is None else ', "' + split_on + '"')
+    rows = pd.read_sql_query(query + ' FROM "' + section + '" ORDER BY rowid', db)
+    if split_on is None:
+        position = numpy.arange(rows.shape[0])
+    else:
+        position = rows.groupby(rows.columns[1], sort=False).cumcount().to_numpy()
+    stamps = (pd.Timestamp(start) + pd.to_timedelta(position * interval, unit="s")).strftime(FORMAT)
+    db.executemany(
+        'UPDATE "' + section + '" SET datetime = ? WHERE rowid = ?',
+        zip(stamps, rows["rowid"].tolist()),
+    )
+    logging.info(
+        "no timestamps for " + section + ", synthesised from mgstat every " + str(interval) + "s"
+    )
+
+
+def signature(db):
+    parts = []
+    for name in TIMESERIES:
+        if table_exists(db, name):
+            parts.append(
+                name + ":" + str(db.execute('SELECT count(*), max(rowid) FROM "' + name + '"').fetchone())
+            )
+    return ",".join(parts)
+
+
+def build_timeline(db) -> None:
+    ''' Synthesises missing timestamps and stores the gaps and intervals tables, unless they are up to date '''
+    key = signature(db)
+    db.execute('CREATE TABLE IF NOT EXISTS "' + TIMELINE_META + '" (key TEXT)')
+    cached = db.execute('SELECT key FROM "' + TIMELINE_META + '"').fetchone()
+    if cached is not None and cached[0] == key and table_exists(db, INTERVALS):
+        logging.debug("timeline is up to date")
+        return None
+
+    base = None
+    if table_exists(db, "mgstat") and has_timestamps(db, "mgstat"):
+        seconds, devices = read_times(db, "mgstat")
+        if len(seconds) > 0:
+            base = (pd.Timestamp(int(seconds.min()), unit="s"), infer_interval(steps(seconds, devices)[2]))
+
+    gaps = []
+    intervals = []
+    for name, split_on in TIMESERIES.items():
+        if not table_exists(db, name):
+            continue
+        synthesised = not has_timestamps(db, name)
+        if synthesised:
+            if base is None or base[1] is None:
+                logging.warning("no timestamps for " + name + " and no mgstat to take them from")
+                continue
+            synthesise(db, name, split_on, base[0], base[1])
+        seconds, devices = read_times(db, name, split_on)
+        if len(seconds) == 0:
+            continue
+        seconds, devices, step = steps(seconds, devices)
+        interval = infer_interval(step)
+        duplicates = numpy.flatnonzero(step == 0)
+        for i in duplicates:
+            gaps.append([name, devices[i], "duplicate", stamp(seconds[i]), stamp(seconds[i]), 1])
+        missing = 0
+        if interval is not None:
+            late = numpy.flatnonzero(step > GAP_FACTOR * interval)
+            for i in late:
+                count = int(round(step[i] / interval)) - 1
+                missing += count
+                gaps.append(
+                    [name, devices[i], "gap", stamp(seconds[i - 1]), stamp(seconds[i]), count]
+                )
+        intervals.append(
+            [
+                name,
+                interval,
+                len(seconds),
+                len(set(devices)),
+                stamp(seconds.min()),
+                stamp(seconds.max()),
+                missing,
+                len(duplicates),
+                int(synthesised),
+            ]
+        )
+        update_catalog(
+            db, name, start=stamp(seconds.min()), end=stamp(seconds.max()), interval=interval
+        )
+        if synthesised:
+            refresh_columns(db, name)
+        if missing > 0 or len(duplicates) > 0:
+            logging.warning(
+                name + ": " + str(missing) + " samples missing, " + str(len(duplicates)) + " duplicates"
+            )
+
+    db.execute('DROP TABLE IF EXISTS "' + GAPS + '"')
+    db.execute(
+        'CREATE TABLE "' + GAPS + '" (section TEXT, device TEXT, kind TEXT, start TEXT, "end" TEXT, samples INTEGER)'
+    )
+    db.executemany('INSERT INTO "' + GAPS + '" VALUES (?, ?, ?, ?, ?, ?)', gaps)
+    db.execute('DROP TABLE IF EXISTS "' + INTERVALS + '"')
+    db.execute(
+        'CREATE TABLE "'
+        + INTERVALS
+        + '" (section TEXT, interval REAL, samples INTEGER, devices INTEGER, start TEXT, "end" TEXT, missing INTEGER, duplicates INTEGER, synthesised INTEGER)'
+    )
+    db.executemany('INSERT INTO "' + INTERVALS + '" VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', intervals)
+    db.execute('DELETE FROM "' + TIMELINE_META + '"')
+    db.execute('INSERT INTO "' + TIMELINE_META + '" VALUES (?)', [signature(db)])
+    db.commit()
+    return None
+
+
+def stamp(seconds):
+    return pd.Timestamp(int(seconds), unit="s").strftime(FORMAT)
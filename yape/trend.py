@@ -0,0 +1,221 @@
+import logging
+import warnings
+
+import numpy
+
+from yape.derived import derived_ymax, total_tables
+from yape.devices import want_device
+from yape.sections import TIMESERIES, load_section, numeric, split_column
+
+# Linear trends of every time series column (per device or cpu), fitted robustly so that
+# a few spikes don't tilt them: iteratively reweighted least squares with Huber weights.
+# All series of a section are one matrix and are fitted together, every step is a numpy
+# operation over the whole matrix.
+
+TREND = "trend"
+# Huber tuning constant, 95% efficiency for normal residuals
+HUBER_K = 1.345
+ITERATIONS = 10
+# the scale of the residuals is re-estimated in the first iterations only, sorting is the expensive part
+SCALE_ITERATIONS = 3
+# columns with a natural ceiling, more can be set in the config under trend: thresholds:
+DEFAULT_THRESHOLDS = {"%util": 100, "us": 100, "sy": 100, "wa": 100}
+COLUMNS = [
+    "section",
+    "device",
+    "column",
+    "samples",
+    "start",
+    "end",
+    "mean",
+    "slope_per_day",
+    "growth_per_day",
+    "last",
+    "threshold",
+    "days_to_threshold",
+]
+
+
+def column_median(values):
+    ''' Returns the median of every column, ignoring nan '''
+    # numpy.nanmedian goes column by column for large arrays, sorting the matrix doesn't
+    ordered = numpy.sort(values, axis=0)
+    count = (~numpy.isnan(values)).sum(axis=0)
+    low = numpy.take_along_axis(ordered, numpy.maximum((count - 1) // 2, 0)[None, :], axis=0)[0]
+    high = numpy.take_along_axis(ordered, numpy.maximum(count // 2 - (count == 0), 0)[None, :], axis=0)[0]
+    return numpy.where(count > 0, (low + high) / 2, numpy.nan)
+
+
+def robust_fit(t, values, iterations=ITERATIONS):
+    ''' Returns intercept and slope of a Huber fit of every column of values (n x series, nan for missing) over t '''
+    present = ~numpy.isnan(values)
+    y = numpy.where(present, values, 0.0)
+    tt = t * t
+    weights = present.astype("float64")
+    with warnings.catch_warnings(), numpy.errstate(divide="ignore", invalid="ignore"):
+        warnings.simplefilter("ignore", RuntimeWarning)
+        slope = None
+        for iteration in range(iterations):
+            previous = slope
+            # weighted least squares of all columns at once, the sums over t are matrix products
+            wy = weights * y
+            sw = weights.sum(axis=0)
+            st = t @ weights
+            stt = tt @ weights
+            sy = wy.sum(axis=0)
+            sty = t @ wy
+            denominator = sw * stt - st * st
+            slope = numpy.where(denominator > 0, (sw * sty - st * sy) / denominator, numpy.nan)
+            intercept = (sy - slope * st) / sw
+            if previous is not None and numpy.allclose(slope, previous, rtol=1e-6, equal_nan=True):
+                break
+            residuals = numpy.abs(y - intercept - numpy.outer(t, slope))
+            if iteration < SCALE_ITERATIONS:
+                residuals[~present] = numpy.nan
+                scale = 1.4826 * column_median(residuals)
+            u = residuals / (HUBER_K * scale)
+            weights = numpy.where(u > 1, 1 / u, 1.0) * present
+    return intercept, slope
+
+
+def thresholds(config):
+    ''' Returns {column: threshold} for the time to threshold projection '''
+    limits = dict(DEFAULT_THRESHOLDS)
+    limits.update(derived_ymax(config))
+    try:
+        limits.update({str(k): float(v) for k, v in config["trend"]["thresholds"].items()})
+    except (KeyError, AttributeError):
+        pass
+    return limits
+
+
+def section_matrix(db, config, name, split_on=None):
+    ''' Returns the series of a section as one DataFrame of floats, columns are (column, device) '''
+    data = load_section(db, name, split_on)
+    if data is None:
+        return None
+    timeframe = config.get("timeframe")
+    if timeframe is not None:
+        start, end = timeframe.split(",")
+        data = data[(data.index >= start) & (data.index <= end)]
+    if split_on is None:
+        values = numeric(data)
+        values.columns = [(c, "") for c in values.columns.values]
+    else:
+        split_on = split_column(data, split_on)
+        data = data[[want_device(config, name, d) for d in data[split_on]]]
+        values = numeric(data, skip=(split_on,))
+        values[split_on] = data[split_on].astype(str)
+        values = values.reset_index().pivot_table(index="datetime", columns=split_on, aggfunc="mean")
+        values.columns = list(values.columns)
+    values = values[~values.index.duplicated(keep="first")].sort_index()
+    if values.shape[0] < 3 or values.shape[1] == 0:
+        return None
+    return values
+
+
+def section_trends(db, config, name, split_on=None):
+    ''' Returns one row (see COLUMNS) per series of a section '''
+    values = section_matrix(db, config, name, split_on)
+    if values is None:
+        return []
+    days = (values.index - values.index[0]).total_seconds().to_numpy() / 86400
+    matrix = values.to_numpy(dtype="float64")
+    intercept, slope = robust_fit(days, matrix)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        mean = numpy.nanmean(matrix, axis=0)
+    samples = (~numpy.isnan(matrix)).sum(axis=0)
+    last = intercept + slope * days[-1]
+    limits = thresholds(config)
+    start = values.index[0].strftime("%Y-%m-%d %H:%M:%S")
+    end = values.index[-1].strftime("%Y-%m-%d %H:%M:%S")
+    rows = []
+    for i, (column, device) in enumerate(values.columns):
+        if samples[i] < 3 or numpy.isnan(slope[i]):
+            continue
+        growth = slope[i] / abs(mean[i]) if mean[i] != 0 else None
+        threshold = limits.get(column)
+        remaining = None
+        if threshold is not None and slope[i] > 0:
+            remaining = max(0.0, float((threshold - last[i]) / slope[i]))
+        rows.append(
+            [
+                name,
+                device,
+                str(column),
+                int(samples[i]),
+                start,
+                end,
+                float(mean[i]),
+                float(slope[i]),
+                None if growth is None else float(growth),
+                float(last[i]),
+                threshold,
+                remaining,
+            ]
+        )
+    return rows
+
+
+def find_trends(db, config):
+    ''' Returns the trends of all series, the fastest growing first '''
+    sections = dict(TIMESERIES)
+    sections.update({table: None for table in total_tables(db)})
+    rows = []
+    for name, split_on in sections.items():
+        rows.extend(section_trends(db, config, name, split_on))
+    rows.sort(key=lambda r: -numpy.inf if r[8] is None else r[8], reverse=True)
+    return rows
+
+
+def store_trends(db, rows) -> None:
+    ''' Replaces the trend table with rows '''
+    db.execute('DROP TABLE IF EXISTS "' + TREND + '"')
+    db.execute('CREATE TABLE "' + TREND + '" (' + ", ".join('"' + c + '"' for c in COLUMNS) + ")")
+    db.executemany(
+        'INSERT INTO "' + TREND + '" VALUES (' + ", ".join(["?"] * len(COLUMNS)) + ")", rows
+    )
+    db.commit()
+
+
+def number(value):
+    if value is None:
+        return ""
+    if abs(value) >= 1000:
+        return "{:,.0f}".format(value)
+    return "{:.2f}".format(value)
+
+
+def to_markdown(rows, top=50):
+    ''' Returns the fastest growing series as a markdown table '''
+    lines = [
+        "## Fastest growing",
+        "",
+        "| section | device | column | mean | slope/day | growth/day | last | threshold | days to threshold |",
+        "|---|---|---|---:|---:|---:|---:|---:|---:|",
+    ]
+    for r in [r for r in rows if r[8] is not None and r[8] > 0][:top]:
+        cells = r[:3] + [
+            number(r[6]),
+            number(r[7]),
+            "{:+.1%}".format(r[8]),
+            number(r[9]),
+            number(r[10]),
+            number(r[11]),
+        ]
+        lines.append("| " + " | ".join(c.replace("|", "\\|") for c in cells) + " |")
+    return "\n".join(lines) + "\n"
+
+
+def write_trends(db, config) -> None:
+    ''' Stores the trend table and writes the fastest growing series to trend.md '''
+    rows = find_trends(db, config)
+    store_trends(db, rows)
+    logging.info("fitted " + str(len(rows)) + " trends")
+    basefilename = config["basefilename"]
+    basefilename.mkdir(parents=True, exist_ok=True)
+    file = basefilename / (config["fileprefix"] + "trend.md")
+    logging.info("creating " + str(file))
+    with open(file, "w", encoding="utf-8") as f:
+        f.write(to_markdown(rows))
@@ -0,0 +1,15 @@
+def getVersion():
+    try:
+        from importlib.metadata import version, PackageNotFoundError
+    except ImportError:
+        # python < 3.8
+        from pkg_resources import get_distribution, DistributionNotFound
+
+        try:
+            return get_distribution("yape").version
+        except DistributionNotFound:
+            return ""
+    try:
+        return version("yape")
+    except PackageNotFoundError:
+        return ""
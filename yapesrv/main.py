@@ -13,59 +13,66 @@ from bokeh.io import curdoc
 from bokeh.models.widgets import Tabs
 
 
-import sqlite3
 
 # Each tab is drawn by one script
 from scripts.mgstat_tab import mgstat_tab
 from scripts.perfmon_tab import perfmon_tab
 from scripts.generic_tab import generic_tab
-from scripts.cstat_tab import cstat_tab
+from scripts.cstat_tab import CSTATS, cstat_tab
 from scripts.ss_tab import ss_tab
-from scripts.pselfy_tab import pselfy_tab
+from scripts.pselfy_tab import PSELFY, pselfy_tab
 from scripts.vmstat_tab import vmstat_tab
 from scripts.iostat_tab import iostat_tab
+from scripts.lazy_tabs import lazy_tabs
+from scripts.search_tab import search_tab
 
-from yape import parsepbuttons
+from scripts.datastore import session_connection, text_index
+from yape.textindex import text_sections
 
 
 parser = argparse.ArgumentParser(
     description="Provide an interactive visualization to pButtons"
 )
-parser.add_argument("pButtons_file_name", help="Path and pButtons to use")
+parser.add_argument(
+    "pButtons_file_name",
+    help="Path and pButtons to use, or a database written with yape --filedb, or a directory written with yape -c",
+)
+parser.add_argument(
+    "--config",
+    dest="configfile",
+    help="specify the location of a config file. ~/.yape.yml is used by default.",
+)
 args = parser.parse_args()
 
 try:
-    db = sqlite3.connect(":memory:")
-    parsepbuttons(args.pButtons_file_name, db)
+    # parsed once per server process, each session reads through its own connection
+    db = session_connection(args.pButtons_file_name, args.configfile)
+    curdoc().on_session_destroyed(lambda context: db.close())
 
-    # Create each of the tabs
-    mgstat_tab = mgstat_tab(db)
-    perfmon_tab = perfmon_tab(db)
-    license_tab = generic_tab(db, "license")
-    cpffile_tab = generic_tab(db, "cpffile")
-    cstat_tab = cstat_tab(db)
-    ss_tab = ss_tab(db)
-    pselfy_tab = pselfy_tab(db)
-    vmstat_tab = vmstat_tab(db)
-    # iostat_tab = iostat_tab(db)
-    windowsinfo_tab = generic_tab(db, "windowsinfo")
-    tasklist_tab = generic_tab(db, "tasklist")
-    # Put all the tabs into one application
-    # ts=[mgstat_tab,vmstat_tab,perfmon_tab,windowsinfo_tab,license_tab,cpffile_tab,cstat_tab,ss_tab,pselfy_tab,tasklist_tab]
-    ts = [
-        mgstat_tab,
-        vmstat_tab,
-        perfmon_tab,
-        windowsinfo_tab,
-        license_tab,
-        cpffile_tab,
-        cstat_tab,
-        ss_tab,
-        pselfy_tab,
-        tasklist_tab,
-    ]
-    tabs = Tabs(tabs=list(filter(None.__ne__, ts)))
-    # tabs = Tabs(tabs=[vmstat_tab])
+    # Put all the tabs into one application, each one is built when it's first shown
+    tabs = lazy_tabs(
+        db,
+        [
+            ("mgstat", ["mgstat"], lambda: mgstat_tab(db)),
+            ("vmstat", ["vmstat"], lambda: vmstat_tab(db)),
+            ("iostat", ["iostat"], lambda: iostat_tab(db)),
+            ("perfmon", ["perfmon"], lambda: perfmon_tab(db)),
+            ("windowsinfo", ["windowsinfo"], lambda: generic_tab(db, "windowsinfo")),
+            ("license", ["license"], lambda: generic_tab(db, "license")),
+            ("cpffile", ["cpffile"], lambda: generic_tab(db, "cpffile")),
+            ("cstats", CSTATS, lambda: cstat_tab(db)),
+            ("%SS", ["ss1", "ss2", "ss3", "ss4"], lambda: ss_tab(db)),
+            ("ps -elfy", ["processes"] + PSELFY, lambda: pselfy_tab(db)),
+            ("tasklist", ["tasklist"], lambda: generic_tab(db, "tasklist")),
+            (
+                "search",
+                ["textindex"] + text_sections(db),
+                lambda: search_tab(
+                    db, lambda: text_index(args.pButtons_file_name, args.configfile)
+                ),
+            ),
+        ],
+    )
 
     # Put the tabs in the current document for display
     curdoc().add_root(tabs)
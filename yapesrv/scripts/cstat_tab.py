@@ -32,37 +32,57 @@ matplotlib.use("Agg")
 import matplotlib.pyplot as plt
 import matplotlib.colors as colors
 
+from yape.cstat import COUNTERS, counter_deltas
+
 from .generic_tab import generic_tab
+from .lazy_tabs import lazy_tabs
+
+
+CSTATS = ["cstatc11", "cstatc12", "cstatc13", "cstatc14"] + ["cstatD" + str(i) for i in range(1, 9)]
+DELTAS = ["counter", "before", "after", "delta", "change"]
+
+
+def delta_tab(db):
+    ''' The counters that changed most between two consecutive snapshots '''
+    rows = counter_deltas(db)
+    if len(rows) == 0:
+        return None
+    intervals = []
+    for r in rows:
+        label = "cstat -" + r[0] + " " + str(r[1]) + " to " + str(r[2])
+        if label not in intervals:
+            intervals.append(label)
+    interval = Select(title="snapshots", value=intervals[0], options=intervals)
+    src = ColumnDataSource(data={c: [] for c in DELTAS})
+    table = DataTable(
+        source=src,
+        columns=[TableColumn(field=c, title=c, width=500 if c == "counter" else 120) for c in DELTAS],
+        width=1000,
+        height=700,
+    )
+
+    def update(attr, old, new):
+        shown = [
+            r for r in rows if "cstat -" + r[0] + " " + str(r[1]) + " to " + str(r[2]) == interval.value
+        ][:200]
+        src.data = {
+            "counter": [r[3] for r in shown],
+            "before": [r[4] for r in shown],
+            "after": [r[5] for r in shown],
+            "delta": [r[6] for r in shown],
+            "change": ["" if r[7] is None else "{:+.1%}".format(r[7]) for r in shown],
+        }
+
+    interval.on_change("value", update)
+    update(None, None, None)
+    return Panel(child=column(interval, table), title="deltas")
 
 
 def cstat_tab(db):
-    cstat1 = generic_tab(db, "cstatc11")
-    cstat2 = generic_tab(db, "cstatc12")
-    cstat3 = generic_tab(db, "cstatc13")
-    cstat4 = generic_tab(db, "cstatc14")
-    cstatD1 = generic_tab(db, "cstatD1")
-    cstatD2 = generic_tab(db, "cstatD2")
-    cstatD3 = generic_tab(db, "cstatD3")
-    cstatD4 = generic_tab(db, "cstatD4")
-    cstatD5 = generic_tab(db, "cstatD5")
-    cstatD6 = generic_tab(db, "cstatD6")
-    cstatD7 = generic_tab(db, "cstatD7")
-    cstatD8 = generic_tab(db, "cstatD8")
-    ts = [
-        cstat1,
-        cstat2,
-        cstat3,
-        cstat4,
-        cstatD1,
-        cstatD2,
-        cstatD3,
-        cstatD4,
-        cstatD5,
-        cstatD6,
-        cstatD7,
-        cstatD8,
-    ]
-    tabs = Tabs(tabs=list(filter(None.__ne__, ts)))
+    tabs = lazy_tabs(
+        db,
+        [("deltas", [COUNTERS], lambda: delta_tab(db))]
+        + [(name, [name], lambda name=name: generic_tab(db, name)) for name in CSTATS],
+    )
     tab = Panel(child=tabs, title="cstats")
-    # tab = Panel(child=layout, title = mode)
     return tab
@@ -0,0 +1,113 @@
+import logging
+import os
+import sqlite3
+import threading
+from pathlib import Path
+
+from yape import parsepbuttons
+from yape.main import read_config
+from yape.version import getVersion
+from yape.catalog import read_catalog, write_catalog
+from yape.derived import apply_derived
+from yape.export import read_export
+from yape.textindex import has_index, index_capture
+from yape.timeline import build_timeline
+
+# Bokeh runs main.py again for every session, but imported modules stay loaded for the
+# life of the server process. The parsed data lives here, in shared cache in-memory
+# databases, one per pButtons file: the first session parses, every later one just opens
+# a connection of its own.
+# Besides a pButtons file the data can come from a yape --filedb database or a yape -c csv
+# directory, both carry the catalog and are opened without parsing.
+
+_lock = threading.Lock()
+# (file, config file) -> (uri, connection keeping the in-memory database alive or None)
+_datasets = {}
+SQLITE_HEADER = b"SQLite format 3\x00"
+
+
+def dataset_uri(file):
+    return "file:yapesrv-" + str(os.getpid()) + "-" + str(len(_datasets)) + "?mode=memory&cache=shared"
+
+
+def is_database(file):
+    if not Path(file).is_file():
+        return False
+    with open(file, "rb") as f:
+        return f.read(len(SQLITE_HEADER)) == SQLITE_HEADER
+
+
+def open_database(file):
+    ''' Returns the read only uri of a yape database, None if it has no catalog '''
+    uri = Path(file).resolve().as_uri() + "?mode=ro"
+    db = sqlite3.connect(uri, uri=True)
+    try:
+        catalog = read_catalog(db)
+    finally:
+        db.close()
+    if catalog is None:
+        return None
+    versions = set(entry["version"] for entry in catalog.values())
+    if versions != {getVersion()}:
+        logging.warning(str(file) + " was written by yape " + ", ".join(sorted(str(v) for v in versions)))
+    logging.info(str(file) + ": " + ", ".join(catalog))
+    return uri
+
+
+def load_dataset(file, configfile=None):
+    ''' Returns the uri of the database holding file, parsing it if no session did before '''
+    key = (str(Path(file).resolve()), str(configfile))
+    with _lock:
+        if key in _datasets:
+            return _datasets[key][0]
+        if is_database(file):
+            # written by yape, timeline and derived columns are already in there
+            uri = open_database(file)
+            if uri is not None:
+                _datasets[key] = (uri, None)
+                return uri
+            logging.warning(str(file) + " has no catalog, copying it")
+        uri = dataset_uri(file)
+        keeper = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        if Path(file).is_dir():
+            read_export(keeper, file)
+        elif is_database(file):
+            source = sqlite3.connect(str(file))
+            source.backup(keeper)
+            source.close()
+            tables = [r[0] for r in keeper.execute("SELECT name FROM sqlite_master WHERE type='table'")]
+            write_catalog(keeper, tables)
+        else:
+            logging.info("parsing " + str(file))
+            parsepbuttons(file, keeper)
+        build_timeline(keeper)
+        apply_derived(keeper, read_config(configfile))
+        keeper.commit()
+        _datasets[key] = (uri, keeper)
+        return uri
+
+
+def text_index(file, configfile=None):
+    ''' Builds the full-text index of the text sections of file the first time it's asked for,
+    returns False if there is none (a read only database indexed without --textindex) '''
+    uri = load_dataset(file, configfile)
+    key = (str(Path(file).resolve()), str(configfile))
+    with _lock:
+        keeper = _datasets[key][1]
+        if keeper is None:
+            db = sqlite3.connect(uri, uri=True)
+            try:
+                return has_index(db)
+            finally:
+                db.close()
+        if not has_index(keeper):
+            index_capture(keeper, keeper, file)
+        return True
+
+
+def session_connection(file, configfile=None):
+    ''' Returns a new read only connection to the data of file, one per session '''
+    uri = load_dataset(file, configfile)
+    db = sqlite3.connect(uri, uri=True, check_same_thread=False)
+    db.execute("PRAGMA query_only = ON")
+    return db
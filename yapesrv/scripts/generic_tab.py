@@ -1,7 +1,11 @@
 # pandas and numpy for data manipulation
 import pandas as pd
 import numpy as np
+import re
 import sqlite3
+from functools import lru_cache
+
+from yape.catalog import has_section
 
 from bokeh.plotting import Figure
 from bokeh.models import (
@@ -23,6 +27,10 @@ from bokeh.models.widgets import (
     DataTable,
     Select,
     PreText,
+    Button,
+    TextInput,
+    Toggle,
+    Div,
 )
 from bokeh.layouts import column, row, WidgetBox
 
@@ -33,17 +41,121 @@ import matplotlib.pyplot as plt
 import matplotlib.colors as colors
 
 
+# Text sections are shown a page of lines at a time, read by rowid. Searching runs in
+# sqlite from the current line to the next (or previous) hit, substring or regular
+# expression, and shows the page around it.
+
+PAGE = 500
+# lines shown above a hit
+CONTEXT = 10
+
+
+@lru_cache(maxsize=32)
+def compiled(pattern):
+    return re.compile(pattern)
+
+
+def regexp(pattern, text):
+    # sqlite's REGEXP operator, "text REGEXP pattern" calls regexp(pattern, text)
+    if text is None:
+        return False
+    return compiled(pattern).search(text) is not None
+
+
+def read_page(db, mode, first, size=PAGE):
+    ''' Returns [(rowid, line)] of the lines of mode from rowid first on '''
+    cur = db.execute(
+        'SELECT rowid, line FROM "' + mode + '" WHERE rowid >= ? ORDER BY rowid LIMIT ?',
+        [first, size],
+    )
+    return cur.fetchall()
+
+
+def find_line(db, mode, text, start, regex=False, backwards=False):
+    ''' Returns the rowid of the next (previous) line after (before) start containing or matching text, None if there is none '''
+    condition = "line REGEXP ?" if regex else "instr(line, ?) > 0"
+    if backwards:
+        query = 'SELECT rowid FROM "' + mode + '" WHERE rowid < ? AND ' + condition + " ORDER BY rowid DESC LIMIT 1"
+    else:
+        query = 'SELECT rowid FROM "' + mode + '" WHERE rowid > ? AND ' + condition + " ORDER BY rowid LIMIT 1"
+    found = db.execute(query, [start, text]).fetchone()
+    return None if found is None else found[0]
+
+
 def generic_tab(db, mode):
-    cur = db.cursor()
-    cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", [mode])
-    if len(cur.fetchall()) == 0:
+    if not has_section(db, mode):
+        return None
+    db.create_function("REGEXP", 2, regexp)
+    first, last = db.execute('SELECT min(rowid), max(rowid) FROM "' + mode + '"').fetchone()
+    if first is None:
         return None
-    cur.execute('select * from "' + mode + '"')
-    text = ""
-    for r in cur:
-        l = r[0]
-        text += l
-    content = PreText(text=text)
-    layout = WidgetBox(content, sizing_mode="scale_both")
+    # top: first rowid of the page shown, hit: rowid of the current search hit
+    state = {"top": first, "hit": None}
+
+    content = PreText(text="", width=1200)
+    status = Div(text="")
+    previous_page = Button(label="< page", width=80)
+    next_page = Button(label="page >", width=80)
+    search = TextInput(placeholder="search", width=300)
+    regex = Toggle(label="regex", active=False, width=70)
+    previous_hit = Button(label="< hit", width=70)
+    next_hit = Button(label="hit >", width=70)
+
+    def show(top, message=""):
+        top = max(first, min(top, last - PAGE + 1))
+        state["top"] = top
+        rows = read_page(db, mode, top)
+        content.text = "".join(
+            ("» " if rowid == state["hit"] else "  ") + line for rowid, line in rows
+        )
+        shown = "lines " + str(top - first + 1) + " to " + str(top - first + len(rows)) + " of " + str(last - first + 1)
+        status.text = shown + (" &middot; " + message if message else "")
+
+    def find(backwards=False):
+        text = search.value
+        if text == "":
+            return
+        if regex.active:
+            try:
+                compiled(text)
+            except re.error as e:
+                show(state["top"], "invalid regular expression: " + str(e))
+                return
+        start = state["hit"] if state["hit"] is not None else state["top"] - (0 if backwards else 1)
+        try:
+            hit = find_line(db, mode, text, start, regex.active, backwards)
+            wrapped = False
+            if hit is None:
+                # wrap around
+                hit = find_line(db, mode, text, last + 1 if backwards else first - 1, regex.active, backwards)
+                wrapped = hit is not None
+        except sqlite3.OperationalError as e:
+            show(state["top"], str(e))
+            return
+        if hit is None:
+            state["hit"] = None
+            show(state["top"], "not found")
+            return
+        state["hit"] = hit
+        message = "hit on line " + str(hit - first + 1) + (" (wrapped)" if wrapped else "")
+        if not state["top"] <= hit < state["top"] + PAGE:
+            show(hit - CONTEXT, message)
+        else:
+            show(state["top"], message)
+
+    def new_search(attr, old, new):
+        state["hit"] = None
+        find()
+
+    previous_page.on_click(lambda: show(state["top"] - PAGE))
+    next_page.on_click(lambda: show(state["top"] + PAGE))
+    previous_hit.on_click(lambda: find(backwards=True))
+    next_hit.on_click(lambda: find())
+    search.on_change("value", new_search)
+    regex.on_click(lambda active: new_search("active", None, active))
+
+    show(first)
+    controls = row(previous_page, next_page, search, regex, previous_hit, next_hit, status)
+    layout = column(controls, content)
     tab = Panel(child=layout, title=mode)
     return tab
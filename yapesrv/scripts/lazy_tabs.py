@@ -0,0 +1,32 @@
+from yape.catalog import has_section
+
+from bokeh.models import Panel
+from bokeh.models.widgets import Tabs, PreText
+
+# Tabs are placeholders until they are first shown: only then is the data queried and the
+# widgets built, once per session. Whether a tab is there at all comes from the catalog,
+# which costs a query instead of reading the section.
+
+
+def lazy_tabs(db, entries):
+    ''' Returns Tabs for [(title, sections, build)], a tab for every entry with one of its sections in db.
+    build() returns a Panel or None and runs when the tab is activated the first time '''
+    entries = [e for e in entries if any(has_section(db, s) for s in e[1])]
+    panels = [Panel(child=PreText(text="loading " + title + " ..."), title=title) for title, _, _ in entries]
+    built = set()
+
+    def show(i):
+        if i in built or i >= len(entries):
+            return
+        built.add(i)
+        title, _, build = entries[i]
+        panel = build()
+        panels[i].child = PreText(text="no " + title + " data") if panel is None else panel.child
+
+    def activate(attr, old, new):
+        show(new)
+
+    tabs = Tabs(tabs=panels)
+    show(tabs.active)
+    tabs.on_change("active", activate)
+    return tabs
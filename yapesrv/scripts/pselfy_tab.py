@@ -1,53 +1,82 @@
-# pandas and numpy for data manipulation
-import pandas as pd
-import numpy as np
-import sqlite3
-
-from bokeh.plotting import Figure
-from bokeh.models import (
-    CategoricalColorMapper,
-    HoverTool,
-    ColumnDataSource,
-    Panel,
-    FuncTickFormatter,
-    SingleIntervalTicker,
-    LinearAxis,
-)
-from bokeh.models.widgets import (
-    CheckboxGroup,
-    Slider,
-    RangeSlider,
-    Tabs,
-    CheckboxButtonGroup,
-    TableColumn,
-    DataTable,
-    Select,
-    PreText,
-)
-from bokeh.layouts import column, row, WidgetBox
-
-import matplotlib
-matplotlib.use("Agg")
-
-import matplotlib.pyplot as plt
-import matplotlib.colors as colors
+from yape.catalog import has_section
+from yape.processes import ORDERS, PROCESSES, process_growth
+
+from bokeh.models import ColumnDataSource, Panel
+from bokeh.models.widgets import Select, Slider, TableColumn, DataTable, Div
+from bokeh.layouts import column, row
 
 from .generic_tab import generic_tab
+from .lazy_tabs import lazy_tabs
 
+# ps -elfy snapshots and tasklist from the processes table: the top processes of a
+# snapshot by rss, cpu or cpu time, and the ones that grew most between snapshots.
+# The ps text itself is in the pselfy1-4 sub-tabs.
 
-def pselfy_tab(db):
+PSELFY = ["pselfy" + str(i) for i in range(1, 5)]
 
-    cur = db.cursor()
-    cur.execute(
-        "SELECT name FROM sqlite_master WHERE type='table' AND name=?", ["psefly"]
-    )
-    if len(cur.fetchall()) == 0:
+SHOWN = ["pid", "ppid", "user", "state", "cpu", "rss_kb", "sz", "cputime_s", "stime", "name", "command"]
+GROWTH = ["source", "pid", "name", "first", "last", "rss_kb_first", "rss_kb_last", "growth_kb", "cpu_seconds", "command"]
+
+
+def processes_tab(db):
+    if not has_section(db, PROCESSES):
         return None
-    pselfy_1_tab = generic_tab(db, "pselfy1")
-    pselfy_2_tab = generic_tab(db, "pselfy2")
-    pselfy_3_tab = generic_tab(db, "pselfy3")
-    pselfy_4_tab = generic_tab(db, "pselfy4")
-    tabs = Tabs(tabs=[pselfy_1_tab, pselfy_2_tab, pselfy_3_tab, pselfy_4_tab])
-    tab = Panel(child=tabs, title="ps -elfy")
-    # tab = Panel(child=layout, title = mode)
-    return tab
+    snapshots = [
+        source + " " + str(snapshot)
+        for source, snapshot in db.execute(
+            'SELECT DISTINCT source, snapshot FROM "' + PROCESSES + '" ORDER BY source, snapshot'
+        ).fetchall()
+    ]
+    snapshot = Select(title="snapshot", value=snapshots[0], options=snapshots)
+    order = Select(title="top by", value="rss", options=list(ORDERS))
+    top = Slider(title="processes", start=10, end=500, step=10, value=50)
+
+    src = ColumnDataSource(data={c: [] for c in SHOWN})
+    table = DataTable(
+        source=src,
+        columns=[TableColumn(field=c, title=c, width=600 if c == "command" else 80) for c in SHOWN],
+        width=1400,
+        height=500,
+    )
+    rows = process_growth(db, 50)
+    growth = DataTable(
+        source=ColumnDataSource(data={c: [r[i] for r in rows] for i, c in enumerate(GROWTH)}),
+        columns=[TableColumn(field=c, title=c, width=600 if c == "command" else 80) for c in GROWTH],
+        width=1400,
+        height=300,
+    )
+
+    def update(attr, old, new):
+        source, number = snapshot.value.rsplit(" ", 1)
+        cur = db.execute(
+            "SELECT "
+            + ", ".join('"' + c + '"' for c in SHOWN)
+            + ' FROM "'
+            + PROCESSES
+            + '" WHERE source = ? AND snapshot = ? ORDER BY '
+            + ORDERS[order.value]
+            + " DESC LIMIT ?",
+            [source, int(number), top.value],
+        )
+        result = cur.fetchall()
+        src.data = {c: [r[i] for r in result] for i, c in enumerate(SHOWN)}
+
+    for widget in [snapshot, order, top]:
+        widget.on_change("value", update)
+    update(None, None, None)
+    layout = column(
+        row(snapshot, order, top),
+        table,
+        Div(text="<b>grew most between snapshots</b>"),
+        growth,
+    )
+    return Panel(child=layout, title="processes")
+
+
+def pselfy_tab(db):
+    tabs = lazy_tabs(
+        db,
+        [("processes", [PROCESSES], lambda: processes_tab(db))]
+        + [(name, [name], lambda name=name: generic_tab(db, name)) for name in PSELFY],
+    )
+    return Panel(child=tabs, title="ps -elfy")
@@ -0,0 +1,49 @@
+import sqlite3
+
+from yape.textindex import DEFAULT_LIMIT, search
+
+from bokeh.models import ColumnDataSource, Panel
+from bokeh.models.widgets import TextInput, DataTable, TableColumn, Div
+from bokeh.layouts import column
+
+# Full-text search over the text sections, through the index built by yape --textindex,
+# or by the server when the tab is first opened (see datastore.text_index).
+
+
+def search_tab(db, prepare=None):
+    ''' prepare() builds the index if needed, returns False if there can't be one '''
+    if prepare is not None and not prepare():
+        return None
+    src = ColumnDataSource(data={"file": [], "section": [], "line": [], "text": []})
+    box = TextInput(placeholder="search text sections, eg. kernel.shmmax", width=600)
+    status = Div(text="")
+    table = DataTable(
+        source=src,
+        columns=[
+            TableColumn(field="section", title="section", width=100),
+            TableColumn(field="line", title="line", width=60),
+            TableColumn(field="text", title="text", width=800),
+            TableColumn(field="file", title="file", width=300),
+        ],
+        width=1260,
+        height=700,
+    )
+
+    def find(attr, old, new):
+        try:
+            hits = search(db, new, DEFAULT_LIMIT * 4)
+        except sqlite3.OperationalError as e:
+            hits = []
+            status.text = str(e)
+        else:
+            status.text = str(len(hits)) + " hits"
+        src.data = {
+            "file": [h[0] for h in hits],
+            "section": [h[1] for h in hits],
+            "line": [h[2] for h in hits],
+            "text": [h[3].rstrip("\n") for h in hits],
+        }
+
+    box.on_change("value", find)
+    layout = column(box, status, table)
+    return Panel(child=layout, title="search")
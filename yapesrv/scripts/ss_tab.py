@@ -33,16 +33,13 @@ import matplotlib.pyplot as plt
 import matplotlib.colors as colors
 
 from .generic_tab import generic_tab
+from .lazy_tabs import lazy_tabs
 
 
 def ss_tab(db):
-
-    ss_1_tab = generic_tab(db, "ss1")
-    ss_2_tab = generic_tab(db, "ss2")
-    ss_3_tab = generic_tab(db, "ss3")
-    ss_4_tab = generic_tab(db, "ss4")
-    ts = [ss_1_tab, ss_2_tab, ss_3_tab, ss_4_tab]
-    tabs = Tabs(tabs=list(filter(None.__ne__, ts)))
+    tabs = lazy_tabs(
+        db,
+        [("ss" + str(i), ["ss" + str(i)], lambda i=i: generic_tab(db, "ss" + str(i))) for i in range(1, 5)],
+    )
     tab = Panel(child=tabs, title="%SS")
-    # tab = Panel(child=layout, title = mode)
     return tab
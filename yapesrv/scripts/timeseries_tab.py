@@ -0,0 +1,137 @@
+# pandas for data manipulation
+import pandas as pd
+
+from yape.catalog import TIMESERIES, has_section
+from yape.downsample import minmax, visible_rows
+from yape.sections import load_section, numeric, split_column
+
+from bokeh.plotting import Figure
+from bokeh.models import ColumnDataSource, Panel, Legend, LegendItem, Range1d
+from bokeh.models.widgets import CheckboxGroup
+from bokeh.layouts import row, WidgetBox
+
+import matplotlib
+matplotlib.use("Agg")
+
+import matplotlib.pyplot as plt
+import matplotlib.colors as colors
+
+# One figure and one ColumnDataSource per tab. A column is sent to the browser the first
+# time it is checked, its line is drawn from the source and only hidden or shown after that,
+# so a checkbox costs a visible flag over the websocket instead of a new document.
+# The source never holds more than two points per pixel of the plot width: the rows in
+# view are min/max downsampled, panning or zooming sends the visible window again.
+
+
+def section_values(db, section):
+    ''' Returns the numeric columns of a section, per device ones as "<device> <column>" '''
+    data = load_section(db, section)
+    if data is None:
+        return None
+    split_on = TIMESERIES.get(section)
+    if split_on is None:
+        values = numeric(data)
+    else:
+        split_on = split_column(data, split_on)
+        values = numeric(data, skip=(split_on,))
+        columns = list(values.columns)
+        devices = data[split_on].astype(str).unique()
+        values[split_on] = data[split_on].astype(str)
+        values = values.reset_index().pivot_table(index="datetime", columns=split_on, aggfunc="mean")
+        # pivot_table sorts, keep the devices and columns in the order of the section
+        values = values[
+            [(c, d) for d in devices for c in columns if (c, d) in values.columns]
+        ]
+        values.columns = [device + " " + column for column, device in values.columns]
+    return values[~values.index.duplicated(keep="first")].sort_index()
+
+
+def timeseries_tab(db, section, active=(0, 5), legend="right", controls_width=None):
+    ''' Returns a Panel plotting the columns of section checked in a CheckboxGroup, None if there is no data '''
+    if not has_section(db, section):
+        return None
+    values = section_values(db, section)
+    if values is None or values.shape[1] == 0:
+        return None
+
+    cm = plt.get_cmap("gist_rainbow")
+    numlines = len(values.columns)
+    mypal = [colors.rgb2hex(cm(1.0 * i / numlines)) for i in range(numlines)]
+
+    # milliseconds since the epoch, what bokeh uses on datetime axes
+    x = values.index.values.astype("datetime64[ms]").astype("int64").astype("float64")
+    matrix = values.to_numpy(dtype="float64")
+    position = {c: i for i, c in enumerate(values.columns)}
+    width = 1024
+
+    src = ColumnDataSource(data={"datetime": []})
+    plot = Figure(
+        plot_width=width,
+        plot_height=768,
+        x_axis_type="datetime",
+        x_range=Range1d(start=x[0], end=x[-1]),
+        title=section,
+        output_backend="webgl",
+    )
+    key = Legend(items=[], location=(0, 0) if legend == "below" else (0, -30))
+    key.click_policy = "hide"
+    plot.add_layout(key, legend)
+    lines = {}
+    items = {}
+    # the rows currently in view, so a newly checked column is downsampled like the others
+    view = {"rows": None}
+
+    def sample(columns):
+        rows = view["rows"]
+        xs, ys = minmax(x[rows], matrix[rows, [position[c] for c in columns]], width)
+        return xs, {c: ys[:, i] for i, c in enumerate(columns)}
+
+    def refresh():
+        rows = visible_rows(x, plot.x_range.start, plot.x_range.end)
+        if rows == view["rows"]:
+            return
+        view["rows"] = rows
+        xs, ys = sample(list(lines))
+        ys["datetime"] = xs
+        src.data = ys
+
+    def show(columns):
+        for column in columns:
+            if column not in lines:
+                if view["rows"] is None:
+                    refresh()
+                src.data[column] = sample([column])[1][column]
+                lines[column] = plot.line(
+                    "datetime",
+                    column,
+                    source=src,
+                    line_width=1,
+                    alpha=0.8,
+                    color=mypal[position[column]],
+                )
+                items[column] = LegendItem(label=column, renderers=[lines[column]])
+        for column, line in lines.items():
+            line.visible = column in columns
+        key.items = [items[c] for c in values.columns if c in columns]
+
+    def update(attr, old, new):
+        show([selection.labels[i] for i in selection.active])
+
+    def zoom(attr, old, new):
+        refresh()
+
+    selection = CheckboxGroup(
+        labels=list(values.columns), active=[i for i in active if i < numlines]
+    )
+    if controls_width is not None:
+        selection.width = controls_width
+    show([selection.labels[i] for i in selection.active])
+    selection.on_change("active", update)
+    plot.x_range.on_change("start", zoom)
+    plot.x_range.on_change("end", zoom)
+    if controls_width is not None:
+        controls = WidgetBox(selection, width=controls_width, height=800, sizing_mode="fixed")
+    else:
+        controls = WidgetBox(selection)
+    layout = row(controls, plot)
+    return Panel(child=layout, title=section)